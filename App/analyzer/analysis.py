@@ -1,81 +1,106 @@
+from datetime import timedelta
 from typing import List
+from sqlalchemy.orm import object_session
 from app.models.match import Match
-from app.models.odds import OddsSnapshot
-from app.models.suspicion_alert import SuspicionAlert
+from app.models.odds import OddsSnapshot, snapshots_for_match
+from app.models.alerts import SuspicionAlert
+from app.analyzer.incremental import DetectorEngine, source_for
+from app.db.timeseries import hot_store
 
 DRAW_DROP_THRESHOLD = 0.20  # 20% drop
 GOAL_LINE_SHIFT_THRESHOLD = 1.0  # 1.0 goal change
+DRAW_DROP_WINDOW = timedelta(minutes=30)
 
+# Running detector state shared across monitoring cycles
+engine = DetectorEngine(
+    draw_threshold=DRAW_DROP_THRESHOLD,
+    line_threshold=GOAL_LINE_SHIFT_THRESHOLD,
+    window=DRAW_DROP_WINDOW,
+)
 
-def detect_suspicious_draw(match: Match, source_filter=None) -> bool:
-    draw_odds = [
-        snap.draw for snap in match.odds_snapshots 
-        if snap.market == "1X2" and snap.draw is not None and 
-           (source_filter is None or snap.bookmaker == source_filter)
-    ]
-    if len(draw_odds) < 2:
-        return False
+SOURCE_FILTERS = {
+    "OddsAPI": "odds_api",
+    "Betfair": "betfair",
+    "Pinnacle": "pinnacle",
+}
+
+
+def _ingest_new_snapshots(match: Match, refresh=True):
+    """
+    Feed the engine only the snapshots newer than what it has folded in of
+    each (bookmaker, market), from the hot store when it covers them and
+    otherwise through the indexed query helper. `refresh=False` skips pulling
+    rows other processes stored into the hot store, for callers that just did so.
+    """
+    latest = engine.latest(match.match_id)
+    db = object_session(match)
+    snapshots = hot_store.unseen(match.match_id, latest, db=db if refresh else None)
+    if snapshots is None:
+        if db is None:
+            engine.ingest(match.match_id, match.odds_snapshots)
+            return
+        if match.match_id not in hot_store:
+            hot_store.load(db, match.match_id)
+            snapshots = hot_store.unseen(match.match_id, latest)
+        if snapshots is None:
+            # From the oldest mark on; the engine skips what each series has folded in already
+            snapshots = snapshots_for_match(db, match.match_id, since=min(latest.values()) if latest else None)
+    engine.ingest(match.match_id, snapshots)
+
+
+def _bookmaker_filter(source_filter):
+    if source_filter is None:
+        return lambda bookmaker: True
+    wanted = SOURCE_FILTERS.get(source_filter, source_filter)
+    return lambda bookmaker: source_for(bookmaker) == wanted
 
-    opening = draw_odds[0]
-    latest = draw_odds[-1]
 
-    if opening == 0 or latest >= opening:
+def detect_suspicious_draw(match: Match, source_filter=None) -> bool:
+    _ingest_new_snapshots(match)
+    state = engine.states.get(match.match_id)
+    if state is None:
         return False
 
-    drop_ratio = (opening - latest) / opening
-    return drop_ratio >= DRAW_DROP_THRESHOLD
+    keep = _bookmaker_filter(source_filter)
+    return any(
+        window.max_drop >= DRAW_DROP_THRESHOLD
+        for bookmaker, window in state.draws.items() if keep(bookmaker)
+    )
 
 
 def detect_goal_line_shift(match: Match, source_filter=None) -> bool:
-    goal_lines = [
-        snap.total_line for snap in match.odds_snapshots 
-        if snap.market == "Over/Under" and snap.total_line is not None and 
-           (source_filter is None or snap.bookmaker == source_filter)
-    ]
-    if len(goal_lines) < 2:
+    _ingest_new_snapshots(match)
+    state = engine.states.get(match.match_id)
+    if state is None:
         return False
 
-    shift = abs(goal_lines[-1] - goal_lines[0])
-    return shift >= GOAL_LINE_SHIFT_THRESHOLD
+    keep = _bookmaker_filter(source_filter)
+    return any(
+        line.shift >= GOAL_LINE_SHIFT_THRESHOLD
+        for bookmaker, line in state.lines.items() if keep(bookmaker)
+    )
 
 
-def analyze_match(match: Match) -> SuspicionAlert | None:
+def analyze_match(match: Match, refresh=True) -> SuspicionAlert | None:
     """
     Returns a SuspicionAlert object if any suspicious behavior is found.
     Checks source attribution: odds_api, betfair, pinnacle.
+    Only snapshots newer than the last analysis of this match are processed.
     """
-    sources = []
+    _ingest_new_snapshots(match, refresh)
+    draw_flag, goal_flag, sources = engine.evaluate(match.match_id)
 
-    # General suspicion flags
-    general_draw_flag = detect_suspicious_draw(match)
-    general_goal_flag = detect_goal_line_shift(match)
-
-    if not general_draw_flag and not general_goal_flag:
+    if not draw_flag and not goal_flag:
         return None
 
-    # Source-specific checks
-    if detect_suspicious_draw(match, source_filter="OddsAPI"):
-        sources.append("odds_api")
-    if detect_suspicious_draw(match, source_filter="Betfair"):
-        sources.append("betfair")
-    if detect_suspicious_draw(match, source_filter="Pinnacle"):
-        sources.append("pinnacle")
-
-    if detect_goal_line_shift(match, source_filter="OddsAPI") and "odds_api" not in sources:
-        sources.append("odds_api")
-    if detect_goal_line_shift(match, source_filter="Betfair") and "betfair" not in sources:
-        sources.append("betfair")
-    if detect_goal_line_shift(match, source_filter="Pinnacle") and "pinnacle" not in sources:
-        sources.append("pinnacle")
-
     alert = SuspicionAlert(
         match_id=match.match_id,
         league=match.league,
         home_team=match.home_team,
         away_team=match.away_team,
         commence_time=match.commence_time,
-        suspicious_draw=general_draw_flag,
-        goal_line_shift=general_goal_flag,
+        suspicious_draw=draw_flag,
+        goal_line_shift=goal_flag,
         alert_sources=sources or ["unknown"]
     )
     return alert
@@ -85,4 +110,7 @@ def analyze_matches(matches: List[Match]) -> List[SuspicionAlert]:
     """
     Analyze all matches and return list of SuspicionAlert objects.
     """
-    return [alert for match in matches if (alert := analyze_match(match))]
+    db = object_session(matches[0]) if matches else None
+    if db is not None:
+        hot_store.refresh(db, [match.match_id for match in matches])
+    return [alert for match in matches if (alert := analyze_match(match, refresh=False))]
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import product
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import Config
+from app.db.session import get_db
+from app.db.archive import ARCHIVE_DIR, load_archive
+from app.db.timeseries import to_us
+from app.models.match import Match
+from app.models.odds import OddsSnapshot
+from app.analyzer.analysis import DRAW_DROP_WINDOW
+from app.analyzer.incremental import DetectorEngine, main_row_key
+
+NAN = float("nan")
+ONE_MINUTE_US = 60 * 1000 * 1000
+
+BacktestParams = namedtuple("BacktestParams", ["draw_threshold", "line_threshold", "window"])
+
+
+def default_params():
+    """
+    The thresholds configured in Config.ALERT_THRESHOLD.
+    """
+    return BacktestParams(
+        draw_threshold=Config.ALERT_THRESHOLD["draw_drop_percent"] / 100,
+        line_threshold=Config.ALERT_THRESHOLD["goal_line_shift"],
+        window=DRAW_DROP_WINDOW,
+    )
+
+
+def param_grid(draw_thresholds, line_thresholds, windows):
+    return [BacktestParams(*values) for values in product(draw_thresholds, line_thresholds, windows)]
+
+
+class History:
+    """
+    Snapshot history in timestamp order, held column-wise (interned match,
+    bookmaker and market codes, int64 microsecond timestamps, float prices)
+    so it is cheap to hand to every worker of a process pool.
+    """
+
+    def __init__(self):
+        self.match_ids, self.bookmakers, self.markets = [], [], []
+        self.match = array("i")
+        self.bookmaker = array("i")
+        self.market = array("i")
+        self.ts = array("q")
+        self.draw = array("d")
+        self.total_line = array("d")
+        self.kickoff = {}  # match code -> kickoff in microseconds
+
+    def __len__(self):
+        return len(self.ts)
+
+    @classmethod
+    def from_rows(cls, rows, kickoffs):
+        """
+        Build from (match_id, bookmaker, market, timestamp, draw, total_line,
+        over, under) rows and {match_id: commence_time}. As in the live
+        engine, a poll with several rows of one (bookmaker, market) keeps the
+        one main_row_key picks. Rows are sorted by timestamp, ties keep their
+        input order.
+        """
+        history = cls()
+        codes = [{}, {}, {}]
+        names = [history.match_ids, history.bookmakers, history.markets]
+
+        def code(kind, name):
+            value = codes[kind].get(name)
+            if value is None:
+                value = codes[kind][name] = len(names[kind])
+                names[kind].append(name)
+            return value
+
+        polls = {}  # (ts, match, bookmaker, market) -> (main_row_key, row)
+        for match_id, bookmaker, market, timestamp, draw, total_line, over, under in rows:
+            if timestamp is None:
+                continue
+            row = (to_us(timestamp), code(0, match_id), code(1, bookmaker), code(2, market),
+                   NAN if draw is None else draw, NAN if total_line is None else total_line)
+            rank = main_row_key(market, draw, total_line, over, under)
+            held = polls.get(row[:4])
+            if held is None or rank < held[0]:
+                polls[row[:4]] = (rank, row)
+        columns = sorted((row for _, row in polls.values()), key=lambda row: row[0])
+
+        for ts, match, bookmaker, market, draw, total_line in columns:
+            history.ts.append(ts)
+            history.match.append(match)
+            history.bookmaker.append(bookmaker)
+            history.market.append(market)
+            history.draw.append(draw)
+            history.total_line.append(total_line)
+        history.kickoff = {
+            code: to_us(kickoffs[match_id]) for code, match_id in enumerate(history.match_ids) if match_id in kickoffs
+        }
+        return history
+
+
+def _kickoffs(db: Session, match_ids):
+    match_ids = list(match_ids)
+    kickoffs = {}
+    for i in range(0, len(match_ids), 500):
+        kickoffs.update(db.execute(
+            select(Match.match_id, Match.commence_time).where(Match.match_id.in_(match_ids[i:i + 500]))
+        ).all())
+    return kickoffs
+
+
+def load_history(db: Session, since=None, until=None, league=None) -> History:
+    """
+    Stored snapshots of matches kicking off in [since, until), optionally one league.
+    """
+    query = (
+        select(OddsSnapshot.match_id, OddsSnapshot.bookmaker, OddsSnapshot.market,
+               OddsSnapshot.timestamp, OddsSnapshot.draw, OddsSnapshot.total_line,
+               OddsSnapshot.over, OddsSnapshot.under)
+        .join(Match, Match.match_id == OddsSnapshot.match_id)
+        .order_by(OddsSnapshot.timestamp)
+    )
+    if since is not None:
+        query = query.where(Match.commence_time >= since)
+    if until is not None:
+        query = query.where(Match.commence_time < until)
+    if league is not None:
+        query = query.where(Match.league == league)
+
+    rows = db.execute(query.execution_options(yield_per=10000)).all()
+    return History.from_rows(rows, _kickoffs(db, {row.match_id for row in rows}))
+
+
+def load_archived_history(db: Session, root=ARCHIVE_DIR, since=None, until=None, league=None) -> History:
+    """
+    Same as load_history, from the retention job's archive (kickoff days in [since, until]).
+    """
+    archived = load_archive(root, league=league, since=since, until=until)
+    rows = (
+        (row.match_id, row.bookmaker, row.market, row.timestamp, row.draw, row.total_line, row.over, row.under)
+        for snapshots in archived.values() for row in snapshots
+    )
+    return History.from_rows(rows, _kickoffs(db, archived))
+
+
+def replay(history: History, params: BacktestParams) -> dict:
+    """
+    Feed the history through a fresh DetectorEngine one snapshot at a time, as
+    the live analyzer would see it, and record when each match first alerts.
+    """
+    started = time.perf_counter()
+    engine = DetectorEngine(
+        draw_threshold=params.draw_threshold,
+        line_threshold=params.line_threshold,
+        window=params.window // timedelta(microseconds=1),  # timestamps are int microseconds here
+    )
+    markets = history.markets
+    first_alert = {}  # match code -> (ts, draw_flag, goal_flag)
+    draw_alerts = goal_alerts = 0
+    flagged_draw, flagged_goal = set(), set()
+
+    for match, bookmaker, market, ts, draw, total_line in zip(
+        history.match, history.bookmaker, history.market, history.ts, history.draw, history.total_line
+    ):
+        # Single-threaded replay, so the engine's lock is skipped; x != x is the NaN test
+        engine._update(match, bookmaker, markets[market], ts,
+                       None if draw != draw else draw, None if total_line != total_line else total_line)
+        if match in flagged_draw and match in flagged_goal:
+            continue
+        draw_flag, goal_flag, _ = engine._evaluate(match)
+        if draw_flag and match not in flagged_draw:
+            flagged_draw.add(match)
+            draw_alerts += 1
+        if goal_flag and match not in flagged_goal:
+            flagged_goal.add(match)
+            goal_alerts += 1
+        if (draw_flag or goal_flag) and match not in first_alert:
+            first_alert[match] = ts
+
+    leads = [
+        (history.kickoff[match] - ts) / ONE_MINUTE_US
+        for match, ts in first_alert.items() if match in history.kickoff
+    ]
+    pre_kickoff = [lead for lead in leads if lead >= 0]
+    elapsed = time.perf_counter() - started
+    return {
+        "draw_threshold": params.draw_threshold,
+        "line_threshold": params.line_threshold,
+        "window_minutes": params.window / timedelta(minutes=1),
+        "matches": len(history.match_ids),
+        "alerts": len(first_alert),
+        "draw_alerts": draw_alerts,
+        "goal_line_alerts": goal_alerts,
+        "in_play_alerts": len(leads) - len(pre_kickoff),
+        "lead_minutes_median": statistics.median(pre_kickoff) if pre_kickoff else None,
+        "lead_minutes_mean": statistics.fmean(pre_kickoff) if pre_kickoff else None,
+        "snapshots": len(history),
+        "seconds": elapsed,
+        "snapshots_per_sec": len(history) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+_worker_history = None
+
+
+def _init_worker(history):
+    global _worker_history
+    _worker_history = history
+
+
+def _replay_in_worker(params):
+    return replay(_worker_history, params)
+
+
+def run_sweep(history: History, grid, workers=None) -> list:
+    """
+    Replay the history once per parameter set, in parallel across a process
+    pool. The history is sent to each worker once, not once per run.
+    """
+    grid = list(grid)
+    workers = min(workers or os.cpu_count() or 1, len(grid))
+    started = time.perf_counter()
+    if workers <= 1:
+        results = [replay(history, params) for params in grid]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(history,)) as pool:
+            results = list(pool.map(_replay_in_worker, grid))
+
+    elapsed = time.perf_counter() - started
+    total = len(history) * len(grid)
+    print(f"[✔] {len(grid)} replays of {len(history)} snapshots in {elapsed:.1f}s on {workers} workers "
+          f"({total / elapsed if elapsed > 0 else 0:.0f} snapshots/sec overall)")
+    return results
+
+
+def _floats(value):
+    return [float(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    defaults = default_params()
+    parser = argparse.ArgumentParser(description="Replay stored odds through the detectors over a grid of thresholds")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="first kickoff (ISO)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="kickoffs before this (ISO)")
+    parser.add_argument("--league")
+    parser.add_argument("--archive", nargs="?", const=ARCHIVE_DIR, help="read the retention archive instead of the DB")
+    parser.add_argument("--draw", type=_floats, default=[defaults.draw_threshold], help="e.g. 0.15,0.2,0.25")
+    parser.add_argument("--line", type=_floats, default=[defaults.line_threshold], help="e.g. 0.5,1.0")
+    parser.add_argument("--window", type=_floats, default=[defaults.window / timedelta(minutes=1)],
+                        help="draw drop windows in minutes, e.g. 15,30,60")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    db: Session = next(get_db())
+    try:
+        if args.archive:
+            history = load_archived_history(db, args.archive, args.since, args.until, args.league)
+        else:
+            history = load_history(db, args.since, args.until, args.league)
+    finally:
+        db.close()
+    print(f"[+] Loaded {len(history)} snapshots of {len(history.match_ids)} matches")
+
+    grid = param_grid(args.draw, args.line, [timedelta(minutes=m) for m in args.window])
+    results = run_sweep(history, grid, workers=args.workers)
+    for r in results:
+        lead = f"{r['lead_minutes_median']:.0f} min" if r["lead_minutes_median"] is not None else "-"
+        print(f"draw>={r['draw_threshold']:.2f} line>={r['line_threshold']:.1f} window={r['window_minutes']:.0f}m: "
+              f"{r['alerts']} alerts ({r['draw_alerts']} draw, {r['goal_line_alerts']} goal line, "
+              f"{r['in_play_alerts']} in play), median lead {lead}, {r['snapshots_per_sec']:.0f} snapshots/sec")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,241 @@
+import threading
+from collections import deque
+from datetime import timedelta
+
+INF = float("inf")
+
+# Bookmaker name on a snapshot -> alert source. Everything that is not an exchange
+# or Pinnacle line arrives through OddsAPI's bookmaker list.
+BOOKMAKER_SOURCES = {
+    "Betfair": "betfair",
+    "Pinnacle": "pinnacle",
+}
+SOURCE_ORDER = ["odds_api", "betfair", "pinnacle"]
+# OddsAPI also lists the bookmakers polled directly. Their OddsAPI lines are stored
+# under this prefix so that the two feeds never share a (match, bookmaker, market) series.
+ODDSAPI_PREFIX = "OddsAPI "
+
+
+def source_for(bookmaker: str) -> str:
+    return BOOKMAKER_SOURCES.get(bookmaker, "odds_api")
+
+
+def _missing(value):
+    return value is None or value != value  # None, or NaN
+
+
+def main_row_key(market, draw=None, total_line=None, over=None, under=None):
+    """
+    Sort key choosing the row the detectors follow when one poll of a
+    (bookmaker, market) carries several, as Pinnacle's alternative totals do.
+    Lowest first: rows with the analysed price, then for totals the line
+    priced closest to evens, then the lowest draw price or line.
+    """
+    totals = market == "Over/Under"
+    value = total_line if totals else draw
+    if _missing(value):
+        return 1, INF, INF
+    if not totals:
+        return 0, 0.0, value
+    return 0, INF if _missing(over) or _missing(under) else abs(over - under), value
+
+
+def _row_key(snap):
+    return main_row_key(snap.market, snap.draw, snap.total_line,
+                        getattr(snap, "over", None), getattr(snap, "under", None))
+
+
+def main_rows(snapshots):
+    """
+    One snapshot per (bookmaker, market, timestamp), the lowest main_row_key,
+    in timestamp order. Rows without a timestamp are dropped.
+    """
+    kept = {}
+    for snap in snapshots:
+        if snap.timestamp is None:
+            continue
+        key = (snap.bookmaker, snap.market, snap.timestamp)
+        held = kept.get(key)
+        if held is None or _row_key(snap) < _row_key(held):
+            kept[key] = snap
+    return sorted(kept.values(), key=lambda snap: snap.timestamp)
+
+
+def oddsapi_bookmaker(title: str) -> str:
+    """
+    Bookmaker name for an OddsAPI bookmaker title, which source_for attributes to odds_api.
+    """
+    return ODDSAPI_PREFIX + title if title in BOOKMAKER_SOURCES else title
+
+
+class DrawWindow:
+    """
+    Running draw-price state for one (match, bookmaker).
+
+    Prices are treated as a step function: each price stays in effect until the
+    next snapshot for the same bookmaker. `points` is a monotonic deque (prices
+    strictly decreasing front to back) of [timestamp, price, valid_until], so the
+    front is always the highest price in effect during the trailing window.
+    """
+
+    __slots__ = ("window", "points", "max_drop")
+
+    def __init__(self, window: timedelta):
+        self.window = window
+        self.points = deque()
+        self.max_drop = 0.0
+
+    def update(self, timestamp, price):
+        points = self.points
+        # The previous snapshot is always at the back, and it stops being current now
+        if points and points[-1][2] is None:
+            points[-1][2] = timestamp
+        while points and points[-1][1] <= price:
+            points.pop()
+        points.append([timestamp, price, None])
+
+        cutoff = timestamp - self.window
+        while points[0][2] is not None and points[0][2] < cutoff:
+            points.popleft()
+
+        high = points[0][1]
+        if high > 0 and price < high:
+            self.max_drop = max(self.max_drop, (high - price) / high)
+
+
+class LineState:
+    """
+    Opening and current total-goals line for one (match, bookmaker).
+    """
+
+    __slots__ = ("opening", "current")
+
+    def __init__(self, line):
+        self.opening = line
+        self.current = line
+
+    def update(self, line):
+        self.current = line
+
+    @property
+    def shift(self):
+        return abs(self.current - self.opening)
+
+
+class MatchState:
+    __slots__ = ("draws", "lines", "latest")
+
+    def __init__(self):
+        self.draws = {}
+        self.lines = {}
+        # (bookmaker, market) -> newest timestamp folded in, from storage or the stream.
+        # Providers are written out of timestamp order, so each series keeps its own mark.
+        self.latest = {}
+
+
+class DetectorEngine:
+    """
+    Incremental draw-drop and goal-line detectors with compact running state per
+    (match, bookmaker, market). Each snapshot is folded in once, in O(1)
+    amortized time, so re-analysing a match only costs its new snapshots.
+    """
+
+    def __init__(self, draw_threshold=0.20, line_threshold=1.0, window=timedelta(minutes=30)):
+        self.draw_threshold = draw_threshold
+        self.line_threshold = line_threshold
+        self.window = window
+        self.states = {}
+        # Monitoring jobs and API requests may analyse matches from different threads
+        self.lock = threading.RLock()
+
+    def update(self, match_id, bookmaker, market, timestamp, draw=None, total_line=None):
+        """
+        Fold in one price that did not come from stored snapshots (the exchange
+        stream). It only advances its own (bookmaker, market) series, so stored
+        snapshots of the match's other series are still ingested.
+        """
+        with self.lock:
+            return self._fold(match_id, bookmaker, market, timestamp, draw, total_line)
+
+    def _fold(self, match_id, bookmaker, market, timestamp, draw=None, total_line=None):
+        state = self.states.get(match_id)
+        if state is None:
+            state = self.states[match_id] = MatchState()
+        key = (bookmaker, market)
+        latest = state.latest.get(key)
+        if latest is not None and timestamp <= latest:
+            return False  # already folded in, e.g. a streamed price stored afterwards
+        state.latest[key] = timestamp
+        self._update(match_id, bookmaker, market, timestamp, draw, total_line)
+        return True
+
+    def _update(self, match_id, bookmaker, market, timestamp, draw=None, total_line=None):
+        state = self.states.get(match_id)
+        if state is None:
+            state = self.states[match_id] = MatchState()
+
+        if market == "1X2" and draw is not None:
+            window = state.draws.get(bookmaker)
+            if window is None:
+                window = state.draws[bookmaker] = DrawWindow(self.window)
+            window.update(timestamp, draw)
+        elif market == "Over/Under" and total_line is not None:
+            line = state.lines.get(bookmaker)
+            if line is None:
+                state.lines[bookmaker] = LineState(total_line)
+            else:
+                line.update(total_line)
+
+    def ingest(self, match_id, snapshots):
+        """
+        Fold in the snapshots of one match that are newer than the last price
+        of their own (bookmaker, market), in timestamp order. A poll carrying
+        several rows of one (bookmaker, market) is folded in as its main_rows
+        pick.
+        """
+        with self.lock:
+            return self._ingest(match_id, snapshots)
+
+    def _ingest(self, match_id, snapshots):
+        return sum(
+            self._fold(match_id, snap.bookmaker, snap.market, snap.timestamp, snap.draw, snap.total_line)
+            for snap in main_rows(snapshots)
+        )
+
+    def latest(self, match_id):
+        """
+        {(bookmaker, market): newest timestamp folded in} of a match, where reading new snapshots starts.
+        """
+        with self.lock:
+            state = self.states.get(match_id)
+            return dict(state.latest) if state else {}
+
+    def evaluate(self, match_id):
+        """
+        Returns (suspicious_draw, goal_line_shift, sources) from one pass over the
+        match's per-bookmaker state.
+        """
+        with self.lock:
+            return self._evaluate(match_id)
+
+    def _evaluate(self, match_id):
+        state = self.states.get(match_id)
+        if state is None:
+            return False, False, []
+
+        flagged = set()
+        draw_flag = goal_flag = False
+        for bookmaker, window in state.draws.items():
+            if window.max_drop >= self.draw_threshold:
+                draw_flag = True
+                flagged.add(source_for(bookmaker))
+        for bookmaker, line in state.lines.items():
+            if line.shift >= self.line_threshold:
+                goal_flag = True
+                flagged.add(source_for(bookmaker))
+
+        return draw_flag, goal_flag, [source for source in SOURCE_ORDER if source in flagged]
+
+    def forget(self, match_id):
+        with self.lock:
+            self.states.pop(match_id, None)
@@ -0,0 +1,128 @@
+import csv
+import gzip
+import os
+import re
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # archives fall back to gzipped CSV without pyarrow
+    pa = pq = None
+
+from app.db.bulk import SnapshotRow
+from app.utils.helpers import parse_iso_utc
+
+ARCHIVE_DIR = os.getenv("ODDS_ARCHIVE_DIR", "archive/odds_snapshots")
+
+FLOAT_FIELDS = ("home", "draw", "away", "total_line", "over", "under")
+TIME_FIELDS = ("timestamp", "last_seen")
+
+
+def _partition(value):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", value or "unknown")
+
+
+def archive_path(root, league, day, match_id, parquet=None):
+    """
+    <root>/league=<league>/date=<YYYY-MM-DD>/<match_id>.parquet (or .csv.gz)
+    """
+    parquet = pq is not None if parquet is None else parquet
+    extension = "parquet" if parquet else "csv.gz"
+    return os.path.join(
+        root, f"league={_partition(league)}", f"date={day.isoformat()}", f"{_partition(match_id)}.{extension}"
+    )
+
+
+def write_archive(rows, league, day, match_id, root=ARCHIVE_DIR):
+    """
+    Write one match's raw snapshots (SnapshotRows) to its partition. The file
+    is written under a temporary name and renamed, so a crash never leaves a
+    truncated archive behind. Returns the path.
+    """
+    path = archive_path(root, league, day, match_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+
+    if pq is not None:
+        columns = {field: [getattr(row, field) for row in rows] for field in SnapshotRow._fields}
+        schema = pa.schema(
+            [(field, pa.timestamp("us") if field in TIME_FIELDS else pa.float64() if field in FLOAT_FIELDS else pa.string())
+             for field in SnapshotRow._fields]
+        )
+        pq.write_table(pa.table(columns, schema=schema), tmp, compression="zstd")
+    else:
+        with gzip.open(tmp, "wt", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(SnapshotRow._fields)
+            for row in rows:
+                writer.writerow(
+                    value.isoformat() if isinstance(value, datetime) else "" if value is None else value
+                    for value in row
+                )
+    os.replace(tmp, path)
+    return path
+
+
+def read_archive(path):
+    """
+    SnapshotRows from one archive file, in stored order.
+    """
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise RuntimeError(f"pyarrow is required to read {path}")
+        return [SnapshotRow(**record) for record in pq.read_table(path).to_pylist()]
+
+    rows = []
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            for field, value in record.items():
+                if value == "":
+                    record[field] = None
+                elif field in FLOAT_FIELDS:
+                    record[field] = float(value)
+                elif field in TIME_FIELDS:
+                    record[field] = parse_iso_utc(value)
+            rows.append(SnapshotRow(**record))
+    return rows
+
+
+def archive_files(root=ARCHIVE_DIR, league=None, since=None, until=None):
+    """
+    Archive files, pruned by partition: `league` as stored on the match,
+    `since`/`until` as dates (kickoff day, inclusive).
+    """
+    if not os.path.isdir(root):
+        return []
+    since = since.date() if isinstance(since, datetime) else since
+    until = until.date() if isinstance(until, datetime) else until
+    files = []
+    for league_dir in sorted(os.listdir(root)):
+        if league is not None and league_dir != f"league={_partition(league)}":
+            continue
+        for date_dir in sorted(os.listdir(os.path.join(root, league_dir))):
+            day = datetime.strptime(date_dir.partition("=")[2], "%Y-%m-%d").date()
+            if (since is not None and day < since) or (until is not None and day > until):
+                continue
+            directory = os.path.join(root, league_dir, date_dir)
+            files += [
+                os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if name.endswith((".parquet", ".csv.gz"))
+            ]
+    return files
+
+
+def load_archive(root=ARCHIVE_DIR, league=None, since=None, until=None, match_ids=None):
+    """
+    {match_id: [SnapshotRow, ...] in timestamp order} from the archive, for
+    feeding DetectorEngine.ingest or SnapshotArrays.from_rows in backtests.
+    """
+    wanted = set(match_ids) if match_ids is not None else None
+    matches = {}
+    for path in archive_files(root, league, since, until):
+        for row in read_archive(path):
+            if wanted is None or row.match_id in wanted:
+                matches.setdefault(row.match_id, []).append(row)
+    for rows in matches.values():
+        rows.sort(key=lambda row: row.timestamp)
+    return matches
@@ -0,0 +1,227 @@
+import time
+from collections import namedtuple
+
+from sqlalchemy import insert, select, update, bindparam
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.models.match import Match, MatchAlias, RegisteredMatch, registry
+from app.models.odds import OddsSnapshot
+from app.db.timeseries import hot_store
+from app.utils import metrics
+
+# SQLite caps bound parameters per statement, keep IN lists and executemany chunks below it
+CHUNK_SIZE = 500
+
+MatchRow = namedtuple("MatchRow", ["match_id", "home_team", "away_team", "league", "commence_time", "source"])
+
+SnapshotRow = namedtuple(
+    "SnapshotRow",
+    ["id", "match_id", "timestamp", "bookmaker", "market", "home", "draw", "away", "total_line", "over", "under",
+     "last_seen"],
+    defaults=(None,) * 7,
+)
+
+
+class SnapshotBatch:
+    """
+    Matches and snapshots collected over one monitoring cycle, held as plain tuples
+    until write_batch flushes them in a single transaction.
+    """
+
+    def __init__(self):
+        self.matches = {}
+        self.snapshots = []
+        self.aliased = set()  # canonical ids whose row came from another provider's event
+
+    def add(self, match_row: MatchRow, snapshot_rows):
+        self.matches.setdefault(match_row.match_id, match_row)
+        self.snapshots.extend(snapshot_rows)
+
+    def remap(self, canonical_ids):
+        """
+        Re-key matches and snapshots from provider event ids to canonical match
+        ids. A canonical match keeps its own provider's row when the batch has it.
+        """
+        matches = {}
+        for match_id, row in self.matches.items():
+            canonical = canonical_ids.get(match_id, match_id)
+            if canonical == match_id:
+                matches[canonical] = row
+                self.aliased.discard(canonical)
+            elif canonical not in matches:
+                matches[canonical] = row._replace(match_id=canonical)
+                self.aliased.add(canonical)
+        self.matches = matches
+        self.snapshots = [
+            row if canonical_ids.get(row.match_id, row.match_id) == row.match_id
+            else row._replace(match_id=canonical_ids[row.match_id])
+            for row in self.snapshots
+        ]
+
+    def match_ids(self):
+        return list(self.matches)
+
+    def __len__(self):
+        return len(self.matches) + len(self.snapshots)
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def add_rows(db: Session, match_row: MatchRow, snapshot_rows, resolver=None) -> Match:
+    """
+    Per-row ORM path: get or create the match, then add one OddsSnapshot per row.
+    With a MatchResolver the rows are stored under the event's canonical match.
+    """
+    new_aliases = []
+    if resolver is not None:
+        mapping, new_aliases = resolver.resolve(db, [match_row])
+        canonical = mapping[match_row.match_id]
+        if canonical != match_row.match_id:
+            match_row = match_row._replace(match_id=canonical)
+            snapshot_rows = [row._replace(match_id=canonical) for row in snapshot_rows]
+
+    registry.ensure_warm(db)
+    known = registry.get(match_row.match_id)
+    if known is not None:
+        # Registered matches are stored already, attach one without a SELECT
+        match = Match(**known._asdict())
+        make_transient_to_detached(match)
+        match = db.merge(match, load=False)
+    else:
+        match = db.query(Match).filter_by(match_id=match_row.match_id).first()
+        if match:
+            registry.put(match)
+        else:
+            match = Match(**match_row._asdict())
+            db.add(match)
+            db.flush()  # ensure match_id is available
+
+    for alias in new_aliases:
+        db.add(MatchAlias(**alias))
+    for row in snapshot_rows:
+        db.add(OddsSnapshot(**row._asdict()))
+    # Not committed yet, so reload the match's series from the DB on its next read
+    hot_store.forget(match_row.match_id)
+    return match
+
+
+def write_batch(db: Session, batch: SnapshotBatch, delta=None, resolver=None) -> dict:
+    """
+    Upsert the batch's matches and bulk insert its snapshots in one transaction.
+    Matches in the registry need no lookup; the rest are found with one IN query
+    per chunk of ids instead of one lookup per event. With a DeltaTracker, snapshots whose prices did not move
+    since the previous poll only bump last_seen on the stored row. With a
+    MatchResolver, provider events are first re-keyed to their canonical match.
+    """
+    started = time.perf_counter()
+    match_table = Match.__table__
+    snapshot_table = OddsSnapshot.__table__
+    alias_table = MatchAlias.__table__
+
+    try:
+        new_aliases = []
+        if resolver is not None:
+            mapping, new_aliases = resolver.resolve(db, list(batch.matches.values()))
+            batch.remap(mapping)
+
+        registry.ensure_warm(db)
+        existing, unregistered = {}, []
+        for match_id in batch.match_ids():
+            known = registry.get(match_id)
+            if known is not None:
+                existing[match_id] = known
+            else:
+                unregistered.append(match_id)
+        for ids in _chunks(unregistered):
+            rows = db.execute(
+                select(match_table.c.match_id, match_table.c.home_team, match_table.c.away_team,
+                       match_table.c.league, match_table.c.commence_time, match_table.c.source)
+                .where(match_table.c.match_id.in_(ids))
+            )
+            existing.update({row.match_id: row for row in rows})
+
+        new_matches = [row._asdict() for match_id, row in batch.matches.items() if match_id not in existing]
+        changed_matches = [
+            {"b_match_id": match_id, "commence_time": row.commence_time, "league": row.league}
+            # Only the provider that owns a match may move its kickoff or league
+            for match_id, row in batch.matches.items()
+            if match_id in existing and match_id not in batch.aliased and (
+                existing[match_id].commence_time != row.commence_time
+                or existing[match_id].league != row.league
+            )
+        ]
+
+        for chunk in _chunks(new_matches):
+            db.execute(insert(match_table), chunk)
+        if changed_matches:
+            stmt = (
+                update(match_table)
+                .where(match_table.c.match_id == bindparam("b_match_id"))
+                .values(commence_time=bindparam("commence_time"), league=bindparam("league"))
+            )
+            for chunk in _chunks(changed_matches):
+                db.execute(stmt, chunk)
+        for chunk in _chunks(new_aliases):
+            db.execute(insert(alias_table), chunk)
+
+        if delta is not None:
+            changed_rows, heartbeats = delta.filter(db, batch.snapshots)
+        else:
+            changed_rows, heartbeats = batch.snapshots, []
+
+        snapshots = [row._replace(last_seen=row.last_seen or row.timestamp)._asdict() for row in changed_rows]
+        for chunk in _chunks(snapshots):
+            db.execute(insert(snapshot_table), chunk)
+        if heartbeats:
+            stmt = (
+                update(snapshot_table)
+                .where(snapshot_table.c.id == bindparam("b_id"))
+                .values(last_seen=bindparam("last_seen"))
+            )
+            for chunk in _chunks(heartbeats):
+                db.execute(stmt, chunk)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        if delta is not None:
+            delta.reset()  # the tracker already saw rows that were not stored
+        if resolver is not None:
+            resolver.reset()  # aliases may point at matches that were not stored
+        raise
+
+    for row in new_matches:
+        hot_store.track(row["match_id"])
+    hot_store.record(changed_rows, batch.snapshots)
+
+    for match_id, row in batch.matches.items():
+        stored = existing.get(match_id)
+        if stored is None:
+            registry.put(row)
+        elif match_id in batch.aliased:
+            registry.put(stored)  # another provider's row does not describe the canonical match
+        else:
+            registry.put(RegisteredMatch(match_id, stored.home_team, stored.away_team, row.league,
+                                         row.commence_time, stored.source))
+
+    elapsed = time.perf_counter() - started
+    rows_written = len(new_matches) + len(changed_matches) + len(snapshots)
+    stats = {
+        "matches_inserted": len(new_matches),
+        "matches_updated": len(changed_matches),
+        "snapshots_inserted": len(snapshots),
+        "snapshots_unchanged": len(heartbeats),
+        "seconds": elapsed,
+        "rows_per_sec": rows_written / elapsed if elapsed > 0 else 0.0,
+    }
+    metrics.DB_WRITE_SECONDS.observe(elapsed)
+    metrics.MATCHES_WRITTEN.inc(len(new_matches), kind="inserted")
+    metrics.MATCHES_WRITTEN.inc(len(changed_matches), kind="updated")
+    metrics.SNAPSHOTS_WRITTEN.inc(len(snapshots), kind="inserted")
+    metrics.SNAPSHOTS_WRITTEN.inc(len(heartbeats), kind="heartbeat")
+    print(f"[✔] Bulk write: {rows_written} rows in {elapsed:.3f}s ({stats['rows_per_sec']:.0f} rows/sec), "
+          f"{len(heartbeats)} unchanged snapshots heartbeated")
+    return stats
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.odds import OddsSnapshot
+
+# How far back to look for the last stored prices when the tracker starts cold
+WARM_LOOKBACK = timedelta(hours=int(os.getenv("SNAPSHOT_DELTA_LOOKBACK_HOURS", 48)))
+
+PRICE_FIELDS = ("home", "draw", "away", "total_line", "over", "under")
+
+
+def _prices(rows):
+    return tuple(tuple(getattr(row, field) for field in PRICE_FIELDS) for row in rows)
+
+
+class DeltaTracker:
+    """
+    Last-seen price vector per (match, bookmaker, market), used to store a
+    snapshot only when something moved.
+
+    All rows one poll produces for a key (e.g. several Pinnacle total lines)
+    are compared as one vector, so the stored sequence is exactly the polled
+    sequence with consecutive repeats removed and the detectors see the same
+    price path.
+    """
+
+    def __init__(self):
+        self.last = {}  # key -> (snapshot ids, price vector)
+        self.warmed = False
+
+    def warm(self, db: Session, since=None):
+        """
+        Seed from the most recent stored poll of every key so a restart does not
+        rewrite prices that are already in the table.
+        """
+        since = since or datetime.utcnow() - WARM_LOOKBACK
+        rows = db.execute(
+            select(OddsSnapshot)
+            .where(OddsSnapshot.timestamp >= since)
+            .order_by(OddsSnapshot.timestamp)
+        ).scalars()
+
+        latest = {}
+        for row in rows:
+            key = (row.match_id, row.bookmaker, row.market)
+            current = latest.get(key)
+            if current is None or current[0] != row.timestamp:
+                latest[key] = (row.timestamp, [row])
+            else:
+                current[1].append(row)
+
+        for key, (_, group) in latest.items():
+            self.last[key] = ([row.id for row in group], _prices(group))
+        self.warmed = True
+        print(f"[+] Delta tracker warmed with {len(self.last)} price vectors")
+
+    def filter(self, db: Session, rows):
+        """
+        Split a cycle's SnapshotRows into rows to insert and last_seen heartbeats
+        ({"b_id", "last_seen"}) for stored rows whose prices are unchanged.
+        """
+        if not self.warmed:
+            self.warm(db)
+
+        groups = {}
+        for row in rows:
+            groups.setdefault((row.match_id, row.bookmaker, row.market, row.timestamp), []).append(row)
+
+        changed, heartbeats = [], []
+        for (match_id, bookmaker, market, timestamp), group in groups.items():
+            key = (match_id, bookmaker, market)
+            prices = _prices(group)
+            previous = self.last.get(key)
+            if previous is not None and previous[1] == prices:
+                heartbeats.extend({"b_id": snapshot_id, "last_seen": timestamp} for snapshot_id in previous[0])
+                continue
+            changed.extend(group)
+            self.last[key] = ([row.id for row in group], prices)
+
+        return changed, heartbeats
+
+    def reset(self):
+        self.last.clear()
+        self.warmed = False
+
+    def forget(self, match_id):
+        for key in [key for key in self.last if key[0] == match_id]:
+            del self.last[key]
@@ -0,0 +1,412 @@
+import os
+import sys
+import threading
+from array import array
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from heapq import merge
+from math import isnan
+
+from sqlalchemy.orm import Session
+
+from app.models.odds import snapshots_changed_since, snapshots_for_match
+
+# Points kept per (match, bookmaker, market) before the oldest are overwritten
+HOT_SERIES_CAPACITY = int(os.getenv("HOT_SERIES_CAPACITY", 2048))
+# Matches per refresh query, below SQLite's cap on bound parameters
+CHUNK_SIZE = 500
+
+EPOCH = datetime(1970, 1, 1)
+NAN = float("nan")
+
+# The three price columns each market stores
+MARKET_FIELDS = {
+    "1X2": ("home", "draw", "away"),
+    "Over/Under": ("total_line", "over", "under"),
+}
+DEFAULT_FIELDS = MARKET_FIELDS["1X2"]
+
+
+class HotPoint(namedtuple(
+    "HotPoint",
+    ["timestamp", "last_seen", "bookmaker", "market", "home", "draw", "away", "total_line", "over", "under"],
+)):
+    """
+    Read-side stand-in for OddsSnapshot, with the same attributes and to_dict().
+    """
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            **self._asdict(),
+            "timestamp": self.timestamp.isoformat(),
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+        }
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def to_us(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_us(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+class CodeTable:
+    """
+    Interns strings (bookmaker and market names) as small ints.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class Series:
+    """
+    Ring buffer of one (match, bookmaker, market) price path: microsecond
+    timestamps and last_seen in int64 arrays, the market's three prices in
+    float64 arrays (NaN for missing). Grows up to `capacity`, then overwrites
+    the oldest point.
+    """
+
+    __slots__ = ("capacity", "start", "ts", "seen", "prices")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.start = 0
+        self.ts = array("q")
+        self.seen = array("q")
+        self.prices = (array("d"), array("d"), array("d"))
+
+    def __len__(self):
+        return len(self.ts)
+
+    def append(self, ts, seen, values):
+        """
+        Add a point; returns the timestamp of the point it overwrote, if any.
+        """
+        if len(self.ts) < self.capacity:
+            self.ts.append(ts)
+            self.seen.append(seen)
+            for column, value in zip(self.prices, values):
+                column.append(NAN if value is None else value)
+            return None
+
+        i = self.start
+        dropped = self.ts[i]
+        self.ts[i] = ts
+        self.seen[i] = seen
+        for column, value in zip(self.prices, values):
+            column[i] = NAN if value is None else value
+        self.start = (i + 1) % self.capacity
+        return dropped
+
+    def newest(self):
+        """
+        (ts, last_seen) of the most recently appended point, or None when empty.
+        """
+        n = len(self.ts)
+        if not n:
+            return None
+        i = (self.start - 1) % n
+        return self.ts[i], self.seen[i]
+
+    def newest_prices(self):
+        """
+        Price triples (NaN as None) of the points at the newest timestamp, one per row of that poll.
+        """
+        n = len(self.ts)
+        prices = []
+        if not n:
+            return prices
+        newest = (self.start - 1) % n
+        for k in range(n):
+            i = (newest - k) % n
+            if self.ts[i] != self.ts[newest]:
+                break
+            prices.append(tuple(None if isnan(column[i]) else column[i] for column in self.prices))
+        return prices
+
+    def touch(self, ts):
+        """
+        Extend last_seen of the newest poll's points to `ts`.
+        """
+        n = len(self.ts)
+        if not n:
+            return
+        newest = (self.start - 1) % n
+        latest = self.ts[newest]
+        if ts <= latest:
+            return
+        for k in range(n):
+            i = (newest - k) % n
+            if self.ts[i] != latest:
+                break
+            if self.seen[i] < ts:
+                self.seen[i] = ts
+
+    def points(self, since=None, until=None):
+        """
+        (ts, last_seen, p0, p1, p2) in insertion order, ts in [since, until).
+        """
+        n = len(self.ts)
+        for k in range(n):
+            i = (self.start + k) % n
+            ts = self.ts[i]
+            if (since is not None and ts < since) or (until is not None and ts >= until):
+                continue
+            yield ts, self.seen[i], self.prices[0][i], self.prices[1][i], self.prices[2][i]
+
+    def nbytes(self):
+        return sum(sys.getsizeof(column) for column in (self.ts, self.seen, *self.prices))
+
+
+class HotMatch:
+    __slots__ = ("series", "covered_from")
+
+    def __init__(self, covered_from=None):
+        self.series = {}  # (bookmaker code, market code) -> Series
+        # Every stored snapshot at or after this microsecond timestamp is held here; None for all of them
+        self.covered_from = covered_from
+
+
+class HotStore:
+    """
+    In-memory odds time series of the matches being analysed, with the
+    odds_snapshots table as cold storage. A match is tracked from its first
+    write (new matches) or loaded from the DB on first read; reads outside
+    what memory still covers return None so callers fall back to the DB.
+    Writes of this process arrive through record(); reads given a session
+    also pick up what other processes (scheduler, stream, shards) stored.
+    """
+
+    def __init__(self, capacity=HOT_SERIES_CAPACITY):
+        self.capacity = capacity
+        self.bookmakers = CodeTable()
+        self.markets = CodeTable()
+        self.matches = {}
+        self.lock = threading.RLock()
+
+    def __contains__(self, match_id):
+        return match_id in self.matches
+
+    def track(self, match_id):
+        """
+        Start an empty, complete series set for a match with no stored snapshots yet.
+        """
+        with self.lock:
+            self.matches.setdefault(match_id, HotMatch())
+
+    def record(self, rows, seen_rows=()):
+        """
+        Append stored SnapshotRows of tracked matches, then extend last_seen
+        for the keys `seen_rows` polled without a price change.
+        """
+        with self.lock:
+            for row in rows:
+                hot = self.matches.get(row.match_id)
+                if hot is not None:
+                    self._append(hot, row.bookmaker, row.market, row.timestamp,
+                                 row.last_seen or row.timestamp, row)
+            for row in seen_rows:
+                hot = self.matches.get(row.match_id)
+                if hot is None:
+                    continue
+                series = hot.series.get((self.bookmakers.code(row.bookmaker), self.markets.code(row.market)))
+                if series is not None:
+                    series.touch(to_us(row.timestamp))
+
+    def _append(self, hot, bookmaker, market, timestamp, last_seen, prices):
+        key = (self.bookmakers.code(bookmaker), self.markets.code(market))
+        series = hot.series.get(key)
+        if series is None:
+            series = hot.series[key] = Series(self.capacity)
+        fields = MARKET_FIELDS.get(market, DEFAULT_FIELDS)
+        dropped = series.append(to_us(timestamp), to_us(last_seen),
+                                [getattr(prices, field) for field in fields])
+        if dropped is not None:
+            # Points at the dropped timestamp may now be partial, coverage starts just after it
+            hot.covered_from = max(hot.covered_from or 0, dropped + 1)
+
+    def load(self, db: Session, match_id):
+        """
+        Load a match's stored snapshots from the DB.
+        """
+        # Held throughout so no write for this match lands between the query and tracking
+        with self.lock:
+            hot = HotMatch()
+            for snap in snapshots_for_match(db, match_id):
+                if snap.timestamp is not None:
+                    self._append(hot, snap.bookmaker, snap.market, snap.timestamp,
+                                 snap.last_seen or snap.timestamp, snap)
+            self.matches[match_id] = hot
+
+    def refresh(self, db: Session, match_ids):
+        """
+        Append the snapshots stored for held matches after their newest point
+        in memory, and extend last_seen where a poll has seen prices again
+        since. One query per chunk of matches, from the oldest of their newest
+        points; rows memory already holds are skipped.
+        """
+        with self.lock:
+            newest, empty = {}, []
+            for match_id in match_ids:
+                hot = self.matches.get(match_id)
+                if hot is None:
+                    continue
+                points = [point for point in (series.newest() for series in hot.series.values()) if point]
+                if points:
+                    newest[match_id] = (max(ts for ts, _ in points), max(seen for _, seen in points))
+                else:
+                    empty.append(match_id)
+
+            for ids in _chunks(list(newest)):
+                self._apply(snapshots_changed_since(
+                    db, ids, from_us(min(newest[i][0] for i in ids)), from_us(min(newest[i][1] for i in ids))
+                ))
+            for ids in _chunks(empty):
+                self._apply(snapshots_changed_since(db, ids, EPOCH, EPOCH))
+
+    def _apply(self, rows):
+        # A poll can store several rows of one series at the same timestamp (Pinnacle's
+        # totals lines): per series, the rows of its newest poll memory holds and no
+        # stored row has been matched to yet
+        unmatched = {}
+        for snap in rows:
+            hot = self.matches.get(snap.match_id)
+            if hot is None or snap.timestamp is None:
+                continue
+            key = (self.bookmakers.code(snap.bookmaker), self.markets.code(snap.market))
+            series = hot.series.get(key)
+            held = series.newest() if series is not None else None
+            ts = to_us(snap.timestamp)
+            if held is not None and ts < held[0]:
+                continue
+            if held is not None and ts == held[0]:
+                prices = tuple(getattr(snap, field) for field in MARKET_FIELDS.get(snap.market, DEFAULT_FIELDS))
+                pending = unmatched.get((snap.match_id, key))
+                if pending is None or pending[0] != ts:
+                    pending = unmatched[(snap.match_id, key)] = (ts, Counter(series.newest_prices()))
+                if pending[1][prices] > 0:
+                    pending[1][prices] -= 1
+                    if snap.last_seen is not None:
+                        series.touch(to_us(snap.last_seen))
+                    continue
+            self._append(hot, snap.bookmaker, snap.market, snap.timestamp, snap.last_seen or snap.timestamp, snap)
+            if held is None or ts > held[0]:
+                # A new poll: memory holds only this row of it, which matched itself
+                unmatched[(snap.match_id, key)] = (ts, Counter())
+
+    def covers(self, match_id, since=None):
+        hot = self.matches.get(match_id)
+        if hot is None:
+            return False
+        return hot.covered_from is None or (since is not None and to_us(since) >= hot.covered_from)
+
+    def unseen(self, match_id, latest, db: Session = None):
+        """
+        HotPoints of a match newer than latest[(bookmaker, market)] in each of
+        its series (every point of series missing from `latest`), or None when
+        memory does not cover them. `db` as in snapshots().
+        """
+        with self.lock:
+            if db is not None:
+                self.refresh(db, [match_id])
+            hot = self.matches.get(match_id)
+            if hot is None:
+                return None
+            after = {}
+            for bookmaker_code, market_code in hot.series:
+                mark = latest.get((self.bookmakers.names[bookmaker_code], self.markets.names[market_code]))
+                after[(bookmaker_code, market_code)] = to_us(mark) + 1 if mark is not None else None
+            if hot.covered_from is not None and any(
+                since is None or since < hot.covered_from for since in after.values()
+            ):
+                return None
+            return self._points(hot, after)
+
+    def snapshots(self, match_id, since=None, until=None, db: Session = None):
+        """
+        HotPoints of a match in [since, until) in timestamp order, or None
+        when memory does not cover the range. With `db`, rows stored by other
+        processes since memory's newest point are pulled in first.
+        """
+        with self.lock:
+            if db is not None:
+                self.refresh(db, [match_id])
+            if not self.covers(match_id, since):
+                return None
+            since_us = to_us(since) if since is not None else None
+            hot = self.matches[match_id]
+            return self._points(hot, dict.fromkeys(hot.series, since_us), to_us(until) if until is not None else None)
+
+    def _points(self, hot, since, until_us=None):
+        """
+        HotPoints of the series in `since` ({series key: first microsecond or
+        None}), before `until_us`, in timestamp order.
+        """
+        streams = []
+        for (bookmaker_code, market_code), since_us in since.items():
+            bookmaker = self.bookmakers.names[bookmaker_code]
+            market = self.markets.names[market_code]
+            fields = MARKET_FIELDS.get(market, DEFAULT_FIELDS)
+            streams.append([
+                (ts, seen, bookmaker, market, dict(zip(fields, values)))
+                for ts, seen, *values in hot.series[(bookmaker_code, market_code)].points(since_us, until_us)
+            ])
+
+        points = []
+        for ts, seen, bookmaker, market, values in merge(*streams, key=lambda point: point[0]):
+            prices = {field: None if isnan(value) else value for field, value in values.items()}
+            points.append(HotPoint(
+                timestamp=from_us(ts),
+                last_seen=from_us(seen),
+                bookmaker=bookmaker,
+                market=market,
+                home=prices.get("home"),
+                draw=prices.get("draw"),
+                away=prices.get("away"),
+                total_line=prices.get("total_line"),
+                over=prices.get("over"),
+                under=prices.get("under"),
+            ))
+        return points
+
+    def forget(self, match_id):
+        with self.lock:
+            self.matches.pop(match_id, None)
+
+    def memory(self, match_id):
+        """
+        {"series", "points", "bytes"} held for one match, or None if untracked.
+        """
+        with self.lock:
+            hot = self.matches.get(match_id)
+            if hot is None:
+                return None
+            return {
+                "series": len(hot.series),
+                "points": sum(len(series) for series in hot.series.values()),
+                "bytes": sum(series.nbytes() for series in hot.series.values()),
+            }
+
+    def memory_report(self):
+        with self.lock:
+            return {match_id: self.memory(match_id) for match_id in list(self.matches)}
+
+
+hot_store = HotStore()
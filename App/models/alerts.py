@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Boolean, DateTime, JSON, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Boolean, DateTime, JSON, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime
 from uuid import uuid4
 
@@ -7,6 +7,16 @@ from app.db.session import Base
 
 class SuspicionAlert(Base):
     __tablename__ = "suspicion_alerts"
+    # Keyset pagination runs on (created_at, id); each filter gets an index with that suffix
+    __table_args__ = (
+        # One alert per match, whichever monitor process (shard, /recheck job) stores it first
+        UniqueConstraint("match_id", name="uq_suspicion_alerts_match_id"),
+        Index("ix_suspicion_alerts_created_id", "created_at", "id"),
+        Index("ix_suspicion_alerts_league_created_id", "league", "created_at", "id"),
+        Index("ix_suspicion_alerts_draw_created_id", "suspicious_draw", "created_at", "id"),
+        Index("ix_suspicion_alerts_goal_created_id", "goal_line_shift", "created_at", "id"),
+        Index("ix_suspicion_alerts_commence_time", "commence_time"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid4()))
     match_id = Column(String, ForeignKey("matches.match_id"), nullable=False)
@@ -23,9 +33,17 @@ class SuspicionAlert(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     match = relationship("Match")  # Optional: to backref full match info
+    # Indexed copy of alert_sources, used to filter by source
+    source_links = relationship("SuspicionAlertSource", cascade="all, delete-orphan")
+
+    @validates("alert_sources")
+    def _sync_source_links(self, key, sources):
+        self.source_links = [SuspicionAlertSource(source=source) for source in dict.fromkeys(sources or [])]
+        return sources
 
     def to_dict(self):
         return {
+            "id": self.id,
             "match_id": self.match_id,
             "league": self.league,
             "home": self.home_team,
@@ -34,7 +52,7 @@ class SuspicionAlert(Base):
             "suspicious_draw": self.suspicious_draw,
             "goal_line_shift": self.goal_line_shift,
             "alert_sources": self.alert_sources,
-            "created_at": self.created_at.isoformat()
+            "created_at": self.created_at.isoformat() if self.created_at else None
         }
 
     def __repr__(self):
@@ -42,3 +60,13 @@ class SuspicionAlert(Base):
             f"<Alert {self.match_id} | draw_drop={self.suspicious_draw}, "
             f"goal_line_shift={self.goal_line_shift}>"
         )
+
+
+class SuspicionAlertSource(Base):
+    __tablename__ = "suspicion_alert_sources"
+    __table_args__ = (
+        Index("ix_suspicion_alert_sources_source_alert", "source", "alert_id"),
+    )
+
+    alert_id = Column(String, ForeignKey("suspicion_alerts.id", ondelete="CASCADE"), primary_key=True)
+    source = Column(String, primary_key=True)
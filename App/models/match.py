@@ -1,27 +1,223 @@
-from sqlalchemy import Column, String, DateTime
-from sqlalchemy.orm import relationship
+import os
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, String, DateTime, Float, ForeignKey, select
+from sqlalchemy.orm import relationship, Session
 from app.db.session import Base
 
+# Matches stay registered until this long after kickoff
+REGISTRY_RETENTION = timedelta(hours=int(os.getenv("MATCH_REGISTRY_RETENTION_HOURS", 6)))
+REGISTRY_MAX_SIZE = int(os.getenv("MATCH_REGISTRY_MAX_SIZE", 50000))
+
 class Match(Base):
     __tablename__ = "matches"
 
     match_id = Column(String, primary_key=True, index=True)
     home_team = Column(String, nullable=False)
     away_team = Column(String, nullable=False)
-    league = Column(String, nullable=False)
-    commence_time = Column(DateTime, nullable=False)
+    league = Column(String, nullable=False, index=True)
+    commence_time = Column(DateTime, nullable=False, index=True)
     source = Column(String, default="oddsapi")
+    archived_at = Column(DateTime)  # Set once the retention job has compacted its snapshots
 
     # Relationship to OddsSnapshot
     odds_snapshots = relationship("OddsSnapshot", back_populates="match")
 
+    def to_dict(self):
+        return {
+            "match_id": self.match_id,
+            "league": self.league,
+            "home": self.home_team,
+            "away": self.away_team,
+            "commence_time": self.commence_time.isoformat(),
+            "source": self.source
+        }
+
     def __repr__(self):
         return f"<Match {self.home_team} vs {self.away_team} | {self.league} @ {self.commence_time}>"
 
-ALL_MATCHES = []
+class MatchAlias(Base):
+    """
+    One provider's event id for a canonical match, e.g. ('betfair', 'betfair_123')
+    -> the OddsAPI match id. Written by app.services.matching.
+    """
+    __tablename__ = "match_aliases"
 
-def get_match_by_id(match_id: str):
-    for match in ALL_MATCHES:
-        if match.match_id == match_id:
+    provider_event_id = Column(String, primary_key=True)
+    provider = Column(String, primary_key=True)
+    match_id = Column(String, ForeignKey("matches.match_id"), nullable=False, index=True)
+    score = Column(Float)  # name similarity the event was matched with, 1.0 for the canonical event
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<MatchAlias {self.provider}:{self.provider_event_id} -> {self.match_id}>"
+
+RegisteredMatch = namedtuple(
+    "RegisteredMatch", ["match_id", "home_team", "away_team", "league", "commence_time", "source"]
+)
+
+
+class MatchRegistry:
+    """
+    Process-wide index of known matches: lookup by id, by league, and by
+    kickoff range (a sorted list searched with bisect). Matches are evicted
+    REGISTRY_RETENTION after kickoff, or least recently used first once the
+    registry holds REGISTRY_MAX_SIZE. Warmed from the DB on first use, after
+    which every match with a kickoff at or after `horizon` is registered
+    unless size eviction has dropped some (`complete` is then False).
+    """
+
+    def __init__(self, max_size=REGISTRY_MAX_SIZE, retention=REGISTRY_RETENTION):
+        self.max_size = max_size
+        self.retention = retention
+        self.lock = threading.RLock()
+        self.matches = OrderedDict()  # match id -> RegisteredMatch, least recently used first
+        self.leagues = {}  # league -> {match id, ...}
+        self.kickoffs = []  # sorted (commence_time, match id)
+        self.evict_listeners = []
+        self.warmed = False
+        self.complete = False
+        self.horizon = None
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __contains__(self, match_id):
+        return match_id in self.matches
+
+    def get(self, match_id):
+        with self.lock:
+            match = self.matches.get(match_id)
+            if match is not None:
+                self.matches.move_to_end(match_id)
             return match
-    return None
+
+    def put(self, match):
+        """
+        Register a match, or refresh it; `match` is anything with the Match
+        columns as attributes (a Match, a MatchRow, a result row).
+        """
+        entry = RegisteredMatch(*(getattr(match, field) for field in RegisteredMatch._fields))
+        with self.lock:
+            previous = self.matches.get(entry.match_id)
+            if previous is not None:
+                if previous == entry:
+                    self.matches.move_to_end(entry.match_id)
+                    return
+                self._unindex(previous)
+            self.matches[entry.match_id] = entry
+            self.matches.move_to_end(entry.match_id)
+            self.leagues.setdefault(entry.league, set()).add(entry.match_id)
+            insort(self.kickoffs, (entry.commence_time, entry.match_id))
+            evicted = []
+            while len(self.matches) > self.max_size:
+                _, oldest = self.matches.popitem(last=False)
+                self._unindex(oldest)
+                evicted.append(oldest.match_id)
+                self.complete = False
+        self._notify(evicted)
+
+    def remove(self, match_id):
+        with self.lock:
+            match = self.matches.pop(match_id, None)
+            if match is None:
+                return
+            self._unindex(match)
+        self._notify([match_id])
+
+    def _unindex(self, match):
+        self.matches.pop(match.match_id, None)
+        ids = self.leagues.get(match.league)
+        if ids is not None:
+            ids.discard(match.match_id)
+            if not ids:
+                del self.leagues[match.league]
+        i = bisect_left(self.kickoffs, (match.commence_time, match.match_id))
+        if i < len(self.kickoffs) and self.kickoffs[i] == (match.commence_time, match.match_id):
+            del self.kickoffs[i]
+
+    def by_league(self, league):
+        with self.lock:
+            return [self.matches[match_id] for match_id in self.leagues.get(league, ())]
+
+    def between(self, start, end):
+        """
+        Matches kicking off in [start, end], in kickoff order.
+        """
+        with self.lock:
+            lo = bisect_left(self.kickoffs, (start,))
+            hi = bisect_left(self.kickoffs, (end, chr(0x10FFFF)))
+            return [self.matches[match_id] for _, match_id in self.kickoffs[lo:hi]]
+
+    def covers(self, start):
+        """
+        True when every stored match kicking off at or after `start` is registered.
+        """
+        return self.complete and start >= self.horizon
+
+    def on_evict(self, listener):
+        self.evict_listeners.append(listener)
+
+    def _notify(self, match_ids):
+        for match_id in match_ids:
+            for listener in self.evict_listeners:
+                listener(match_id)
+
+    def evict_finished(self, now=None):
+        """
+        Drop matches that kicked off more than `retention` ago. Returns how many.
+        """
+        cutoff = (now or datetime.utcnow()) - self.retention
+        with self.lock:
+            i = bisect_left(self.kickoffs, (cutoff,))
+            finished = [match_id for _, match_id in self.kickoffs[:i]]
+            for match_id in finished:
+                self._unindex(self.matches[match_id])
+            self.horizon = max(self.horizon, cutoff) if self.horizon else cutoff
+        self._notify(finished)
+        return len(finished)
+
+    def warm(self, db: Session, now=None):
+        """
+        Load every match that has not finished yet from the DB.
+        """
+        horizon = (now or datetime.utcnow()) - self.retention
+        table = Match.__table__
+        rows = db.execute(
+            select(table.c.match_id, table.c.home_team, table.c.away_team, table.c.league,
+                   table.c.commence_time, table.c.source)
+            .where(table.c.commence_time >= horizon)
+            .order_by(table.c.commence_time)
+        ).all()
+        with self.lock:
+            self.complete = True
+            self.horizon = horizon
+            for row in rows:
+                self.put(row)
+            self.warmed = True
+        print(f"[+] Match registry warmed with {len(self.matches)} matches")
+
+    def ensure_warm(self, db: Session):
+        if not self.warmed:
+            self.warm(db)
+
+    def clear(self):
+        """
+        Forget every match (listeners stay registered); the next use warms again.
+        """
+        with self.lock:
+            self.matches.clear()
+            self.leagues.clear()
+            self.kickoffs.clear()
+            self.warmed = self.complete = False
+            self.horizon = None
+
+
+registry = MatchRegistry()
+
+
+def get_match_by_id(match_id: str):
+    return registry.get(match_id)
@@ -1,15 +1,20 @@
-from sqlalchemy import Column, String, Float, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Float, DateTime, Integer, ForeignKey, Index, or_
+from sqlalchemy.orm import relationship, Session
 from datetime import datetime
 from app.db.session import Base
 
 class OddsSnapshot(Base):
     __tablename__ = "odds_snapshots"
+    __table_args__ = (
+        Index("ix_odds_snapshots_match_market_bookmaker_ts", "match_id", "market", "bookmaker", "timestamp"),
+        Index("ix_odds_snapshots_match_ts", "match_id", "timestamp"),
+    )
 
     id = Column(String, primary_key=True)
     match_id = Column(String, ForeignKey("matches.match_id"), nullable=False)
 
     timestamp = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime)  # Last poll that still returned these prices (delta storage)
     bookmaker = Column(String, nullable=False)
     market = Column(String, nullable=False)  # "1X2", "Over/Under"
 
@@ -26,5 +31,105 @@ class OddsSnapshot(Base):
     # Relationship back to Match
     match = relationship("Match", back_populates="odds_snapshots")
 
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "last_seen": self.last_seen.isoformat() if self.last_seen else None,
+            "bookmaker": self.bookmaker,
+            "market": self.market,
+            "home": self.home,
+            "draw": self.draw,
+            "away": self.away,
+            "total_line": self.total_line,
+            "over": self.over,
+            "under": self.under
+        }
+
     def __repr__(self):
         return f"<OddsSnapshot {self.market} by {self.bookmaker} @ {self.timestamp}>"
+
+
+class OddsBar(Base):
+    """
+    Per-minute OHLC of one price field, kept for matches whose raw snapshots
+    were archived by the retention job. Over/Under bars span every line quoted
+    in the minute.
+    """
+    __tablename__ = "odds_bars"
+    __table_args__ = (
+        Index("ix_odds_bars_match_minute", "match_id", "minute"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    match_id = Column(String, ForeignKey("matches.match_id"), nullable=False)
+    bookmaker = Column(String, nullable=False)
+    market = Column(String, nullable=False)
+    field = Column(String, nullable=False)  # "draw", "total_line", ...
+    minute = Column(DateTime, nullable=False)
+
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    points = Column(Integer)
+
+    def to_dict(self):
+        return {
+            "minute": self.minute.isoformat(),
+            "bookmaker": self.bookmaker,
+            "market": self.market,
+            "field": self.field,
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "points": self.points
+        }
+
+
+def snapshots_for_match(db: Session, match_id, since=None, until=None, market=None):
+    """
+    Snapshots of one match in [since, until), ordered by timestamp.
+    """
+    query = db.query(OddsSnapshot).filter(OddsSnapshot.match_id == match_id)
+    if market is not None:
+        query = query.filter(OddsSnapshot.market == market)
+    if since is not None:
+        query = query.filter(OddsSnapshot.timestamp >= since)
+    if until is not None:
+        query = query.filter(OddsSnapshot.timestamp < until)
+    return query.order_by(OddsSnapshot.timestamp).all()
+
+
+def snapshots_changed_since(db: Session, match_ids, timestamp, last_seen):
+    """
+    Snapshots of the matches stored after `timestamp`, or seen again by a
+    poll after `last_seen`, ordered by timestamp.
+    """
+    return (
+        db.query(OddsSnapshot)
+        .filter(OddsSnapshot.match_id.in_(match_ids))
+        .filter(or_(OddsSnapshot.timestamp > timestamp, OddsSnapshot.last_seen > last_seen))
+        .order_by(OddsSnapshot.timestamp)
+        .all()
+    )
+
+
+def snapshots_for_league(db: Session, league, since=None, until=None, market=None):
+    """
+    Snapshots of every match in a league in [since, until), ordered by timestamp.
+    """
+    from app.models.match import Match
+
+    query = (
+        db.query(OddsSnapshot)
+        .join(Match, Match.match_id == OddsSnapshot.match_id)
+        .filter(Match.league == league)
+    )
+    if market is not None:
+        query = query.filter(OddsSnapshot.market == market)
+    if since is not None:
+        query = query.filter(OddsSnapshot.timestamp >= since)
+    if until is not None:
+        query = query.filter(OddsSnapshot.timestamp < until)
+    return query.order_by(OddsSnapshot.timestamp).all()
@@ -1,44 +1,211 @@
-from flask import Blueprint, jsonify, request
+import base64
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Blueprint, Response, g, jsonify, request, url_for
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.models.match import Match
-from app.models.alert import SuspicionAlert
+from app.models.odds import snapshots_for_match
+from app.db.timeseries import hot_store
+from app.models.alerts import SuspicionAlert, SuspicionAlertSource
 from app.analyzer.analysis import analyze_match
-from app.tasks.monitor import run_monitoring
+from app.tasks.jobs import monitoring_jobs
+from app.utils.cache import response_cache
+from app.utils import metrics
 
 alerts_bp = Blueprint("alerts", __name__)
 
-# Dependency-injected session for use in each route
+# Default timeline window for /match/<match_id> when no ?since= is given
+TIMELINE_WINDOW = timedelta(hours=24)
+
+ALERTS_PAGE_SIZE = 20
+ALERTS_MAX_PAGE_SIZE = 100
+ALERT_FLAGS = {
+    "suspicious_draw": SuspicionAlert.suspicious_draw,
+    "goal_line_shift": SuspicionAlert.goal_line_shift,
+}
+
+# One session per request, closed when the request ends
 def get_session():
-    db = next(get_db())
-    return db
+    if "db" not in g:
+        g.db = next(get_db())
+    return g.db
+
+
+@alerts_bp.teardown_app_request
+def close_session(exc):
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
+
+
+def _not_modified(entry):
+    if request.if_none_match:
+        return request.if_none_match.contains(entry.etag)
+    return request.if_modified_since is not None and request.if_modified_since >= entry.last_modified
+
+
+def _cached_response(entry):
+    if _not_modified(entry):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def cached(view):
+    """
+    Serve GET responses from the response cache with ETag/Last-Modified, answering
+    304 to matching conditional requests without touching the database.
+    Only 200 responses are cached.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.full_path
+        entry = response_cache.get(key)
+        if entry is None:
+            response = view(*args, **kwargs)
+            if isinstance(response, tuple) or response.status_code != 200:
+                return response
+            entry = response_cache.put(key, response.get_data(), response.mimetype)
+        return _cached_response(entry)
+
+    return wrapper
+
+def encode_cursor(alert):
+    raw = json.dumps([alert.created_at.isoformat(), alert.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    created_at, alert_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), alert_id
+
 
 @alerts_bp.route('/suspicious', methods=['GET'])
+@cached
 def suspicious_alerts():
+    """
+    Newest alerts first, paged by an opaque (created_at, id) cursor.
+    Filters: league, flag (suspicious_draw | goal_line_shift), source,
+    commence_from / commence_to (ISO-8601). Pass next_cursor back as ?cursor=.
+    """
+    args = request.args
+    try:
+        limit = min(int(args.get("limit", ALERTS_PAGE_SIZE)), ALERTS_MAX_PAGE_SIZE)
+        cursor = decode_cursor(args["cursor"]) if args.get("cursor") else None
+        commence_from = datetime.fromisoformat(args["commence_from"]) if args.get("commence_from") else None
+        commence_to = datetime.fromisoformat(args["commence_to"]) if args.get("commence_to") else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid limit, cursor or commence_from/commence_to"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    flag = args.get("flag")
+    if flag is not None and flag not in ALERT_FLAGS:
+        return jsonify({"error": f"flag must be one of {', '.join(ALERT_FLAGS)}"}), 400
+
     db: Session = get_session()
-    alerts = db.query(SuspicionAlert).order_by(SuspicionAlert.created_at.desc()).limit(20).all()
+    query = db.query(SuspicionAlert)
+    if args.get("league"):
+        query = query.filter(SuspicionAlert.league == args["league"])
+    if flag is not None:
+        query = query.filter(ALERT_FLAGS[flag].is_(True))
+    if args.get("source"):
+        query = query.filter(
+            SuspicionAlert.source_links.any(SuspicionAlertSource.source == args["source"])
+        )
+    if commence_from is not None:
+        query = query.filter(SuspicionAlert.commence_time >= commence_from)
+    if commence_to is not None:
+        query = query.filter(SuspicionAlert.commence_time < commence_to)
+    if cursor is not None:
+        created_at, alert_id = cursor
+        query = query.filter(or_(
+            SuspicionAlert.created_at < created_at,
+            and_(SuspicionAlert.created_at == created_at, SuspicionAlert.id < alert_id),
+        ))
+
+    alerts = (
+        query.order_by(SuspicionAlert.created_at.desc(), SuspicionAlert.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(alerts) > limit
+    alerts = alerts[:limit]
     return jsonify({
         "count": len(alerts),
-        "alerts": [alert.to_dict() for alert in alerts]
+        "alerts": [alert.to_dict() for alert in alerts],
+        "next_cursor": encode_cursor(alerts[-1]) if has_more else None
     })
 
 
 @alerts_bp.route('/match/<match_id>', methods=['GET'])
+@cached
 def match_detail(match_id):
     db: Session = get_session()
     match = db.query(Match).filter(Match.match_id == match_id).first()
     if not match:
         return jsonify({"error": "Match not found"}), 404
 
-    # Ensure match.odds_snapshots is loaded if needed
+    try:
+        until = datetime.fromisoformat(request.args["until"]) if "until" in request.args else None
+        # The default start moves by whole minutes, so the body and its ETag only
+        # change with the data in between
+        since = (
+            datetime.fromisoformat(request.args["since"]) if "since" in request.args
+            else (until or datetime.utcnow().replace(second=0, microsecond=0)) - TIMELINE_WINDOW
+        )
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO-8601 timestamps"}), 400
+
+    # Analysing first loads the match into the hot store, which then serves the timeline
     analysis = analyze_match(match)
-    return jsonify(analysis)
+    snapshots = hot_store.snapshots(match_id, since=since, until=until, db=db)
+    timeline_source = "memory"
+    if snapshots is None:
+        snapshots = snapshots_for_match(db, match_id, since=since, until=until)
+        timeline_source = "db"
+    return jsonify({
+        "match": match.to_dict(),
+        "analysis": analysis.to_dict() if analysis else None,
+        "since": since.isoformat(),
+        "until": until.isoformat() if until else None,
+        "timeline_source": timeline_source,
+        "memory": hot_store.memory(match_id),
+        "snapshots": [snap.to_dict() for snap in snapshots]
+    })
 
 
 @alerts_bp.route('/recheck', methods=['POST'])
 def manual_recheck():
-    run_monitoring()
-    return jsonify({"message": "Re-analysis complete"})
+    # ?profile=1 runs the cycle under the sampling profiler
+    job, created = monitoring_jobs.submit(profile=request.args.get("profile") in ("1", "true"))
+    response = jsonify({
+        "message": "Re-analysis started" if created else "Re-analysis already in progress",
+        "coalesced": not created,
+        **job.to_dict()
+    })
+    response.status_code = 202
+    response.headers["Location"] = url_for("alerts.recheck_status", job_id=job.id)
+    return response
+
+
+@alerts_bp.route('/recheck/<job_id>', methods=['GET'])
+def recheck_status(job_id):
+    job = monitoring_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@alerts_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @alerts_bp.route('/health', methods=['GET'])
@@ -1,12 +1,17 @@
-import requests
 import os
+import threading
+import time
+import requests
 from datetime import datetime
 from uuid import uuid4
 
 from sqlalchemy.orm import Session
 from app.db.session import get_db
-from app.models.match import Match
-from app.models.odds import OddsSnapshot
+from app.db.bulk import MatchRow, SnapshotRow, SnapshotBatch, add_rows
+from app.services import http_client
+from app.services.matching import resolver
+from app.utils.helpers import parse_iso_utc
+from app.utils.jsonstream import iter_items
 
 BETFAIR_APP_KEY = os.getenv("BETFAIR_APP_KEY")
 BETFAIR_SESSION_TOKEN = os.getenv("BETFAIR_SESSION_TOKEN")
@@ -19,6 +24,29 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
+PRICE_DATA = ["EX_BEST_OFFERS", "EX_TRADED"]
+
+# Betfair market data request limits: each market costs the weight of its price
+# projection and one listMarketBook call may weigh at most MAX_REQUEST_WEIGHT
+MAX_REQUEST_WEIGHT = 200
+PRICE_DATA_WEIGHTS = {
+    "SP_AVAILABLE": 3,
+    "SP_TRADED": 7,
+    "EX_BEST_OFFERS": 5,
+    "EX_ALL_OFFERS": 17,
+    "EX_TRADED": 17,
+}
+COMBINED_PRICE_DATA_WEIGHTS = {
+    frozenset({"EX_BEST_OFFERS", "EX_TRADED"}): 20,
+    frozenset({"EX_ALL_OFFERS", "EX_TRADED"}): 32,
+}
+EMPTY_PROJECTION_WEIGHT = 2
+
+# Runner names and event metadata rarely change, so the catalogue is reused across polls
+CATALOGUE_TTL = float(os.getenv("BETFAIR_CATALOGUE_TTL", 1800))
+_catalogue_cache = {}
+_catalogue_lock = threading.Lock()
+
 def list_market_catalogue(competition_ids=[], market_type="MATCH_ODDS", event_type_id="1", max_results=100):
     payload = {
         "filter": {
@@ -26,80 +54,165 @@ def list_market_catalogue(competition_ids=[], market_type="MATCH_ODDS", event_ty
             "competitionIds": competition_ids,
             "marketTypeCodes": [market_type],
         },
-        "marketProjection": ["RUNNER_METADATA", "MARKET_START_TIME", "EVENT"],
+        "marketProjection": ["RUNNER_DESCRIPTION", "RUNNER_METADATA", "MARKET_START_TIME", "EVENT", "COMPETITION"],
         "maxResults": str(max_results)
     }
 
-    res = requests.post(f"{BASE_URL}/listMarketCatalogue/", json=payload, headers=HEADERS)
+    res = http_client.request("betfair", "POST", f"{BASE_URL}/listMarketCatalogue/", json=payload, headers=HEADERS)
     res.raise_for_status()
     return res.json()
 
-def list_market_book(market_ids):
+def get_market_catalogue(competition_ids=(), market_type="MATCH_ODDS", max_age=CATALOGUE_TTL):
+    """
+    list_market_catalogue, cached for `max_age` seconds per filter.
+    """
+    key = (tuple(competition_ids), market_type)
+    with _catalogue_lock:
+        cached = _catalogue_cache.get(key)
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+
+    catalogue = list_market_catalogue(competition_ids=list(competition_ids), market_type=market_type)
+    with _catalogue_lock:
+        _catalogue_cache[key] = (time.monotonic(), catalogue)
+    return catalogue
+
+def invalidate_catalogue():
+    with _catalogue_lock:
+        _catalogue_cache.clear()
+
+def market_weight(price_data=PRICE_DATA):
+    projection = frozenset(price_data)
+    if not projection:
+        return EMPTY_PROJECTION_WEIGHT
+    if projection in COMBINED_PRICE_DATA_WEIGHTS:
+        return COMBINED_PRICE_DATA_WEIGHTS[projection]
+    return sum(PRICE_DATA_WEIGHTS[item] for item in projection)
+
+def chunk_market_ids(market_ids, price_data=PRICE_DATA):
+    per_request = max(1, MAX_REQUEST_WEIGHT // market_weight(price_data))
+    return [market_ids[i:i + per_request] for i in range(0, len(market_ids), per_request)]
+
+def _market_book_request(market_ids, price_data=PRICE_DATA, stream=False):
     payload = {
         "marketIds": market_ids,
         "priceProjection": {
-            "priceData": ["EX_BEST_OFFERS", "EX_TRADED"]
+            "priceData": price_data
         }
     }
 
-    res = requests.post(f"{BASE_URL}/listMarketBook/", json=payload, headers=HEADERS)
-    res.raise_for_status()
-    return res.json()
-
-def fetch_betfair_data():
+    res = http_client.request("betfair", "POST", f"{BASE_URL}/listMarketBook/", json=payload, headers=HEADERS,
+                              stream=stream)
+    try:
+        res.raise_for_status()
+    except requests.HTTPError:
+        res.close()
+        raise
+    return res
+
+def list_market_book(market_ids, price_data=PRICE_DATA):
+    return _market_book_request(market_ids, price_data).json()
+
+def iter_market_book(market_ids, price_data=PRICE_DATA):
+    """
+    list_market_book, yielding the books one at a time as the response streams in.
+    """
+    return iter_items(_market_book_request(market_ids, price_data, stream=True))
+
+def list_market_books(market_ids, price_data=PRICE_DATA):
+    """
+    Fetch books for any number of markets, split into requests that stay under
+    Betfair's weight limit and fetched concurrently within the provider's limits.
+    """
+    chunks = chunk_market_ids(list(market_ids), price_data)
+    books = []
+    for chunk, result, error in http_client.run_concurrently(
+        "betfair", lambda ids: list_market_book(ids, price_data), chunks
+    ):
+        if error is not None:
+            print(f"[!] Betfair market book chunk of {len(chunk)} failed: {error}")
+            continue
+        books.extend(result)
+    return books
+
+def iter_rows(price_data=PRICE_DATA, owns=None):
+    """
+    Yield the (MatchRow, [SnapshotRow]) list of each listMarketBook chunk as soon as it arrives.
+    With `owns`, only markets whose league (the event's country code) it accepts are fetched.
+    """
+    catalogue = get_market_catalogue()
+    if owns is not None:
+        catalogue = [m for m in catalogue if owns(m["event"].get("countryCode", "Unknown"))]
+    chunks = chunk_market_ids([m["marketId"] for m in catalogue], price_data)
+    for chunk, rows, error in http_client.iter_concurrently(
+        "betfair", lambda ids: list(build_rows(catalogue, iter_market_book(ids, price_data))), chunks
+    ):
+        if error is not None:
+            print(f"[!] Betfair market book chunk of {len(chunk)} failed: {error}")
+            continue
+        yield rows
+
+def fetch_betfair_data(batch: SnapshotBatch | None = None, owns=None):
     db: Session = next(get_db())
 
     try:
-        catalogue = list_market_catalogue()
-        market_ids = [m["marketId"] for m in catalogue]
-        books = list_market_book(market_ids)
-        market_lookup = {m["marketId"]: m for m in catalogue}
-
-        for book in books:
-            market_id = book["marketId"]
-            market_info = market_lookup.get(market_id)
-            if not market_info:
-                continue
-
-            event = market_info["event"]
-            start_time = datetime.fromisoformat(event["openDate"].replace("Z", "+00:00"))
-            home = event["name"].split(" v ")[0].strip()
-            away = event["name"].split(" v ")[1].strip()
-            league = event.get("countryCode", "Unknown")
-
-            match_id = f"betfair_{event['id']}"
-
-            # Store or get match
-            match = db.query(Match).filter_by(match_id=match_id).first()
-            if not match:
-                match = Match(
-                    match_id=match_id,
-                    home_team=home,
-                    away_team=away,
-                    commence_time=start_time,
-                    league=league
-                )
-                db.add(match)
-                db.flush()
-
-            runners = book["runners"]
-            prices = {r["runnerName"]: r["ex"]["availableToBack"][0]["price"] if r["ex"]["availableToBack"] else None
-                      for r in runners}
-
-            snapshot = OddsSnapshot(
-                id=str(uuid4()),
-                match_id=match.match_id,
-                timestamp=datetime.utcnow(),
-                bookmaker="Betfair",
-                market="1X2",
-                home=prices.get(home),
-                draw=prices.get("The Draw"),
-                away=prices.get(away)
-            )
-            db.add(snapshot)
+        for rows in iter_rows(owns=owns):
+            for match_row, snapshot_rows in rows:
+                if batch is not None:
+                    batch.add(match_row, snapshot_rows)
+                else:
+                    add_rows(db, match_row, snapshot_rows, resolver=resolver)
 
         db.commit()
         print(f"[✔] Betfair data integrated.")
     except Exception as e:
         db.rollback()
+        resolver.reset()
         print(f"[!] Betfair API error: {e}")
+
+def build_rows(catalogue, books):
+    """
+    Yield (MatchRow, [SnapshotRow]) per market book that has catalogue metadata.
+    """
+    market_lookup = {m["marketId"]: m for m in catalogue}
+
+    for book in books:
+        market_id = book["marketId"]
+        market_info = market_lookup.get(market_id)
+        if not market_info:
+            continue
+
+        event = market_info["event"]
+        start_time = parse_iso_utc(event["openDate"])
+        home = event["name"].split(" v ")[0].strip()
+        away = event["name"].split(" v ")[1].strip()
+        league = event.get("countryCode", "Unknown")
+
+        match_id = f"betfair_{event['id']}"
+        match_row = MatchRow(
+            match_id=match_id,
+            home_team=home,
+            away_team=away,
+            league=league,
+            commence_time=start_time,
+            source="betfair"
+        )
+
+        # Book runners only carry selection ids, names come from the catalogue
+        runner_names = {r["selectionId"]: r["runnerName"] for r in market_info.get("runners", [])}
+        runners = book["runners"]
+        prices = {runner_names.get(r["selectionId"], r.get("runnerName")):
+                  r["ex"]["availableToBack"][0]["price"] if r["ex"]["availableToBack"] else None
+                  for r in runners}
+
+        snapshot = SnapshotRow(
+            id=str(uuid4()),
+            match_id=match_id,
+            timestamp=datetime.utcnow(),
+            bookmaker="Betfair",
+            market="1X2",
+            home=prices.get(home),
+            draw=prices.get("The Draw"),
+            away=prices.get(away)
+        )
+        yield match_row, [snapshot]
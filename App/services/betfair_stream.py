@@ -0,0 +1,383 @@
+import argparse
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from sqlalchemy.orm import Session
+from app.db.session import get_db
+from app.db.bulk import MatchRow, SnapshotRow, SnapshotBatch, write_batch
+from app.analyzer.analysis import engine
+from app.services.betfair_api import BETFAIR_APP_KEY, BETFAIR_SESSION_TOKEN, get_market_catalogue
+from app.services.matching import resolver
+from app.utils.helpers import parse_iso_utc
+
+STREAM_HOST = os.getenv("BETFAIR_STREAM_HOST", "stream-api.betfair.com")
+STREAM_PORT = int(os.getenv("BETFAIR_STREAM_PORT", 443))
+# Snapshots are written in batches; an alert forces an early flush
+STREAM_FLUSH_SECONDS = float(os.getenv("BETFAIR_STREAM_FLUSH_SECONDS", 5))
+HEARTBEAT_MS = 5000
+
+# MATCH_ODDS runner sortPriority -> outcome, used when the catalogue has no runner names
+SORT_PRIORITY_OUTCOMES = {1: "home", 2: "away", 3: "draw"}
+
+
+def _utc_from_ms(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+class MarketCache:
+    """
+    Local order book for one market, built from a subscription image and kept
+    current by applying market change deltas. Only best-available-to-back
+    ladders are tracked: `batb` levels ([level, price, size]) and full `atb`
+    ladders ([price, size]); a size of 0 removes the level.
+    """
+
+    def __init__(self, market_id):
+        self.market_id = market_id
+        self.definition = {}
+        self.best_back = {}  # selection id -> {level: (price, size)}
+        self.back_ladder = {}  # selection id -> {price: size}
+        self.last_prices = None
+        self.published_at = None
+
+    def apply(self, change, published_at):
+        if change.get("img"):
+            self.best_back.clear()
+            self.back_ladder.clear()
+        if "marketDefinition" in change:
+            self.definition = change["marketDefinition"]
+
+        for runner in change.get("rc", []):
+            selection_id = runner["id"]
+            if "batb" in runner:
+                levels = self.best_back.setdefault(selection_id, {})
+                for level, price, size in runner["batb"]:
+                    if size == 0:
+                        levels.pop(level, None)
+                    else:
+                        levels[level] = (price, size)
+            if "atb" in runner:
+                ladder = self.back_ladder.setdefault(selection_id, {})
+                for price, size in runner["atb"]:
+                    if size == 0:
+                        ladder.pop(price, None)
+                    else:
+                        ladder[price] = size
+        self.published_at = published_at
+
+    def best_back_price(self, selection_id):
+        levels = self.best_back.get(selection_id)
+        if levels:
+            return levels[min(levels)][0]
+        ladder = self.back_ladder.get(selection_id)
+        if ladder:
+            return max(ladder)
+        return None
+
+
+class BetfairStream:
+    """
+    Exchange Stream consumer: keeps a MarketCache per subscribed market and
+    feeds every change in best back prices straight into the detector engine,
+    while snapshots are persisted in small batches.
+    """
+
+    def __init__(self, host=STREAM_HOST, port=STREAM_PORT, use_tls=True, market_ids=None,
+                 app_key=BETFAIR_APP_KEY, session_token=BETFAIR_SESSION_TOKEN,
+                 on_alert=None, record_path=None, persist=True, use_catalogue=True):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.market_ids = market_ids
+        self.app_key = app_key
+        self.session_token = session_token
+        self.on_alert = on_alert
+        self.record_path = record_path
+        self.persist = persist
+        self.use_catalogue = use_catalogue
+
+        self.markets = {}
+        self.market_info = {}
+        self.resolved = {}  # betfair event match id -> canonical match id
+        self.batch = SnapshotBatch()
+        self.last_flush = time.monotonic()
+        self.flagged = set()
+        self.clk = None
+        self.initial_clk = None
+        self.stopped = threading.Event()
+        self.sock = None
+
+    # Connection
+
+    def connect(self):
+        raw = socket.create_connection((self.host, self.port), timeout=HEARTBEAT_MS / 1000 * 3)
+        if self.use_tls:
+            raw = ssl.create_default_context().wrap_socket(raw, server_hostname=self.host)
+        self.sock = raw
+        self.reader = raw.makefile("r", encoding="utf-8", newline="\r\n")
+
+    def send(self, message):
+        self.sock.sendall((json.dumps(message) + "\r\n").encode("utf-8"))
+
+    def read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Stream closed by server")
+        if self.record_path:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(line.rstrip("\r\n") + "\n")
+        return json.loads(line)
+
+    def subscribe(self):
+        market_filter = {"marketIds": self.market_ids} if self.market_ids else {
+            "eventTypeIds": ["1"], "marketTypes": ["MATCH_ODDS"]
+        }
+        subscription = {
+            "op": "marketSubscription",
+            "id": 2,
+            "marketFilter": market_filter,
+            "marketDataFilter": {"fields": ["EX_BEST_OFFERS", "EX_MARKET_DEF"], "ladderLevels": 1},
+            "heartbeatMs": HEARTBEAT_MS,
+        }
+        # Resume from the last clock after a reconnect instead of a fresh image
+        if self.initial_clk and self.clk:
+            subscription["initialClk"] = self.initial_clk
+            subscription["clk"] = self.clk
+        self.send(subscription)
+
+    def run(self):
+        if self.use_catalogue:
+            self.load_catalogue()
+
+        attempt = 0
+        while not self.stopped.is_set():
+            try:
+                self.connect()
+                self.read()  # {"op": "connection", ...}
+                self.send({"op": "authentication", "id": 1, "appKey": self.app_key, "session": self.session_token})
+                self.subscribe()
+                attempt = 0
+                while not self.stopped.is_set():
+                    self.handle(self.read())
+            except (OSError, ConnectionError, ValueError) as e:
+                if self.stopped.is_set():
+                    break
+                attempt += 1
+                delay = min(30, 2 ** attempt)
+                print(f"[!] Betfair stream error: {e}, reconnecting in {delay}s")
+                self.stopped.wait(delay)
+            finally:
+                self.close()
+        self.flush()
+
+    def stop(self):
+        self.stopped.set()
+        self.close()
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    # Messages
+
+    def handle(self, message):
+        op = message.get("op")
+        if op == "status":
+            if message.get("statusCode") == "FAILURE":
+                raise ConnectionError(f"{message.get('errorCode')}: {message.get('errorMessage')}")
+            return
+        if op != "mcm":
+            return
+
+        self.clk = message.get("clk", self.clk)
+        self.initial_clk = message.get("initialClk", self.initial_clk)
+        published_at = _utc_from_ms(message["pt"]) if "pt" in message else datetime.utcnow()
+
+        changed = []
+        for change in message.get("mc", []):
+            cache = self.markets.get(change["id"])
+            if cache is None:
+                cache = self.markets[change["id"]] = MarketCache(change["id"])
+            cache.apply(change, published_at)
+            changed.append(cache)
+
+        unresolved = {}
+        for cache in changed:
+            info = self.describe(cache)
+            if info is not None and info[0].match_id not in self.resolved:
+                unresolved[info[0].match_id] = info[0]
+        if unresolved:
+            self.resolve(list(unresolved.values()))
+
+        for cache in changed:
+            self.on_market_change(cache)
+
+        if time.monotonic() - self.last_flush >= STREAM_FLUSH_SECONDS:
+            self.flush()
+
+    def on_market_change(self, cache: MarketCache):
+        info = self.describe(cache)
+        if info is None:
+            return
+        match_row, outcomes = info
+        # Snapshots are stored under the Betfair event and re-keyed on write; the engine uses the canonical id
+        match_id = self.resolved.get(match_row.match_id, match_row.match_id)
+
+        prices = {outcome: cache.best_back_price(selection_id) for selection_id, outcome in outcomes.items()}
+        vector = (prices.get("home"), prices.get("draw"), prices.get("away"))
+        if vector == cache.last_prices:
+            return
+        cache.last_prices = vector
+
+        snapshot = SnapshotRow(
+            id=str(uuid4()),
+            match_id=match_row.match_id,
+            timestamp=cache.published_at,
+            bookmaker="Betfair",
+            market="1X2",
+            home=vector[0],
+            draw=vector[1],
+            away=vector[2]
+        )
+        self.batch.add(match_row, [snapshot])
+        engine.update(match_id, "Betfair", "1X2", snapshot.timestamp, draw=snapshot.draw)
+
+        draw_flag, goal_flag, sources = engine.evaluate(match_id)
+        if (draw_flag or goal_flag) and match_id not in self.flagged:
+            self.flagged.add(match_id)
+            self.raise_alert(match_row._replace(match_id=match_id), draw_flag, goal_flag, sources)
+
+    def describe(self, cache: MarketCache):
+        """
+        (MatchRow, {selection id: outcome}) for a market, from the cached
+        catalogue or, failing that, the stream's own market definition.
+        """
+        if cache.market_id in self.market_info:
+            return self.market_info[cache.market_id]
+
+        definition = cache.definition
+        if not definition.get("eventId"):
+            return None
+        outcomes = {
+            runner["id"]: SORT_PRIORITY_OUTCOMES[runner["sortPriority"]]
+            for runner in definition.get("runners", []) if runner.get("sortPriority") in SORT_PRIORITY_OUTCOMES
+        }
+        match_row = MatchRow(
+            match_id=f"betfair_{definition['eventId']}",
+            home_team="Unknown",
+            away_team="Unknown",
+            league=definition.get("countryCode", "Unknown"),
+            commence_time=parse_iso_utc(definition["openDate"]) if definition.get("openDate") else datetime.utcnow(),
+            source="betfair"
+        )
+        return match_row, outcomes
+
+    def resolve(self, match_rows):
+        """
+        Store newly seen events right away so they resolve to their canonical
+        match before any of their prices reach the engine.
+        """
+        for match_row in match_rows:
+            self.batch.add(match_row, [])
+        self.flush()
+        for match_row in match_rows:
+            self.resolved[match_row.match_id] = resolver.canonical_id(match_row) or match_row.match_id
+
+    def load_catalogue(self):
+        try:
+            catalogue = get_market_catalogue()
+        except Exception as e:
+            print(f"[!] Betfair catalogue unavailable, using stream market definitions: {e}")
+            return
+
+        for market in catalogue:
+            event = market["event"]
+            home, _, away = event["name"].partition(" v ")
+            home, away = home.strip(), away.strip()
+            names = {home: "home", away: "away", "The Draw": "draw"}
+            outcomes = {
+                runner["selectionId"]: names[runner["runnerName"]]
+                for runner in market.get("runners", []) if runner.get("runnerName") in names
+            }
+            self.market_info[market["marketId"]] = (MatchRow(
+                match_id=f"betfair_{event['id']}",
+                home_team=home,
+                away_team=away,
+                league=event.get("countryCode", "Unknown"),
+                commence_time=parse_iso_utc(event["openDate"]),
+                source="betfair"
+            ), outcomes)
+        if self.market_ids is None:
+            self.market_ids = list(self.market_info) or None
+
+    # Output
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.persist or not len(self.batch):
+            self.batch = SnapshotBatch()
+            return
+        batch, self.batch = self.batch, SnapshotBatch()
+        db: Session = next(get_db())
+        try:
+            write_batch(db, batch, resolver=resolver)
+        except Exception as e:
+            print(f"[!] Betfair stream write failed: {e}")
+        finally:
+            db.close()
+
+    def raise_alert(self, match_row, draw_flag, goal_flag, sources):
+        print(f"🚨 Stream alert: {match_row.match_id} (draw={draw_flag}, goal_line={goal_flag})")
+        if self.on_alert is not None:
+            self.on_alert(match_row, draw_flag, goal_flag, sources)
+            return
+        if not self.persist:
+            return
+
+        # The match row must exist before the alert that references it
+        self.flush()
+        from app.models.alerts import SuspicionAlert
+        from app.tasks.monitor import record_alerts
+
+        alert = SuspicionAlert(
+            match_id=match_row.match_id,
+            league=match_row.league,
+            home_team=match_row.home_team,
+            away_team=match_row.away_team,
+            commence_time=match_row.commence_time,
+            suspicious_draw=draw_flag,
+            goal_line_shift=goal_flag,
+            alert_sources=sources or ["unknown"]
+        )
+        db: Session = next(get_db())
+        try:
+            record_alerts(db, [alert])
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consume the Betfair Exchange Stream into the analyzer")
+    parser.add_argument("--host", default=STREAM_HOST)
+    parser.add_argument("--port", type=int, default=STREAM_PORT)
+    parser.add_argument("--no-tls", action="store_true", help="plain TCP, e.g. for the local replay server")
+    parser.add_argument("--no-catalogue", action="store_true", help="map runners from stream market definitions only")
+    parser.add_argument("--no-persist", action="store_true", help="analyse only, do not write snapshots or alerts")
+    parser.add_argument("--record", help="append every received message to this file")
+    parser.add_argument("--market", action="append", dest="market_ids")
+    args = parser.parse_args()
+
+    BetfairStream(
+        host=args.host, port=args.port, use_tls=not args.no_tls, market_ids=args.market_ids,
+        record_path=args.record, persist=not args.no_persist, use_catalogue=not args.no_catalogue,
+    ).run()
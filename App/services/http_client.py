@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils import metrics
+from app.utils.ratelimit import TokenBucket, backoff_delay
+
+# Per-provider limits: max in-flight requests, (connect, read) timeout in seconds,
+# sustained requests/sec with a burst allowance, and retries on 429/5xx
+PROVIDER_LIMITS = {
+    "oddsapi": {
+        "concurrency": int(os.getenv("ODDSAPI_CONCURRENCY", 4)),
+        "timeout": (float(os.getenv("ODDSAPI_CONNECT_TIMEOUT", 5)), float(os.getenv("ODDSAPI_READ_TIMEOUT", 20))),
+        "rate": float(os.getenv("ODDSAPI_RATE_PER_SEC", 5)),
+        "burst": float(os.getenv("ODDSAPI_BURST", 10)),
+        "max_retries": int(os.getenv("ODDSAPI_MAX_RETRIES", 3)),
+        # Stop before the monthly quota hits zero so a cycle is never cut off halfway
+        "quota_reserve": int(os.getenv("ODDSAPI_QUOTA_RESERVE", 20)),
+        "quota_header": "x-requests-remaining",
+        # Once held back by the reserve, let one request through this often to see if the quota was reset
+        "quota_recheck": float(os.getenv("ODDSAPI_QUOTA_RECHECK_SECONDS", 3600)),
+    },
+    "betfair": {
+        "concurrency": int(os.getenv("BETFAIR_CONCURRENCY", 4)),
+        "timeout": (float(os.getenv("BETFAIR_CONNECT_TIMEOUT", 5)), float(os.getenv("BETFAIR_READ_TIMEOUT", 15))),
+        "rate": float(os.getenv("BETFAIR_RATE_PER_SEC", 5)),
+        "burst": float(os.getenv("BETFAIR_BURST", 10)),
+        "max_retries": int(os.getenv("BETFAIR_MAX_RETRIES", 3)),
+        "quota_reserve": 0,
+        "quota_header": None,
+    },
+    "pinnacle": {
+        "concurrency": int(os.getenv("PINNACLE_CONCURRENCY", 2)),
+        "timeout": (float(os.getenv("PINNACLE_CONNECT_TIMEOUT", 5)), float(os.getenv("PINNACLE_READ_TIMEOUT", 20))),
+        "rate": float(os.getenv("PINNACLE_RATE_PER_SEC", 1)),
+        "burst": float(os.getenv("PINNACLE_BURST", 3)),
+        "max_retries": int(os.getenv("PINNACLE_MAX_RETRIES", 3)),
+        "quota_reserve": 0,
+        "quota_header": None,
+    },
+}
+
+POOL_MAXSIZE = sum(limits["concurrency"] for limits in PROVIDER_LIMITS.values())
+
+# Response headers carrying used request quota (the remaining quota header is per provider,
+# short-window rate limit headers such as x-ratelimit-remaining are not a quota)
+QUOTA_USED_HEADERS = ("x-requests-used",)
+QUOTA_LAST_COST_HEADERS = ("x-requests-last",)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class QuotaExhausted(requests.RequestException):
+    pass
+
+
+def _header_number(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return None
+
+
+class Provider:
+    """
+    Request gate for one upstream API: bounded concurrency, token-bucket pacing,
+    backoff on 429/5xx (honouring Retry-After), quota tracking from response
+    headers, and per-cycle request/latency/cost counters.
+    """
+
+    def __init__(self, name, concurrency, timeout, rate, burst, max_retries, quota_reserve, quota_header=None,
+                 quota_recheck=3600.0):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.quota_reserve = quota_reserve
+        self.quota_header = quota_header
+        self.quota_recheck = quota_recheck
+        self.quota_checked_at = 0.0
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.bucket = TokenBucket(rate=rate, capacity=burst)
+        self.lock = threading.Lock()
+        self.quota_remaining = None
+        self.quota_used = None
+        self.reset_cycle_stats()
+
+    def reset_cycle_stats(self):
+        with self.lock:
+            self.cycle = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "throttled": 0,
+                "cost": 0.0,
+                "latency_total": 0.0,
+                "latency_max": 0.0,
+            }
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.cycle)
+            stats["latency_avg"] = stats["latency_total"] / stats["requests"] if stats["requests"] else 0.0
+            stats["quota_remaining"] = self.quota_remaining
+            stats["quota_used"] = self.quota_used
+            return stats
+
+    def _record(self, response, latency, cost, stream=False):
+        size = _header_number(response.headers, ("content-length",))
+        if size is None and not stream:
+            size = len(response.content)
+        metrics.PROVIDER_REQUESTS.inc(provider=self.name, status=response.status_code)
+        metrics.PROVIDER_REQUEST_SECONDS.observe(latency, provider=self.name)
+        if size:
+            metrics.PROVIDER_BYTES.inc(size, provider=self.name)
+
+        remaining = _header_number(response.headers, (self.quota_header,)) if self.quota_header else None
+        used = _header_number(response.headers, QUOTA_USED_HEADERS)
+        last_cost = _header_number(response.headers, QUOTA_LAST_COST_HEADERS)
+        with self.lock:
+            self.cycle["requests"] += 1
+            self.cycle["latency_total"] += latency
+            self.cycle["latency_max"] = max(self.cycle["latency_max"], latency)
+            self.cycle["cost"] += last_cost if last_cost is not None else cost
+            if response.status_code >= 400:
+                self.cycle["errors"] += 1
+            if response.status_code == 429:
+                self.cycle["throttled"] += 1
+            if remaining is not None:
+                self.quota_remaining = remaining
+                self.quota_checked_at = time.monotonic()
+            if used is not None:
+                self.quota_used = used
+
+    def request(self, method, url, cost=1, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            if self._quota_held(cost):
+                raise QuotaExhausted(
+                    f"{self.name} quota nearly exhausted ({self.quota_remaining:.0f} left, reserve {self.quota_reserve})"
+                )
+
+            self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                with self.semaphore:
+                    response = get_session().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                metrics.PROVIDER_REQUESTS.inc(provider=self.name, status="error")
+                with self.lock:
+                    self.cycle["errors"] += 1
+                if attempt == self.max_retries:
+                    raise
+                self._retry_wait(attempt, None)
+                continue
+
+            self._record(response, time.perf_counter() - started, cost, stream=kwargs.get("stream", False))
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            self._retry_wait(attempt, response)
+        return response
+
+    def _quota_held(self, cost):
+        """
+        Whether the last quota reading leaves too little for this request. A
+        reading older than quota_recheck lets one request through, whose
+        response brings a fresh reading (the quota may have been reset).
+        """
+        with self.lock:
+            if self.quota_remaining is None or self.quota_remaining - cost >= self.quota_reserve:
+                return False
+            now = time.monotonic()
+            if now - self.quota_checked_at >= self.quota_recheck:
+                self.quota_checked_at = now
+                return False
+            return True
+
+    def _retry_wait(self, attempt, response):
+        metrics.PROVIDER_RETRIES.inc(provider=self.name)
+        with self.lock:
+            self.cycle["retries"] += 1
+        retry_after = _header_number(response.headers, ("retry-after",)) if response is not None else None
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        if response is not None:
+            # A streamed body nobody will read would hold its pooled connection
+            response.close()
+            if response.status_code == 429:
+                # Hold back every caller of this provider, not only this thread
+                self.bucket.pause(delay)
+        time.sleep(delay)
+
+
+providers = {name: Provider(name, **limits) for name, limits in PROVIDER_LIMITS.items()}
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide keep-alive session shared by the OddsAPI, Betfair and Pinnacle clients.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(PROVIDER_LIMITS), pool_maxsize=POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def request(provider, method, url, cost=1, **kwargs) -> requests.Response:
+    """
+    Send a request through the shared session via the provider's gate.
+    `cost` is the quota the request is expected to consume when the provider
+    does not report it.
+    """
+    return providers[provider].request(method, url, cost=cost, **kwargs)
+
+
+def share_limits(parts):
+    """
+    Pace this process at 1/`parts` of every provider's request rate and burst,
+    for when `parts` processes poll the same accounts side by side.
+    """
+    for name, limits in PROVIDER_LIMITS.items():
+        providers[name].bucket = TokenBucket(rate=limits["rate"] / parts, capacity=max(1.0, limits["burst"] / parts))
+
+
+def cycle_stats():
+    return {name: provider.stats() for name, provider in providers.items()}
+
+
+def reset_cycle_stats():
+    for provider in providers.values():
+        provider.reset_cycle_stats()
+
+
+def _call(fn, item):
+    try:
+        return item, fn(item), None
+    except Exception as e:
+        return item, None, e
+
+
+def run_concurrently(provider, fn, items):
+    """
+    Call fn(item) for every item on a worker pool bounded by the provider's
+    concurrency limit. Returns (item, result, error) tuples in input order.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    workers = min(PROVIDER_LIMITS[provider]["concurrency"], len(items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{provider}-fetch") as pool:
+        return list(pool.map(lambda item: _call(fn, item), items))
+
+
+def iter_concurrently(provider, fn, items):
+    """
+    Like run_concurrently, but yields each (item, result, error) as soon as
+    its call completes.
+    """
+    items = list(items)
+    if not items:
+        return
+
+    workers = min(PROVIDER_LIMITS[provider]["concurrency"], len(items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{provider}-fetch") as pool:
+        for future in as_completed([pool.submit(_call, fn, item) for item in items]):
+            yield future.result()
@@ -0,0 +1,253 @@
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from difflib import SequenceMatcher
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.match import Match, MatchAlias, registry
+
+# Provider events kicking off within this many minutes of each other may be the same fixture
+KICKOFF_TOLERANCE = timedelta(minutes=int(os.getenv("MATCH_KICKOFF_TOLERANCE_MINUTES", 90)))
+# Both team names must be at least this similar (0-1) after normalisation
+NAME_THRESHOLD = float(os.getenv("MATCH_NAME_THRESHOLD", 0.75))
+CHUNK_SIZE = 500
+# When several providers list a new fixture in one batch, the first of these owns the match id
+CANONICAL_PROVIDERS = ("oddsapi", "pinnacle", "betfair")
+
+# Club-type prefixes and suffixes that providers add or drop at will
+TEAM_STOPWORDS = {
+    "fc", "sc", "cf", "ac", "afc", "cd", "ec", "fk", "sk", "club", "clube",
+    "de", "do", "da", "del", "futebol", "football",
+}
+# Betfair only reports a country code for its events
+COUNTRY_CODES = {
+    "BR": "brazil", "AR": "argentina", "IR": "iran", "NG": "nigeria", "ZA": "south africa",
+    "KE": "kenya", "GH": "ghana", "ZW": "zimbabwe", "GB": "england", "ES": "spain",
+    "IT": "italy", "DE": "germany", "FR": "france", "PT": "portugal",
+}
+COUNTRIES = sorted(set(COUNTRY_CODES.values()), key=len, reverse=True)
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", " ", text).split()
+
+
+def normalize_team(name):
+    """
+    'Grêmio Novorizontino FC' -> 'gremio novorizontino'
+    """
+    tokens = _fold(name)
+    kept = [t for t in tokens if t not in TEAM_STOPWORDS]
+    return " ".join(kept or tokens)
+
+
+def league_region(league):
+    """
+    Country a league belongs to, the only league key every provider agrees on:
+    'soccer_brazil_serieb', 'Brazil - Serie B' and Betfair's 'BR' all give 'brazil'.
+    """
+    if league and len(league) == 2 and league.isupper():
+        return COUNTRY_CODES.get(league, league.lower())
+    folded = " ".join(t for t in _fold(league) if t != "soccer")
+    for country in COUNTRIES:
+        if folded.startswith(country):
+            return country
+    return folded
+
+
+def name_similarity(a, b):
+    if a == b:
+        return 1.0
+    ratio = SequenceMatcher(None, a, b).ratio()
+    ta, tb = set(a.split()), set(b.split())
+    if ta and tb and (ta <= tb or tb <= ta):
+        # 'vasco' vs 'vasco gama'
+        ratio = max(ratio, 0.9)
+    return ratio
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class Candidate:
+    __slots__ = ("match_id", "commence_time", "home", "away", "providers")
+
+    def __init__(self, match_id, commence_time, home_team, away_team, providers):
+        self.match_id = match_id
+        self.commence_time = commence_time
+        self.home = normalize_team(home_team)
+        self.away = normalize_team(away_team)
+        self.providers = providers
+
+
+class CandidateIndex:
+    """
+    Canonical matches blocked by region, each block sorted by kickoff so a
+    lookup only scores the fixtures inside the kickoff tolerance.
+    """
+
+    def __init__(self):
+        self.blocks = {}  # region -> ([kickoff, ...], [Candidate, ...])
+        self.match_ids = set()
+
+    def add(self, region, candidate):
+        self.match_ids.add(candidate.match_id)
+        times, candidates = self.blocks.setdefault(region, ([], []))
+        i = bisect_right(times, candidate.commence_time)
+        times.insert(i, candidate.commence_time)
+        candidates.insert(i, candidate)
+
+    def best(self, region, provider, home, away, commence_time, tolerance=KICKOFF_TOLERANCE, threshold=NAME_THRESHOLD):
+        times, candidates = self.blocks.get(region, ([], []))
+        lo = bisect_left(times, commence_time - tolerance)
+        hi = bisect_right(times, commence_time + tolerance)
+        best, best_score = None, threshold
+        for candidate in candidates[lo:hi]:
+            # A provider lists a fixture once, so a match it already feeds is not a candidate
+            if provider in candidate.providers:
+                continue
+            score = min(name_similarity(home, candidate.home), name_similarity(away, candidate.away))
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best, best_score
+
+
+class MatchResolver:
+    """
+    Maps provider events (a MatchRow's source and match_id) to one canonical
+    Match. Known events resolve from an in-memory alias map backed by the
+    match_aliases table; new ones are blocked by region and kickoff window and
+    fuzzy matched on normalised team names, and the result is stored as an alias.
+    """
+
+    def __init__(self):
+        self.aliases = {}  # (provider, provider event id) -> match id
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.aliases.clear()
+
+    def canonical_id(self, match_row):
+        """
+        Canonical match id of an event already resolved, or None.
+        """
+        with self.lock:
+            return self.aliases.get((match_row.source, match_row.match_id))
+
+    def resolve(self, db: Session, match_rows):
+        """
+        {provider match id: canonical match id} for the rows, plus the alias
+        rows to insert once the canonical matches are written.
+        """
+        alias_table = MatchAlias.__table__
+        mapping, new_aliases = {}, []
+
+        with self.lock:
+            unknown = []
+            for row in match_rows:
+                key = (row.source, row.match_id)
+                if key in self.aliases:
+                    mapping[row.match_id] = self.aliases[key]
+                else:
+                    unknown.append(row)
+            if not unknown:
+                return mapping, new_aliases
+
+            for ids in _chunks([row.match_id for row in unknown]):
+                rows = db.execute(
+                    select(alias_table.c.provider, alias_table.c.provider_event_id, alias_table.c.match_id)
+                    .where(alias_table.c.provider_event_id.in_(ids))
+                )
+                for r in rows:
+                    self.aliases[(r.provider, r.provider_event_id)] = r.match_id
+            pending = []
+            for row in unknown:
+                key = (row.source, row.match_id)
+                if key in self.aliases:
+                    mapping[row.match_id] = self.aliases[key]
+                else:
+                    pending.append(row)
+            if not pending:
+                return mapping, new_aliases
+
+            pending.sort(key=lambda row: CANONICAL_PROVIDERS.index(row.source)
+                         if row.source in CANONICAL_PROVIDERS else len(CANONICAL_PROVIDERS))
+            index = self._candidates(db, pending)
+            for row in pending:
+                canonical, score = self._match(index, row)
+                mapping[row.match_id] = canonical
+                if score is None:
+                    continue  # nothing to match on yet, try again once the event has names
+                self.aliases[(row.source, row.match_id)] = canonical
+                new_aliases.append({
+                    "provider": row.source,
+                    "provider_event_id": row.match_id,
+                    "match_id": canonical,
+                    "score": score,
+                })
+
+        merged = sum(1 for a in new_aliases if a["match_id"] != a["provider_event_id"])
+        if merged:
+            print(f"[+] Matched {merged} provider events to existing fixtures")
+        return mapping, new_aliases
+
+    def _candidates(self, db: Session, rows):
+        match_table = Match.__table__
+        alias_table = MatchAlias.__table__
+        start = min(row.commence_time for row in rows) - KICKOFF_TOLERANCE
+        end = max(row.commence_time for row in rows) + KICKOFF_TOLERANCE
+
+        registry.ensure_warm(db)
+        if registry.covers(start):
+            matches = registry.between(start, end)
+        else:
+            matches = db.execute(
+                select(match_table.c.match_id, match_table.c.commence_time, match_table.c.home_team,
+                       match_table.c.away_team, match_table.c.league, match_table.c.source)
+                .where(match_table.c.commence_time.between(start, end))
+            ).all()
+        providers = {m.match_id: {m.source} for m in matches}
+        for ids in _chunks(list(providers)):
+            for r in db.execute(
+                select(alias_table.c.match_id, alias_table.c.provider).where(alias_table.c.match_id.in_(ids))
+            ):
+                providers[r.match_id].add(r.provider)
+
+        index = CandidateIndex()
+        for m in matches:
+            index.add(league_region(m.league), Candidate(
+                m.match_id, m.commence_time, m.home_team, m.away_team, providers[m.match_id]
+            ))
+        return index
+
+    def _match(self, index, row):
+        # Events stored before resolution existed keep their own history
+        if row.match_id in index.match_ids:
+            return row.match_id, 1.0
+
+        region = league_region(row.league)
+        home, away = normalize_team(row.home_team), normalize_team(row.away_team)
+        if "unknown" in (home, away):
+            return row.match_id, None
+
+        candidate, score = index.best(region, row.source, home, away, row.commence_time)
+        if candidate is not None:
+            candidate.providers.add(row.source)
+            return candidate.match_id, score
+
+        # First provider to list the fixture: the event becomes the canonical match
+        index.add(region, Candidate(row.match_id, row.commence_time, row.home_team, row.away_team, {row.source}))
+        return row.match_id, 1.0
+
+
+resolver = MatchResolver()
@@ -1,44 +1,121 @@
 import os
+import atexit
+import queue
+import threading
+import time
 import requests
 import smtplib
+from collections import namedtuple
 from email.mime.text import MIMEText
-from app.models.suspicion_alert import SuspicionAlert
+from app.models.alerts import SuspicionAlert
+from app.utils import metrics
+from app.utils.ratelimit import TokenBucket, backoff_delay
 
 # Load from environment or config
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", 10))
+# Telegram allows about one message per second to the same chat
+TELEGRAM_MESSAGES_PER_SEC = float(os.getenv("TELEGRAM_MESSAGES_PER_SEC", 1))
+# sendMessage rejects texts longer than this, counted in UTF-16 code units
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
 
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 EMAIL_RECEIVER = os.getenv("EMAIL_RECEIVER")
+EMAIL_TIMEOUT = float(os.getenv("EMAIL_TIMEOUT", 30))
 
-def send_telegram_alert(alert: SuspicionAlert):
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        print("Telegram not configured.")
-        return
+# Alerts arriving within this many seconds of each other are sent together,
+# and a batch of at least DIGEST_MIN_ALERTS goes out as a single digest
+COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", 5))
+DIGEST_MIN_ALERTS = int(os.getenv("NOTIFY_DIGEST_MIN_ALERTS", 3))
+MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 4))
+
+# Detached copy of the fields the notifiers need, safe to hand to worker threads
+AlertMessage = namedtuple(
+    "AlertMessage",
+    ["match_id", "league", "home_team", "away_team", "commence_time",
+     "suspicious_draw", "goal_line_shift", "alert_sources"],
+)
+
+
+def alert_message(alert: SuspicionAlert) -> AlertMessage:
+    return AlertMessage(
+        match_id=alert.match_id,
+        league=alert.league,
+        home_team=alert.home_team,
+        away_team=alert.away_team,
+        commence_time=alert.commence_time,
+        suspicious_draw=alert.suspicious_draw,
+        goal_line_shift=alert.goal_line_shift,
+        alert_sources=list(alert.alert_sources or []),
+    )
+
+
+class TelegramRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Telegram rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
 
-    msg = f"""🚨 Suspicious Match Detected
+
+def format_telegram(alert) -> str:
+    return f"""🚨 Suspicious Match Detected
 🏟️ {alert.league}
 ⚽ {alert.home_team} vs {alert.away_team}
 🕒 {alert.commence_time.strftime('%Y-%m-%d %H:%M')}
-🔍 Flags: 
+🔍 Flags:
 - Draw Drop: {"✅" if alert.suspicious_draw else "❌"}
 - Goal Line Shift: {"✅" if alert.goal_line_shift else "❌"}
 📡 Sources: {", ".join(alert.alert_sources)}
 """
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    try:
-        requests.post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": msg})
-    except Exception as e:
-        print("Telegram alert failed:", e)
 
-def send_email_alert(alert: SuspicionAlert):
-    if not EMAIL_HOST or not EMAIL_USER or not EMAIL_PASS:
-        print("Email not configured.")
-        return
 
+def format_telegram_digest(alerts) -> list:
+    """
+    The digest as one or more texts, split at line boundaries so each fits
+    in a single sendMessage.
+    """
+    lines = [f"🚨 {len(alerts)} Suspicious Matches Detected"]
+    for alert in alerts:
+        flags = [name for name, on in (("draw drop", alert.suspicious_draw), ("goal line", alert.goal_line_shift)) if on]
+        lines.append(
+            f"⚽ {alert.home_team} vs {alert.away_team} ({alert.league}, "
+            f"{alert.commence_time.strftime('%Y-%m-%d %H:%M')}) | {', '.join(flags)} | "
+            f"{', '.join(alert.alert_sources)}"
+        )
+    return _split_telegram(lines)
+
+
+def _telegram_length(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _split_telegram(lines, limit=TELEGRAM_MAX_MESSAGE_LENGTH):
+    texts, current, length = [], [], 0
+    for line in lines:
+        while _telegram_length(line) > limit:  # a single oversized line is cut
+            cut = limit
+            while _telegram_length(line[:cut]) > limit:
+                cut -= 1
+            head, line = line[:cut], line[cut:]
+            if current:
+                texts.append("\n".join(current))
+                current, length = [], 0
+            texts.append(head)
+        added = _telegram_length(line) + (1 if current else 0)
+        if current and length + added > limit:
+            texts.append("\n".join(current))
+            current, length, added = [], 0, _telegram_length(line)
+        current.append(line)
+        length += added
+    if current:
+        texts.append("\n".join(current))
+    return texts
+
+
+def format_email(alert):
     subject = f"Suspicious Fixture Alert: {alert.home_team} vs {alert.away_team}"
     body = f"""
 Suspicious match detected!
@@ -53,14 +130,51 @@ Reasons:
 
 Source(s): {', '.join(alert.alert_sources)}
 """
+    return subject, body
+
+
+def format_email_digest(alerts):
+    subject = f"Suspicious Fixture Alerts: {len(alerts)} matches"
+    body = "\n".join(format_email(alert)[1] for alert in alerts)
+    return subject, body
+
 
+def _build_email(subject, body):
     msg = MIMEText(body)
     msg["Subject"] = subject
     msg["From"] = EMAIL_USER
     msg["To"] = EMAIL_RECEIVER
+    return msg
+
+
+def _post_telegram(text):
+    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    res = requests.post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": text}, timeout=TELEGRAM_TIMEOUT)
+    if res.status_code == 429:
+        retry_after = res.json().get("parameters", {}).get("retry_after", 1)
+        raise TelegramRateLimited(retry_after)
+    res.raise_for_status()
+
+
+def send_telegram_alert(alert: SuspicionAlert):
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        print("Telegram not configured.")
+        return
 
     try:
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
+        _post_telegram(format_telegram(alert))
+    except Exception as e:
+        print("Telegram alert failed:", e)
+
+def send_email_alert(alert: SuspicionAlert):
+    if not EMAIL_HOST or not EMAIL_USER or not EMAIL_PASS:
+        print("Email not configured.")
+        return
+
+    msg = _build_email(*format_email(alert))
+
+    try:
+        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=EMAIL_TIMEOUT) as server:
             server.starttls()
             server.login(EMAIL_USER, EMAIL_PASS)
             server.sendmail(EMAIL_USER, EMAIL_RECEIVER, msg.as_string())
@@ -70,3 +184,155 @@ Source(s): {', '.join(alert.alert_sources)}
 def notify_all(alert: SuspicionAlert):
     send_telegram_alert(alert)
     send_email_alert(alert)
+
+
+class TelegramChannel:
+    name = "telegram"
+
+    def __init__(self):
+        self.bucket = TokenBucket(rate=TELEGRAM_MESSAGES_PER_SEC, capacity=1)
+
+    def configured(self):
+        return bool(TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID)
+
+    def send_batch(self, alerts):
+        texts = format_telegram_digest(alerts) if len(alerts) >= DIGEST_MIN_ALERTS else [
+            format_telegram(alert) for alert in alerts
+        ]
+        for text in texts:
+            _with_retries(self.name, lambda: self._send(text))
+
+    def _send(self, text):
+        self.bucket.acquire()
+        try:
+            _post_telegram(text)
+        except TelegramRateLimited as e:
+            self.bucket.pause(e.retry_after)
+            raise
+
+
+class EmailChannel:
+    name = "email"
+
+    def configured(self):
+        return bool(EMAIL_HOST and EMAIL_USER and EMAIL_PASS)
+
+    def send_batch(self, alerts):
+        if len(alerts) >= DIGEST_MIN_ALERTS:
+            messages = [_build_email(*format_email_digest(alerts))]
+        else:
+            messages = [_build_email(*format_email(alert)) for alert in alerts]
+        # One SMTP connection (STARTTLS + login) for the whole batch
+        _with_retries(self.name, lambda: self._send(messages))
+
+    def _send(self, messages):
+        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=EMAIL_TIMEOUT) as server:
+            server.starttls()
+            server.login(EMAIL_USER, EMAIL_PASS)
+            while messages:
+                server.sendmail(EMAIL_USER, EMAIL_RECEIVER, messages[0].as_string())
+                messages.pop(0)  # sent messages are not resent on retry
+
+
+def _with_retries(channel, send):
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            send()
+            metrics.NOTIFICATIONS.inc(channel=channel, outcome="sent")
+            return
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                print(f"[!] {channel} notification failed after {attempt + 1} attempts: {e}")
+                metrics.NOTIFICATIONS.inc(channel=channel, outcome="failed")
+                return
+            delay = e.retry_after if isinstance(e, TelegramRateLimited) else backoff_delay(attempt)
+            print(f"[!] {channel} notification failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class NotificationDispatcher:
+    """
+    Background alert delivery with one worker thread and queue per channel.
+    Alerts that arrive within COALESCE_SECONDS of each other are delivered
+    together; enqueue() never blocks on the network.
+    """
+
+    def __init__(self, channels=None):
+        self.channels = channels if channels is not None else [TelegramChannel(), EmailChannel()]
+        self.queues = {}
+        self.workers = []
+        # Set once start() has run, even when no channel is configured and no worker started
+        self.started = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            for channel in self.channels:
+                if not channel.configured():
+                    print(f"{channel.name.capitalize()} not configured.")
+                    continue
+                self.queues[channel.name] = queue.Queue()
+                worker = threading.Thread(
+                    target=self._run, args=(channel, self.queues[channel.name]),
+                    name=f"notify-{channel.name}", daemon=True,
+                )
+                worker.start()
+                self.workers.append(worker)
+
+    def enqueue(self, alert):
+        if not self.started:
+            self.start()
+        message = alert_message(alert)
+        for q in self.queues.values():
+            q.put(message)
+
+    def _run(self, channel, q):
+        while True:
+            first = q.get()
+            if first is None:
+                q.task_done()
+                return
+
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + COALESCE_SECONDS
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                with metrics.NOTIFY_SECONDS.time(channel=channel.name):
+                    channel.send_batch(batch)
+            except Exception as e:
+                print(f"[!] {channel.name} dispatch error: {e}")
+            finally:
+                for _ in range(len(batch) + stop):
+                    q.task_done()
+            if stop:
+                return
+
+    def stop(self, timeout=None):
+        """
+        Deliver everything still queued, then stop the workers.
+        """
+        for q in self.queues.values():
+            q.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+        with self.lock:
+            self.workers = []
+            self.queues = {}
+            self.started = False
+
+
+dispatcher = NotificationDispatcher()
+atexit.register(dispatcher.stop, 60)
@@ -1,12 +1,17 @@
 import requests
 import os
+import time
 from datetime import datetime
 from uuid import uuid4
 
 from sqlalchemy.orm import Session
-from app.models.match import Match
-from app.models.odds import OddsSnapshot
+from app.analyzer.incremental import oddsapi_bookmaker
 from app.db.session import get_db
+from app.db.bulk import MatchRow, SnapshotRow, SnapshotBatch, add_rows
+from app.services import http_client
+from app.services.matching import resolver
+from app.utils.helpers import parse_iso_utc
+from app.utils.jsonstream import iter_items
 
 # Load your OddsAPI key from environment
 ODDS_API_KEY = os.getenv("ODDS_API_KEY")
@@ -14,6 +19,8 @@ ODDS_API_KEY = os.getenv("ODDS_API_KEY")
 BASE_URL = "https://api.the-odds-api.com/v4/sports"
 REGIONS = "eu,uk"
 MARKETS = "h2h,totals"
+# OddsAPI bills each request as regions x markets
+REQUEST_COST = len(REGIONS.split(",")) * len(MARKETS.split(","))
 
 LEAGUE_KEYS = [
     "soccer_brazil_serieb",
@@ -27,59 +34,129 @@ LEAGUE_KEYS = [
     "soccer_zimbabwe_premier_league"
 ]
 
-def fetch_odds_for_all_target_leagues():
+def fetch_odds_for_all_target_leagues(concurrent=True, batch: SnapshotBatch | None = None, league_keys=None):
+    """
+    Fetch and store odds for every league in LEAGUE_KEYS (or just `league_keys`).
+    When a batch is passed, rows are collected into it and the caller writes them
+    with write_batch; otherwise they go through the per-row ORM path.
+    """
     db: Session = next(get_db())
-    all_matches = []
-
-    for league_key in LEAGUE_KEYS:
-        print(f"[+] Fetching league: {league_key}")
-        matches = fetch_odds_for_league(league_key, db)
-        all_matches.extend(matches)
+    league_keys = LEAGUE_KEYS if league_keys is None else league_keys
+    parsed = []
+
+    if concurrent:
+        # Fetch and parse every league in parallel over the shared pool, then store on
+        # this thread (the session is not thread-safe), so cycle time tracks the slowest league.
+        print(f"[+] Fetching {len(league_keys)} leagues concurrently")
+        results = http_client.run_concurrently("oddsapi", fetch_league_rows, league_keys)
+        for league_key, rows, error in results:
+            if error is not None:
+                print(f"[!] Fetch failed for {league_key}: {error}")
+                continue
+            parsed.append(rows)
+    else:
+        for league_key in league_keys:
+            print(f"[+] Fetching league: {league_key}")
+            parsed.append(fetch_league_rows(league_key))
+
+    if batch is not None:
+        for rows in parsed:
+            for match_row, snapshot_rows in rows:
+                batch.add(match_row, snapshot_rows)
+        return []
 
+    started = time.perf_counter()
+    all_matches = []
+    rows_written = 0
+    for rows in parsed:
+        for match_row, snapshot_rows in rows:
+            all_matches.append(add_rows(db, match_row, snapshot_rows, resolver=resolver))
+            rows_written += len(snapshot_rows)
     db.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"[✔] ORM write: {rows_written} snapshots in {elapsed:.3f}s "
+          f"({rows_written / elapsed if elapsed > 0 else 0:.0f} rows/sec)")
     return all_matches
 
-def fetch_odds_for_league(league_key, db: Session):
-    url = f"{BASE_URL}/{league_key}/odds"
+def iter_rows(league_keys=None):
+    """
+    Yield the (MatchRow, [SnapshotRow, ...]) list of each league as soon as its
+    payload arrives, while the other leagues are still being fetched.
+    """
+    league_keys = LEAGUE_KEYS if league_keys is None else league_keys
+    for league_key, rows, error in http_client.iter_concurrently("oddsapi", fetch_league_rows, league_keys):
+        if error is not None:
+            print(f"[!] Fetch failed for {league_key}: {error}")
+            continue
+        yield rows
+
+def _league_request(league_key, stream=False):
     params = {
         "apiKey": ODDS_API_KEY,
         "regions": REGIONS,
         "markets": MARKETS,
         "oddsFormat": "decimal"
     }
-
+    response = http_client.request(
+        "oddsapi", "GET", f"{BASE_URL}/{league_key}/odds", cost=REQUEST_COST, params=params, stream=stream
+    )
     try:
-        response = requests.get(url, params=params)
         response.raise_for_status()
+    except requests.HTTPError:
+        response.close()
+        raise
+    return response
+
+def fetch_league_payload(league_key):
+    try:
+        return _league_request(league_key).json()
     except requests.RequestException as e:
         print(f"[!] Request failed for {league_key}: {e}")
         return []
 
-    raw_data = response.json()
-    parsed_matches = []
+def fetch_league_rows(league_key):
+    """
+    Fetch one league and parse it into [(MatchRow, [SnapshotRow, ...])], reading
+    the events off the response stream one at a time instead of decoding the
+    whole payload first.
+    """
+    try:
+        return list(build_rows(iter_items(_league_request(league_key, stream=True))))
+    except (requests.RequestException, ValueError) as e:
+        print(f"[!] Request failed for {league_key}: {e}")
+        return []
+
+def fetch_odds_for_league(league_key, db: Session):
+    return [add_rows(db, match_row, snapshot_rows, resolver=resolver)
+            for match_row, snapshot_rows in fetch_league_rows(league_key)]
+
+def parse_league_payload(raw_data, db: Session):
+    return [add_rows(db, match_row, snapshot_rows, resolver=resolver) for match_row, snapshot_rows in build_rows(raw_data)]
 
+def build_rows(raw_data):
+    """
+    Yield (MatchRow, [SnapshotRow, ...]) per event in an OddsAPI league payload.
+    """
     for match_data in raw_data:
         match_id = match_data.get("id")
-        commence_time = datetime.fromisoformat(match_data["commence_time"].replace("Z", "+00:00"))
+        commence_time = parse_iso_utc(match_data["commence_time"])
         home_team = match_data.get("home_team")
         away_team = [team for team in match_data["teams"] if team != home_team][0]
         league = match_data.get("sport_key")
 
-        # Check if match already exists
-        match = db.query(Match).filter_by(match_id=match_id).first()
-        if not match:
-            match = Match(
-                match_id=match_id,
-                home_team=home_team,
-                away_team=away_team,
-                league=league,
-                commence_time=commence_time
-            )
-            db.add(match)
-            db.flush()  # ensure match_id is available
+        match_row = MatchRow(
+            match_id=match_id,
+            home_team=home_team,
+            away_team=away_team,
+            league=league,
+            commence_time=commence_time,
+            source="oddsapi"
+        )
+        snapshot_rows = []
 
         for bookmaker in match_data.get("bookmakers", []):
-            bk_title = bookmaker.get("title")
+            bk_title = oddsapi_bookmaker(bookmaker.get("title"))
             timestamp = datetime.utcnow()
 
             for market in bookmaker.get("markets", []):
@@ -97,17 +174,16 @@ def fetch_odds_for_league(league_key, db: Session):
                         elif name == "draw":
                             d = price
 
-                    snapshot = OddsSnapshot(
+                    snapshot_rows.append(SnapshotRow(
                         id=str(uuid4()),
-                        match_id=match.match_id,
+                        match_id=match_id,
                         timestamp=timestamp,
                         bookmaker=bk_title,
                         market="1X2",
                         home=h,
                         draw=d,
                         away=a
-                    )
-                    db.add(snapshot)
+                    ))
 
                 elif market_type == "totals":
                     over = under = total_line = None
@@ -119,18 +195,15 @@ def fetch_odds_for_league(league_key, db: Session):
                             under = outcome["price"]
                             total_line = outcome["point"]
 
-                    snapshot = OddsSnapshot(
+                    snapshot_rows.append(SnapshotRow(
                         id=str(uuid4()),
-                        match_id=match.match_id,
+                        match_id=match_id,
                         timestamp=timestamp,
                         bookmaker=bk_title,
                         market="Over/Under",
                         total_line=total_line,
                         over=over,
                         under=under
-                    )
-                    db.add(snapshot)
-
-        parsed_matches.append(match)
+                    ))
 
-    return parsed_matches
+        yield match_row, snapshot_rows
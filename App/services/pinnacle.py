@@ -1,13 +1,18 @@
 import os
+import threading
+import time
 import requests
 from requests.auth import HTTPBasicAuth
-from datetime import datetime
+from datetime import datetime, timedelta
 from uuid import uuid4
 
 from sqlalchemy.orm import Session
 from app.db.session import get_db
-from app.models.match import Match
-from app.models.odds import OddsSnapshot
+from app.db.bulk import MatchRow, SnapshotRow, SnapshotBatch, add_rows
+from app.services import http_client
+from app.services.matching import resolver
+from app.utils.helpers import parse_iso_utc
+from app.utils.jsonstream import iter_paths
 
 PINNACLE_USERNAME = os.getenv("PINNACLE_USERNAME")
 PINNACLE_PASSWORD = os.getenv("PINNACLE_PASSWORD")
@@ -15,98 +20,305 @@ PINNACLE_PASSWORD = os.getenv("PINNACLE_PASSWORD")
 BASE_URL = "https://api.pinnacle.com/v1/"
 auth = HTTPBasicAuth(PINNACLE_USERNAME, PINNACLE_PASSWORD)
 
+TARGET_LEAGUES = {
+    "brazil - serie b", "brazil - serie c",
+    "argentina - primera b nacional",
+    "iran - persian gulf pro league",
+    "nigeria - pfl", "south africa - psl",
+    "kenya - premier league", "ghana - premier league",
+    "zimbabwe - premier league"
+}
+
+# League ids hardly ever change, resolve them once a day
+LEAGUES_TTL = float(os.getenv("PINNACLE_LEAGUES_TTL", 86400))
+# Drop the `since` cursors and take a full snapshot this often, so a missed delta cannot linger
+FULL_REFRESH_SECONDS = float(os.getenv("PINNACLE_FULL_REFRESH_SECONDS", 3600))
+# Events are kept in the delta state until this long after kickoff
+EVENT_RETENTION = timedelta(hours=3)
+
+# What a streamed fixtures/odds response is read as: the cursor, then one league at a time
+STREAM_PATHS = ("last", "league.item", "leagues.item")
+
+_league_cache = {}
+_league_lock = threading.Lock()
+
+def _json_or_none(res):
+    # Pinnacle answers a `since` request with an empty body when nothing changed
+    return res.json() if res.content else None
+
 def get_leagues(sport_id=29):
-    res = requests.get(f"{BASE_URL}leagues?sportId={sport_id}", auth=auth)
+    res = http_client.request("pinnacle", "GET", f"{BASE_URL}leagues?sportId={sport_id}", auth=auth)
     res.raise_for_status()
     return res.json()
 
-def get_fixtures(sport_id=29, league_ids=[]):
+def _payload(url, stream):
+    # stream=True yields ("last", cursor) and ("league(s).item", league) pairs as the body is read
+    res = http_client.request("pinnacle", "GET", url, auth=auth, stream=stream)
+    try:
+        res.raise_for_status()
+    except requests.HTTPError:
+        res.close()
+        raise
+    return iter_paths(res, STREAM_PATHS) if stream else _json_or_none(res)
+
+def get_fixtures(sport_id=29, league_ids=[], since=None, stream=False):
     league_param = ",".join(map(str, league_ids))
     url = f"{BASE_URL}fixtures?sportId={sport_id}&leagueIds={league_param}"
-    res = requests.get(url, auth=auth)
-    res.raise_for_status()
-    return res.json()
+    if since is not None:
+        url += f"&since={since}"
+    return _payload(url, stream)
 
-def get_odds(sport_id=29, league_ids=[]):
+def get_odds(sport_id=29, league_ids=[], since=None, stream=False):
     league_param = ",".join(map(str, league_ids))
     url = f"{BASE_URL}odds?sportId={sport_id}&leagueIds={league_param}&oddsFormat=DECIMAL"
-    res = requests.get(url, auth=auth)
-    res.raise_for_status()
-    return res.json()
+    if since is not None:
+        url += f"&since={since}"
+    return _payload(url, stream)
+
+def resolve_league_ids(sport_id=29, names=TARGET_LEAGUES, max_age=LEAGUES_TTL):
+    """
+    Ids of the target leagues, cached for `max_age` seconds.
+    """
+    key = (sport_id, frozenset(names))
+    with _league_lock:
+        cached = _league_cache.get(key)
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+
+    leagues = get_leagues(sport_id)
+    league_ids = [l["id"] for l in leagues if l["name"].lower() in names]
+    with _league_lock:
+        _league_cache[key] = (time.monotonic(), league_ids)
+    return league_ids
+
+def invalidate_leagues():
+    with _league_lock:
+        _league_cache.clear()
+
+def _leagues(payload):
+    # Fixtures list leagues under "league", odds under "leagues"
+    if not payload:
+        return []
+    return payload.get("leagues", payload.get("league", []))
+
+
+class PinnacleFeed:
+    """
+    In-memory fixtures and odds state kept current from Pinnacle's `since`
+    deltas. Each endpoint remembers its own `last` cursor; a poll merges the
+    changes and returns rows for the changed events only.
+    """
+
+    ENDPOINTS = {"fixtures": get_fixtures, "odds": get_odds}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.league_ids = None
+        self.cursors = {}
+        self.refreshed_at = time.monotonic()
+        self.league_names = {}
+        self.fixtures = {}  # event id -> fixture
+        self.periods = {}   # event id -> {period number: period}
+
+    def merge_fixtures(self, payload):
+        return set().union(*(self.merge_fixture_league(league) for league in _leagues(payload)))
+
+    def merge_odds(self, payload):
+        return set().union(*(self.merge_odds_league(league) for league in _leagues(payload)))
 
-def fetch_pinnacle_data():
+    def merge_fixture_league(self, league):
+        changed = set()
+        if league.get("name"):
+            self.league_names[league["id"]] = league["name"]
+        for fixture in league.get("events", []):
+            self.fixtures[fixture["id"]] = {**self.fixtures.get(fixture["id"], {}), **fixture, "league_id": league["id"]}
+            changed.add(fixture["id"])
+        return changed
+
+    def merge_odds_league(self, league):
+        changed = set()
+        if league.get("name"):
+            self.league_names[league["id"]] = league["name"]
+        for event in league.get("events", []):
+            periods = self.periods.setdefault(event["id"], {})
+            for period in event.get("periods", []):
+                # A delta carries only the markets that moved within the period
+                periods.setdefault(period.get("number", 0), {}).update(period)
+            changed.add(event["id"])
+        return changed
+
+    def fetch(self, endpoint, league_ids, since):
+        """
+        Stream one endpoint's changes into the state, league by league.
+        Returns (changed event ids, the response's `last` cursor).
+        """
+        merge = self.merge_fixture_league if endpoint == "fixtures" else self.merge_odds_league
+        changed, last = set(), None
+        for path, value in self.ENDPOINTS[endpoint](league_ids=league_ids, since=since, stream=True):
+            if path == "last":
+                last = value
+                continue
+            with self.lock:
+                changed |= merge(value)
+        return changed, last
+
+    def poll(self, league_ids):
+        """
+        Fetch fixtures and odds changes since the last poll and return
+        [(MatchRow, [SnapshotRow, ...])] for every event they touched.
+        """
+        with self.lock:
+            if league_ids != self.league_ids or time.monotonic() - self.refreshed_at >= FULL_REFRESH_SECONDS:
+                self.reset()
+                self.league_ids = league_ids
+            cursors = dict(self.cursors)
+
+        # Fixtures and odds are independent requests, fetch them side by side. A failure
+        # leaves the state half merged, callers reset() the feed when poll raises.
+        results = http_client.run_concurrently(
+            "pinnacle",
+            lambda endpoint: self.fetch(endpoint, league_ids, cursors.get(endpoint)),
+            list(self.ENDPOINTS),
+        )
+        for _, _, error in results:
+            if error is not None:
+                raise error
+
+        with self.lock:
+            changed = set()
+            for endpoint, (endpoint_changed, last), _ in results:
+                changed |= endpoint_changed
+                if last is not None:
+                    self.cursors[endpoint] = last
+            self.prune()
+
+            rows = []
+            timestamp = datetime.utcnow()
+            for event_id in changed:
+                fixture = self.fixtures.get(event_id)
+                period = self.periods.get(event_id, {}).get(0)
+                if not fixture or not period:
+                    continue
+                rows.append(event_rows(fixture, self.league_names.get(fixture["league_id"]), period, timestamp))
+            return rows
+
+    def prune(self):
+        cutoff = datetime.utcnow() - EVENT_RETENTION
+        for event_id in [i for i, f in self.fixtures.items() if parse_iso_utc(f["starts"]) < cutoff]:
+            self.fixtures.pop(event_id, None)
+            self.periods.pop(event_id, None)
+
+
+feed = PinnacleFeed()
+
+def target_league_ids(owns=None):
+    """
+    resolve_league_ids for the TARGET_LEAGUES `owns` accepts (all of them without it).
+    """
+    if owns is None:
+        return resolve_league_ids()
+    names = {name for name in TARGET_LEAGUES if owns(name)}
+    # An empty leagueIds filter would return every league of the sport
+    return resolve_league_ids(names=names) if names else []
+
+def iter_rows(owns=None):
+    """
+    Yield the rows of every event changed since the last poll, as one list.
+    """
+    league_ids = target_league_ids(owns)
+    if not league_ids:
+        return
+    try:
+        yield feed.poll(league_ids)
+    except Exception:
+        # Re-sync from a full snapshot next time rather than trust a partial merge
+        feed.reset()
+        raise
+
+def fetch_pinnacle_data(batch: SnapshotBatch | None = None, owns=None):
     db: Session = next(get_db())
 
     try:
-        leagues = get_leagues()
-        league_ids = [l["id"] for l in leagues if l["name"].lower() in {
-            "brazil - serie b", "brazil - serie c",
-            "argentina - primera b nacional",
-            "iran - persian gulf pro league",
-            "nigeria - pfl", "south africa - psl",
-            "kenya - premier league", "ghana - premier league",
-            "zimbabwe - premier league"
-        }]
-
-        fixtures = get_fixtures(league_ids=league_ids)
-        odds_data = get_odds(league_ids=league_ids)
-
-        fixture_map = {f["id"]: f for f in fixtures["league"] for f in f["events"]}
-        for league in odds_data["league"]:
-            for event in league["events"]:
-                fixture = fixture_map.get(event["id"])
-                if not fixture:
-                    continue
+        league_ids = target_league_ids(owns)
+        rows = feed.poll(league_ids) if league_ids else []
 
-                home = fixture["home"]
-                away = fixture["away"]
-                start_time = datetime.fromisoformat(fixture["starts"].replace("Z", "+00:00"))
-                match_id = f"pinnacle_{event['id']}"
-
-                # Add match
-                match = db.query(Match).filter_by(match_id=match_id).first()
-                if not match:
-                    match = Match(
-                        match_id=match_id,
-                        home_team=home,
-                        away_team=away,
-                        commence_time=start_time,
-                        league=league["name"]
-                    )
-                    db.add(match)
-                    db.flush()
-
-                # Add markets
-                for market in event["periods"][0]["moneyline"], event["periods"][0].get("totals", []):
-                    if isinstance(market, dict):  # moneyline
-                        snapshot = OddsSnapshot(
-                            id=str(uuid4()),
-                            match_id=match.match_id,
-                            timestamp=datetime.utcnow(),
-                            bookmaker="Pinnacle",
-                            market="1X2",
-                            home=market.get("home"),
-                            draw=market.get("draw"),
-                            away=market.get("away")
-                        )
-                        db.add(snapshot)
-                    elif isinstance(market, list):  # totals
-                        for line in market:
-                            snapshot = OddsSnapshot(
-                                id=str(uuid4()),
-                                match_id=match.match_id,
-                                timestamp=datetime.utcnow(),
-                                bookmaker="Pinnacle",
-                                market="Over/Under",
-                                total_line=line.get("points"),
-                                over=line.get("over"),
-                                under=line.get("under")
-                            )
-                            db.add(snapshot)
+        for match_row, snapshot_rows in rows:
+            if batch is not None:
+                batch.add(match_row, snapshot_rows)
+            else:
+                add_rows(db, match_row, snapshot_rows, resolver=resolver)
 
         db.commit()
-        print("[✔] Pinnacle odds integrated.")
+        print(f"[✔] Pinnacle odds integrated ({len(rows)} changed events).")
 
     except Exception as e:
         db.rollback()
+        resolver.reset()
+        # Re-sync from a full snapshot next time rather than trust a partial merge
+        feed.reset()
         print(f"[!] Pinnacle API error: {e}")
+
+def build_rows(fixtures, odds_data):
+    """
+    Yield (MatchRow, [SnapshotRow, ...]) per event present in both fixtures and odds.
+    """
+    fixture_map = {f["id"]: f for f in _leagues(fixtures) for f in f["events"]}
+    league_names = {l["id"]: l.get("name") for l in _leagues(fixtures)}
+
+    for league in _leagues(odds_data):
+        league_name = league.get("name") or league_names.get(league["id"])
+        for event in league["events"]:
+            fixture = fixture_map.get(event["id"])
+            if not fixture:
+                continue
+            yield event_rows(fixture, league_name, event["periods"][0], datetime.utcnow())
+
+def event_rows(fixture, league_name, period, timestamp):
+    """
+    (MatchRow, [SnapshotRow, ...]) for one fixture and its full-game period.
+    """
+    home = fixture["home"]
+    away = fixture["away"]
+    start_time = parse_iso_utc(fixture["starts"])
+    match_id = f"pinnacle_{fixture['id']}"
+
+    match_row = MatchRow(
+        match_id=match_id,
+        home_team=home,
+        away_team=away,
+        league=league_name,
+        commence_time=start_time,
+        source="pinnacle"
+    )
+    snapshot_rows = []
+
+    # Add markets
+    for market in period.get("moneyline"), period.get("totals", []):
+        if isinstance(market, dict):  # moneyline
+            snapshot_rows.append(SnapshotRow(
+                id=str(uuid4()),
+                match_id=match_id,
+                timestamp=timestamp,
+                bookmaker="Pinnacle",
+                market="1X2",
+                home=market.get("home"),
+                draw=market.get("draw"),
+                away=market.get("away")
+            ))
+        elif isinstance(market, list):  # totals
+            for line in market:
+                snapshot_rows.append(SnapshotRow(
+                    id=str(uuid4()),
+                    match_id=match_id,
+                    timestamp=timestamp,
+                    bookmaker="Pinnacle",
+                    market="Over/Under",
+                    total_line=line.get("points"),
+                    over=line.get("over"),
+                    under=line.get("under")
+                ))
+
+    return match_row, snapshot_rows
@@ -0,0 +1,99 @@
+import argparse
+import json
+import socketserver
+import threading
+import time
+
+# Longest pause honoured between two recorded messages, in seconds (before speed-up)
+MAX_GAP = 5.0
+
+
+def load_recording(path):
+    """
+    Recorded stream messages, one JSON object per line (as written by
+    BetfairStream(record_path=...)). Only market change messages are replayed.
+    """
+    messages = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            message = json.loads(line)
+            if message.get("op") == "mcm":
+                messages.append(message)
+    return messages
+
+
+class ReplayHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks enough of the Exchange Stream protocol for BetfairStream: sends the
+    connection message, accepts any authentication, then answers the market
+    subscription by replaying the recording with its original pacing.
+    """
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\r\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        self.send({"op": "connection", "connectionId": f"replay-{threading.get_ident()}"})
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                request = json.loads(line)
+                op = request.get("op")
+                self.send({"op": "status", "id": request.get("id"), "statusCode": "SUCCESS", "connectionClosed": False})
+                if op == "marketSubscription":
+                    self.replay(request.get("id"), server.messages, server.speed)
+                    if not server.hold_open:
+                        return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def replay(self, subscription_id, messages, speed):
+        previous_pt = None
+        for message in messages:
+            pt = message.get("pt")
+            if speed > 0 and previous_pt is not None and pt is not None:
+                time.sleep(min(max(pt - previous_pt, 0) / 1000, MAX_GAP) / speed)
+            previous_pt = pt if pt is not None else previous_pt
+            self.send({**message, "id": subscription_id})
+
+
+class ReplayServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, messages, speed=1.0, hold_open=True):
+        super().__init__(address, ReplayHandler)
+        self.messages = messages
+        self.speed = speed
+        self.hold_open = hold_open
+
+
+def serve_in_background(path, host="127.0.0.1", port=0, speed=0, hold_open=False):
+    """
+    Start a replay server on a background thread. Returns (server, port);
+    call server.shutdown() when done. speed=0 replays without pauses.
+    """
+    server = ReplayServer((host, port), load_recording(path), speed=speed, hold_open=hold_open)
+    threading.Thread(target=server.serve_forever, name="stream-replay", daemon=True).start()
+    return server, server.server_address[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded Betfair Exchange Stream over local TCP")
+    parser.add_argument("recording")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed multiplier, 0 for no pauses")
+    args = parser.parse_args()
+
+    messages = load_recording(args.recording)
+    with ReplayServer((args.host, args.port), messages, speed=args.speed) as server:
+        print(f"[+] Replaying {len(messages)} messages on {args.host}:{args.port}")
+        server.serve_forever()
@@ -0,0 +1,106 @@
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from uuid import uuid4
+
+from app.tasks.monitor import run_monitoring
+
+# Finished jobs kept around for status polling
+JOB_HISTORY = 50
+
+
+class Job:
+    def __init__(self, kind):
+        self.id = str(uuid4())
+        self.kind = kind
+        self.status = "queued"  # queued -> running -> succeeded | failed
+        self.stage = None
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ("succeeded", "failed")
+
+    def enter_stage(self, name):
+        now = datetime.utcnow()
+        if self.stages:
+            self.stages[-1]["finished_at"] = now
+        self.stage = name
+        self.stages.append({"name": name, "started_at": now, "finished_at": None})
+
+    def to_dict(self):
+        iso = lambda value: value.isoformat() if value else None
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": [
+                {"name": s["name"], "started_at": iso(s["started_at"]), "finished_at": iso(s["finished_at"])}
+                for s in self.stages
+            ],
+            "result": self.result,
+            "error": self.error,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at)
+        }
+
+
+class MonitoringJobs:
+    """
+    Runs monitoring cycles on a single background worker. submit() is
+    single-flight: while a cycle is queued or running, further submissions
+    return that job instead of starting an overlapping cycle.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="monitor-job")
+        self.jobs = OrderedDict()
+        self.current = None
+        self.lock = threading.Lock()
+
+    def submit(self, **kwargs):
+        """
+        Returns (job, created). created is False when coalesced into a running job.
+        """
+        with self.lock:
+            if self.current is not None and not self.current.finished:
+                return self.current, False
+
+            job = Job("monitoring")
+            self.current = job
+            self.jobs[job.id] = job
+            while len(self.jobs) > JOB_HISTORY:
+                self.jobs.popitem(last=False)
+
+        self.executor.submit(self._run, job, kwargs)
+        return job, True
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _run(self, job, kwargs):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        try:
+            job.result = run_monitoring(progress=job.enter_stage, **kwargs)
+            job.status = "succeeded"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.utcnow()
+            if job.stages:
+                job.stages[-1]["finished_at"] = job.finished_at
+
+
+monitoring_jobs = MonitoringJobs()
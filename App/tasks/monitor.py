@@ -1,65 +1,417 @@
+import os
+import queue
+import threading
 import time
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from uuid import uuid4
 
-from app.services.odds_api import fetch_all_odds
+from app.services import odds_api, betfair_api, pinnacle
+from app.services.odds_api import fetch_odds_for_all_target_leagues
 from app.services.betfair_api import fetch_betfair_data
-from app.services.pinnacle_api import fetch_pinnacle_data
-from app.analyzer.analysis import analyze_matches
-from app.models.match import Match
-from app.models.alert import SuspicionAlert
-from app.services.notifier import notify_all
+from app.services.pinnacle import fetch_pinnacle_data
+from app.services.matching import CANONICAL_PROVIDERS, resolver
+from app.analyzer.analysis import analyze_matches, engine
+from app.models.match import Match, registry
+from app.models.alerts import SuspicionAlert
+from app.services.notifier import dispatcher
 from app.db.session import get_db
+from app.db.bulk import SnapshotBatch, _chunks, write_batch
+from app.db.delta import DeltaTracker
+from app.db.timeseries import hot_store
+from app.utils.cache import invalidate_responses
+from app.utils import metrics
+from app.services import http_client
 
-def run_monitoring():
-    print("🕵️‍♂️ Starting monitoring task...")
+# Last stored prices per (match, bookmaker, market), kept across cycles for delta storage
+delta_tracker = DeltaTracker()
+# Finished matches leaving the registry take their detector and delta state with them
+registry.on_evict(engine.forget)
+registry.on_evict(delta_tracker.forget)
+registry.on_evict(hot_store.forget)
 
-    db: Session = next(get_db())
+PROVIDERS = ("oddsapi", "betfair", "pinnacle")
+
+# Overlap fetching, persisting and analysing within a cycle (0 runs the stages one after another)
+PIPELINED = os.getenv("MONITOR_PIPELINED", "1") != "0"
+# Parsed payloads waiting to be written, and written batches waiting to be analysed
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 16))
+# The persist worker commits once it holds this many snapshots, or whenever its queue runs dry
+PERSIST_BATCH_ROWS = int(os.getenv("PERSIST_BATCH_ROWS", 5000))
+
+# Each yields lists of (MatchRow, [SnapshotRow, ...]), one per payload, as they arrive.
+# `owns`, when set, narrows a feed to the leagues of one shard (see app.tasks.shards).
+ROW_SOURCES = {
+    "oddsapi": lambda league_keys, owns: odds_api.iter_rows(league_keys),
+    "betfair": lambda league_keys, owns: betfair_api.iter_rows(owns=owns),
+    "pinnacle": lambda league_keys, owns: pinnacle.iter_rows(owns=owns),
+}
+
+def _load_matches(db: Session, match_ids) -> list[Match]:
+    """
+    The Match rows of `match_ids`, queried in chunks to stay under the DB's bound-parameter limit.
+    """
+    match_ids = list(match_ids)
+    return [match for chunk in _chunks(match_ids) for match in db.query(Match).filter(Match.match_id.in_(chunk))]
+
+
+def record_alerts(db: Session, alerts) -> int:
+    """
+    Store alerts for matches that have none yet, then queue their notifications.
+    Returns the number of new alerts.
+    """
+    return len(store_alerts(db, alerts))
+
+
+def _new_alert(alert) -> SuspicionAlert:
+    return SuspicionAlert(
+        id=str(uuid4()),
+        match_id=alert.match_id,
+        league=alert.league,
+        home_team=alert.home_team,
+        away_team=alert.away_team,
+        commence_time=alert.commence_time,
+        suspicious_draw=alert.suspicious_draw,
+        goal_line_shift=alert.goal_line_shift,
+        alert_sources=alert.alert_sources
+    )
+
+
+def store_alerts(db: Session, alerts, notify=True) -> list[SuspicionAlert]:
+    """
+    record_alerts, returning the stored alerts. The unique match_id of
+    suspicion_alerts decides between monitor processes alerting the same
+    match at once: the losers' inserts fail and are skipped. With `notify`
+    off, queuing the notifications is left to the caller.
+    """
+    alerts = list({alert.match_id: alert for alert in alerts}.values())
+    if not alerts:
+        return []
+    # Matches alerted in an earlier cycle, which are most of them, skip the insert altogether
+    existing = {
+        match_id
+        for chunk in _chunks([alert.match_id for alert in alerts])
+        for match_id in db.scalars(select(SuspicionAlert.match_id).where(SuspicionAlert.match_id.in_(chunk)))
+    }
+    pending = [alert for alert in alerts if alert.match_id not in existing]
+
+    new_alerts = [_new_alert(alert) for alert in pending]
+    db.add_all(new_alerts)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another process stored some of them in the meantime, insert one by one and keep the rest
+        db.rollback()
+        new_alerts = []
+        for alert in pending:
+            db_alert = _new_alert(alert)
+            db.add(db_alert)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                continue
+            new_alerts.append(db_alert)
+
+    if notify:
+        for db_alert in new_alerts:
+            dispatcher.enqueue(db_alert)
+    invalidate_responses()
+    return new_alerts
+
+
+def revise_alerts(db: Session, alerts):
+    """
+    Bring alerts stored earlier in the same cycle up to date with a later
+    analysis of their match, which has seen more providers. Notifications are
+    not sent again.
+    """
+    for alert in alerts:
+        db_alert = db.query(SuspicionAlert).filter_by(match_id=alert.match_id).first()
+        if db_alert is None:
+            continue
+        db_alert.suspicious_draw = alert.suspicious_draw
+        db_alert.goal_line_shift = alert.goal_line_shift
+        db_alert.alert_sources = alert.alert_sources
+    db.commit()
+    invalidate_responses()
+
+
+class CyclePipeline:
+    """
+    One monitoring cycle as a streaming pipeline. A fetch thread per provider
+    parses each payload as it arrives; a persist worker writes the rows in
+    batches on its own session; the calling thread analyses every written
+    batch and records its alerts while later fetches are still in flight.
+    Queues between the stages are bounded, so a slow stage holds back the
+    ones feeding it. An alert is notified once no provider that could still
+    add to it is fetching, so it carries what a sequential cycle's would.
+    """
+
+    def __init__(self, providers=PROVIDERS, league_keys=None, delta=None, timings=None, owns=None):
+        self.providers = [p for p in PROVIDERS if p in providers]
+        self.league_keys = league_keys
+        self.owns = owns
+        self.delta = delta
+        self.timings = timings if timings is not None else {}
+        self.parsed = queue.Queue(PIPELINE_QUEUE_SIZE)
+        self.written = queue.Queue(PIPELINE_QUEUE_SIZE)
+        # Providers whose end the persist worker has not reached yet
+        self.running = set(self.providers)
+        self.error = None
+        self.first_alert = None
+
+    def fetch(self, provider):
+        try:
+            with metrics.span(f"fetch_{provider}", self.timings):
+                for rows in ROW_SOURCES[provider](self.league_keys, self.owns):
+                    if rows:
+                        self.parsed.put((provider, rows))
+        except Exception as e:
+            print(f"[!] {provider} fetch failed: {e}")
+        finally:
+            self.parsed.put((provider, None))
+
+    def owned(self, match_row, running):
+        """
+        Whether an event can be written now. An event the resolver has not seen
+        waits for the providers ahead of it in CANONICAL_PROVIDERS, so the match
+        it creates belongs to the same provider as in a sequential cycle.
+        """
+        if resolver.canonical_id(match_row) is not None:
+            return True
+        ahead = CANONICAL_PROVIDERS[:CANONICAL_PROVIDERS.index(match_row.source)]
+        return not running.intersection(ahead)
+
+    def persist(self):
+        db: Session = next(get_db())
+        running = self.running
+        batch, held = SnapshotBatch(), []
+        try:
+            while running:
+                try:
+                    provider, rows = self.parsed.get(block=not len(batch))
+                except queue.Empty:
+                    batch = self.flush(db, batch)
+                    continue
+                if rows is None:
+                    running.discard(provider)
+                    rows, held = held, []
+                for match_row, snapshot_rows in rows:
+                    if self.owned(match_row, running):
+                        batch.add(match_row, snapshot_rows)
+                    else:
+                        held.append((match_row, snapshot_rows))
+                if len(batch.snapshots) >= PERSIST_BATCH_ROWS:
+                    batch = self.flush(db, batch)
+            self.flush(db, batch)
+        except Exception as e:
+            # Fails the cycle like a failed write, once everything has drained
+            if self.error is None:
+                self.error = e
+        finally:
+            # Fetch threads may be blocked on a full queue, let every one reach its end
+            while running:
+                provider, rows = self.parsed.get()
+                if rows is None:
+                    running.discard(provider)
+            db.close()
+            self.written.put(None)
+
+    def flush(self, db: Session, batch: SnapshotBatch) -> SnapshotBatch:
+        if len(batch) and self.error is None:
+            try:
+                with metrics.span("persist", self.timings):
+                    write_batch(db, batch, delta=self.delta, resolver=resolver)
+            except Exception as e:
+                # Later batches are dropped too, the cycle fails once everything has drained
+                self.error = e
+            else:
+                invalidate_responses()
+                self.written.put((batch.match_ids(), frozenset(self.running)))
+        return SnapshotBatch()
+
+    def run(self):
+        """
+        Returns (written match ids, alerts raised, new alerts stored).
+        """
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self.fetch, args=(provider,), name=f"fetch-{provider}", daemon=True)
+                   for provider in self.providers]
+        threads.append(threading.Thread(target=self.persist, name="persist", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        db: Session = next(get_db())
+        match_ids, alerts, stored, unsent = set(), {}, set(), set()
+        written = ()
+        try:
+            while (written := self.written.get()) is not None:
+                ids, fetching = written
+                match_ids.update(ids)
+                matches = _load_matches(db, ids)
+                with metrics.span("analyze", self.timings):
+                    found = analyze_matches(matches)
+                # A match fed by several providers is analysed once per batch carrying it:
+                # alert it the first time, then let later analyses refine the alert
+                fresh = [alert for alert in found if alert.match_id not in alerts]
+                revised = [
+                    alert for alert in found
+                    if alert.match_id in stored and _alert_flags(alert) != _alert_flags(alerts[alert.match_id])
+                ]
+                alerts.update((alert.match_id, alert) for alert in found)
+                with metrics.span("alerts", self.timings):
+                    new_alerts = store_alerts(db, fresh, notify=False) if fresh else []
+                    if revised:
+                        revise_alerts(db, revised)
+                stored.update(alert.match_id for alert in new_alerts)
+                unsent.update(alert.match_id for alert in new_alerts)
+                if not fetching:
+                    # Every provider is done, these alerts will not change any more this cycle
+                    self.notify(alerts, unsent)
+                if new_alerts and self.first_alert is None:
+                    self.first_alert = time.perf_counter() - started
+                    metrics.FIRST_ALERT_SECONDS.observe(self.first_alert)
+        finally:
+            if written is not None:
+                # Failed mid-cycle: keep draining so the workers can finish
+                while self.written.get() is not None:
+                    pass
+            for thread in threads:
+                thread.join()
+            # Stored alerts are never notified by a later cycle, send them even if this one failed
+            self.notify(alerts, unsent)
+            db.close()
+        if self.error is not None:
+            raise self.error
+        return match_ids, list(alerts.values()), len(stored)
+
+    @staticmethod
+    def notify(alerts, unsent):
+        """
+        Queue the notifications of the stored alerts in `unsent`, with their
+        latest analysis.
+        """
+        for match_id in sorted(unsent):
+            dispatcher.enqueue(alerts[match_id])
+        unsent.clear()
+
+
+def _alert_flags(alert):
+    return alert.suspicious_draw, alert.goal_line_shift, sorted(alert.alert_sources or [])
+
+
+def _sequential_cycle(db: Session, bulk, delta, stage, providers, league_keys, owns=None):
+    """
+    The stages one after another: fetch every provider, persist, analyze, alert.
+    """
+    batch = SnapshotBatch() if bulk else None
 
     # 1. Fetch matches and odds
-    matches: list[Match] = fetch_all_odds()
+    matches: list[Match] = []
+    if "oddsapi" in providers:
+        with stage("fetch_oddsapi"):
+            matches = fetch_odds_for_all_target_leagues(batch=batch, league_keys=league_keys)
 
     # 2. Optional: enrich data with Betfair, Pinnacle
-    betfair_info = fetch_betfair_data()
-    pinnacle_info = fetch_pinnacle_data()
-
-    # Enrich odds_snapshots (assumes odds_snapshots already include bookmaker field)
-    for match in matches:
-        for snapshot in match.odds_snapshots:
-            if snapshot.bookmaker.lower() in ["betfair", "pinnacle"]:
-                continue  # Already attributed
-            if snapshot.bookmaker in betfair_info:
-                snapshot.bookmaker = "Betfair"
-            elif snapshot.bookmaker in pinnacle_info:
-                snapshot.bookmaker = "Pinnacle"
+    if "betfair" in providers:
+        with stage("fetch_betfair"):
+            fetch_betfair_data(batch=batch, owns=owns)
+    if "pinnacle" in providers:
+        with stage("fetch_pinnacle"):
+            fetch_pinnacle_data(batch=batch, owns=owns)
+
+    # Bulk mode: write the whole cycle in one transaction, then load what was written.
+    # Provider events are merged into one canonical match each, so every match
+    # carries all of its sources' snapshots (bookmaker names identify the source).
+    if batch is not None:
+        with stage("persist"):
+            write_batch(db, batch, delta=delta_tracker if delta else None, resolver=resolver)
+            invalidate_responses()
+            matches = _load_matches(db, batch.match_ids())
 
     # 3. Analyze suspicious patterns
-    alerts = analyze_matches(matches)
+    with stage("analyze"):
+        alerts = analyze_matches(matches)
+
+    with stage("alerts"):
+        new_alerts = record_alerts(db, alerts)
+    return {match.match_id for match in matches}, alerts, new_alerts
+
+
+def run_monitoring(bulk=True, delta=True, progress=None, providers=PROVIDERS, league_keys=None, profile=False,
+                   pipelined=PIPELINED, owns=None):
+    """
+    One fetch -> persist -> analyze -> alert cycle. `progress`, if given, is
+    called with the name of each stage as it starts. `providers` and
+    `league_keys` (OddsAPI sport keys) narrow the cycle to part of the feed;
+    `owns`, a predicate on league names of any provider, narrows every feed
+    to one shard's leagues.
+    In bulk mode the stages overlap through a CyclePipeline unless
+    `pipelined` is off. With `profile`, the cycle runs under the sampling
+    profiler and its collapsed stacks are written to MONITOR_PROFILE_DIR.
+    """
+    timings = {}
+    if owns is not None:
+        league_keys = [key for key in (odds_api.LEAGUE_KEYS if league_keys is None else league_keys) if owns(key)]
+
+    def stage(name):
+        if progress:
+            progress(name)
+        return metrics.span(name, timings)
+
+    profiler = metrics.SamplingProfiler().start() if profile else None
+    print("🕵️‍♂️ Starting monitoring task...")
+    started = time.perf_counter()
+
+    db: Session = next(get_db())
+    http_client.reset_cycle_stats()
+    first_alert = None
+
+    try:
+        if bulk and pipelined:
+            if progress:
+                progress("pipeline")
+            pipeline = CyclePipeline(providers, league_keys, delta_tracker if delta else None, timings, owns)
+            match_ids, alerts, new_alerts = pipeline.run()
+            first_alert = pipeline.first_alert
+        else:
+            match_ids, alerts, new_alerts = _sequential_cycle(db, bulk, delta, stage, providers, league_keys, owns)
+        registry.evict_finished()
+        metrics.ALERTS_RAISED.inc(len(alerts))
+        metrics.ALERTS_STORED.inc(new_alerts)
+    finally:
+        db.close()
+        metrics.CYCLE_SECONDS.observe(time.perf_counter() - started)
+        profile_path = None
+        if profiler is not None:
+            profiler.stop()
+            profile_path = profiler.write()
+            hottest = ", ".join(f"{name} {share:.0%}" for name, share in profiler.top(5))
+            print(f"[+] Profile of {profiler.samples} samples written to {profile_path} (top: {hottest})")
 
     if alerts:
         print(f"🚨 Found {len(alerts)} suspicious fixtures")
     else:
         print("✅ No suspicious activity detected.")
+    if first_alert is not None:
+        print(f"[+] First new alert {first_alert:.2f}s into the cycle")
 
-    for alert in alerts:
-        # Avoid duplicates
-        existing = db.query(SuspicionAlert).filter_by(match_id=alert.match_id).first()
-        if existing:
-            continue
+    memory = hot_store.memory_report()
+    if memory:
+        points = sum(m["points"] for m in memory.values())
+        kib = sum(m["bytes"] for m in memory.values()) / 1024
+        print(f"[+] Hot store: {len(memory)} matches, {points} price points, {kib:.0f} KiB "
+              f"({kib / len(memory):.1f} KiB per match)")
 
-        db_alert = SuspicionAlert(
-            id=str(uuid4()),
-            match_id=alert.match_id,
-            league=alert.league,
-            home_team=alert.home_team,
-            away_team=alert.away_team,
-            commence_time=alert.commence_time,
-            suspicious_draw=alert.suspicious_draw,
-            goal_line_shift=alert.goal_line_shift,
-            alert_sources=alert.alert_sources  
-        )
-
-        db.add(db_alert)
-        notify_all(db_alert)
-
-    db.commit()
+    requests_made = http_client.cycle_stats()
+    for provider, stats in requests_made.items():
+        if stats["requests"]:
+            quota = f", quota left {stats['quota_remaining']:.0f}" if stats["quota_remaining"] is not None else ""
+            print(f"[+] {provider}: {stats['requests']} requests ({stats['retries']} retries, "
+                  f"{stats['throttled']} throttled), avg {stats['latency_avg'] * 1000:.0f} ms, "
+                  f"cost {stats['cost']:.0f}{quota}")
+    print("[+] Stages: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+    return {"matches": len(match_ids), "alerts": len(alerts), "new_alerts": new_alerts, "requests": requests_made,
+            "stages": timings, "first_alert_seconds": first_alert, "profile": profile_path}
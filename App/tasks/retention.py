@@ -0,0 +1,189 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.db.bulk import SnapshotRow, CHUNK_SIZE
+from app.db.archive import ARCHIVE_DIR, write_archive
+from app.db.timeseries import MARKET_FIELDS, DEFAULT_FIELDS, hot_store
+from app.models.match import Match
+from app.models.odds import OddsSnapshot, OddsBar
+
+# Matches are compacted once they kicked off this long ago
+RETENTION_AFTER_KICKOFF = timedelta(days=int(os.getenv("RETENTION_DAYS_AFTER_KICKOFF", 14)))
+# A poll is kept when any price moved at least this much (relative) since the last kept poll
+SIGNIFICANT_MOVE = float(os.getenv("RETENTION_SIGNIFICANT_MOVE", 0.05))
+
+PRICE_FIELDS = ("home", "draw", "away", "over", "under")
+
+
+def _moved(previous, group, threshold):
+    before = {row.total_line: row for row in previous}
+    after = {row.total_line: row for row in group}
+    if set(before) != set(after):
+        return True  # a goal line was added or withdrawn
+    for line, row in after.items():
+        for field in PRICE_FIELDS:
+            old, new = getattr(before[line], field), getattr(row, field)
+            if (old is None) != (new is None):
+                return True
+            if old and new and abs(new - old) / old >= threshold:
+                return True
+    return False
+
+
+def downsample(rows, threshold=SIGNIFICANT_MOVE):
+    """
+    The polls worth keeping from a match's snapshots (sorted by timestamp):
+    per (bookmaker, market), the opening and closing poll and every poll that
+    moved a price by `threshold` or changed the quoted lines. Each kept poll's
+    last_seen is extended over the polls dropped after it.
+    """
+    polls = {}
+    for row in rows:
+        polls.setdefault((row.bookmaker, row.market), {}).setdefault(row.timestamp, []).append(row)
+
+    kept = []
+    for groups in polls.values():
+        timestamps = list(groups)
+        last = None
+        for i, timestamp in enumerate(timestamps):
+            group = groups[timestamp]
+            if last is None or i == len(timestamps) - 1 or _moved(kept[last[0]:last[1]], group, threshold):
+                last = (len(kept), len(kept) + len(group))
+                kept.extend(group)
+                continue
+            seen = max(row.last_seen or row.timestamp for row in group)
+            for k in range(*last):
+                if kept[k].last_seen is None or kept[k].last_seen < seen:
+                    kept[k] = kept[k]._replace(last_seen=seen)
+    kept.sort(key=lambda row: row.timestamp)
+    return kept
+
+
+def minute_bars(match_id, rows):
+    """
+    Per-minute OHLC of every price field, per (bookmaker, market).
+    """
+    bars = {}
+    for row in rows:
+        minute = row.timestamp.replace(second=0, microsecond=0)
+        for field in MARKET_FIELDS.get(row.market, DEFAULT_FIELDS):
+            value = getattr(row, field)
+            if value is None:
+                continue
+            key = (row.bookmaker, row.market, field, minute)
+            bar = bars.get(key)
+            if bar is None:
+                bars[key] = {
+                    "match_id": match_id, "bookmaker": row.bookmaker, "market": row.market, "field": field,
+                    "minute": minute, "open": value, "high": value, "low": value, "close": value, "points": 1,
+                }
+            else:
+                bar["high"] = max(bar["high"], value)
+                bar["low"] = min(bar["low"], value)
+                bar["close"] = value
+                bar["points"] += 1
+    return list(bars.values())
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def compact_match(db: Session, match: Match, root=ARCHIVE_DIR, dry_run=False) -> dict:
+    """
+    Archive a finished match's raw snapshots, then replace them with the
+    downsampled series and per-minute bars, in one transaction.
+    """
+    table = OddsSnapshot.__table__
+    rows = [
+        SnapshotRow(*row) for row in db.execute(
+            select(*(table.c[field] for field in SnapshotRow._fields))
+            .where(table.c.match_id == match.match_id)
+            .order_by(table.c.timestamp)
+        )
+    ]
+    kept = downsample(rows)
+    bars = minute_bars(match.match_id, rows)
+    stats = {"archived": len(rows), "kept": len(kept), "bars": len(bars)}
+    if dry_run:
+        return stats
+
+    try:
+        if rows:
+            write_archive(rows, match.league, match.commence_time.date(), match.match_id, root=root)
+            db.execute(delete(table).where(table.c.match_id == match.match_id))
+            for chunk in _chunks([row._asdict() for row in kept]):
+                db.execute(insert(table), chunk)
+            for chunk in _chunks(bars):
+                db.execute(insert(OddsBar.__table__), chunk)
+        match.archived_at = datetime.utcnow()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    hot_store.forget(match.match_id)
+    return stats
+
+
+def run_retention(older_than=RETENTION_AFTER_KICKOFF, root=ARCHIVE_DIR, limit=None, dry_run=False, vacuum=False):
+    """
+    Compact every match that kicked off more than `older_than` ago and has not
+    been archived yet. Returns totals over the run.
+    """
+    started = time.perf_counter()
+    db: Session = next(get_db())
+    totals = {"matches": 0, "archived": 0, "kept": 0, "bars": 0, "failed": 0}
+    try:
+        query = (
+            db.query(Match)
+            .filter(Match.commence_time < datetime.utcnow() - older_than, Match.archived_at.is_(None))
+            .order_by(Match.commence_time)
+        )
+        if limit:
+            query = query.limit(limit)
+
+        for match in query.all():
+            try:
+                stats = compact_match(db, match, root=root, dry_run=dry_run)
+            except Exception as e:
+                totals["failed"] += 1
+                print(f"[!] Retention failed for {match.match_id}: {e}")
+                continue
+            totals["matches"] += 1
+            for key, value in stats.items():
+                totals[key] += value
+
+        if vacuum and not dry_run and db.get_bind().dialect.name == "sqlite":
+            # Deleted pages are only returned to the filesystem by VACUUM
+            db.close()
+            with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.exec_driver_sql("VACUUM")
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    verb = "Would compact" if dry_run else "Compacted"
+    print(f"[✔] {verb} {totals['matches']} matches in {elapsed:.1f}s: {totals['archived']} snapshots archived, "
+          f"{totals['kept']} kept, {totals['bars']} minute bars ({totals['failed']} failed)")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive and downsample odds snapshots of finished matches")
+    parser.add_argument("--days", type=float, default=RETENTION_AFTER_KICKOFF.total_seconds() / 86400,
+                        help="compact matches that kicked off at least this many days ago")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--limit", type=int, help="at most this many matches per run")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be compacted, change nothing")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards (SQLite)")
+    args = parser.parse_args()
+
+    run_retention(timedelta(days=args.days), root=args.archive_dir, limit=args.limit,
+                  dry_run=args.dry_run, vacuum=args.vacuum)
@@ -0,0 +1,171 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.models.match import Match, registry
+from app.models.alerts import SuspicionAlert
+from app.services.odds_api import LEAGUE_KEYS
+from app.tasks.monitor import run_monitoring
+from app.utils.ratelimit import TokenBucket
+
+# (time to nearest kickoff, poll interval): the first tier the kickoff falls inside wins
+POLL_TIERS = [
+    (timedelta(minutes=30), timedelta(minutes=2)),
+    (timedelta(hours=2), timedelta(minutes=5)),
+    (timedelta(hours=6), timedelta(minutes=15)),
+    (timedelta(hours=24), timedelta(minutes=30)),
+]
+DISTANT_INTERVAL = timedelta(hours=2)
+IDLE_INTERVAL = timedelta(hours=3)  # nothing upcoming for this target
+# Matches keep being polled until this long after kickoff
+IN_PLAY_WINDOW = timedelta(hours=2)
+# Targets with a recent alert on an upcoming match are polled this much more often
+HOT_FACTOR = 0.5
+MIN_INTERVAL = timedelta(minutes=1)
+
+# Requests per hour each provider may spend on scheduled polls
+REQUEST_BUDGET_PER_HOUR = {
+    "oddsapi": float(os.getenv("ODDSAPI_REQUESTS_PER_HOUR", 60)),
+    "betfair": float(os.getenv("BETFAIR_REQUESTS_PER_HOUR", 360)),
+    "pinnacle": float(os.getenv("PINNACLE_REQUESTS_PER_HOUR", 120)),
+}
+# Requests one poll of a target costs (Pinnacle: fixtures + odds deltas, leagues are cached)
+REQUESTS_PER_POLL = {"oddsapi": 1, "betfair": 2, "pinnacle": 2}
+
+
+class PollTarget:
+    """
+    A unit of scheduled work: one OddsAPI league, or a whole Betfair/Pinnacle feed.
+    """
+
+    def __init__(self, provider, league_key=None):
+        self.provider = provider
+        self.league_key = league_key
+
+    @property
+    def name(self):
+        return f"{self.provider}:{self.league_key}" if self.league_key else self.provider
+
+    def match_filter(self):
+        if self.league_key:
+            return Match.league == self.league_key
+        return Match.source == self.provider
+
+    def run(self):
+        return run_monitoring(
+            providers=(self.provider,),
+            league_keys=[self.league_key] if self.league_key else None,
+        )
+
+
+def default_targets(league_keys=None):
+    targets = [PollTarget("oddsapi", key) for key in (LEAGUE_KEYS if league_keys is None else league_keys)]
+    targets += [PollTarget("betfair"), PollTarget("pinnacle")]
+    return targets
+
+
+def poll_interval(db: Session, target: PollTarget, now=None) -> timedelta:
+    """
+    Next poll interval for a target: tighter as its nearest kickoff approaches,
+    backed off for distant fixtures, shortened further when it has live alerts.
+    """
+    now = now or datetime.utcnow()
+    next_kickoff = _next_kickoff(db, target, now - IN_PLAY_WINDOW)
+    if next_kickoff is None:
+        return IDLE_INTERVAL
+
+    until_kickoff = max(next_kickoff - now, timedelta(0))
+    interval = next((step for horizon, step in POLL_TIERS if until_kickoff <= horizon), DISTANT_INTERVAL)
+
+    hot = (
+        db.query(SuspicionAlert.id)
+        .join(Match, Match.match_id == SuspicionAlert.match_id)
+        .filter(target.match_filter(), SuspicionAlert.commence_time >= now - IN_PLAY_WINDOW)
+        .first()
+    )
+    if hot:
+        interval = interval * HOT_FACTOR
+    return max(interval, MIN_INTERVAL)
+
+
+def _next_kickoff(db: Session, target: PollTarget, start):
+    # A league's fixtures come from the registry's league index when it holds them all
+    if target.league_key:
+        registry.ensure_warm(db)
+        if registry.covers(start):
+            return min((m.commence_time for m in registry.by_league(target.league_key)
+                        if m.commence_time >= start), default=None)
+    return (
+        db.query(func.min(Match.commence_time))
+        .filter(target.match_filter(), Match.commence_time >= start)
+        .scalar()
+    )
+
+
+class AdaptiveScheduler:
+    """
+    In-process poller with a priority queue keyed on each target's next poll
+    time. Intervals follow Match.commence_time via poll_interval, and every
+    poll must fit in its provider's hourly request budget; over-budget polls
+    are deferred until the budget refills.
+    """
+
+    def __init__(self, targets=None, budgets=REQUEST_BUDGET_PER_HOUR):
+        self.targets = targets if targets is not None else default_targets()
+        self.budgets = {
+            provider: TokenBucket(rate=per_hour / 3600.0, capacity=max(per_hour / 6, REQUESTS_PER_POLL[provider]))
+            for provider, per_hour in budgets.items()
+        }
+        self.queue = []
+        self.counter = itertools.count()
+        self.stopped = threading.Event()
+
+    def schedule(self, target, at):
+        heapq.heappush(self.queue, (at, next(self.counter), target))
+
+    def run_forever(self):
+        now = time.time()
+        for target in self.targets:
+            self.schedule(target, now)
+
+        while not self.stopped.is_set() and self.queue:
+            due, _, target = self.queue[0]
+            wait = due - time.time()
+            if wait > 0:
+                self.stopped.wait(wait)
+                continue
+            heapq.heappop(self.queue)
+
+            deferred = self.budgets[target.provider].try_acquire(REQUESTS_PER_POLL[target.provider])
+            if deferred > 0:
+                print(f"[~] {target.name} over request budget, deferring {deferred:.0f}s")
+                self.schedule(target, time.time() + deferred)
+                continue
+
+            print(f"[+] Polling {target.name}")
+            try:
+                target.run()
+            except Exception as e:
+                print(f"[!] Poll failed for {target.name}: {e}")
+
+            db: Session = next(get_db())
+            try:
+                interval = poll_interval(db, target)
+            finally:
+                db.close()
+            print(f"[+] Next poll of {target.name} in {interval}")
+            self.schedule(target, time.time() + interval.total_seconds())
+
+    def stop(self):
+        self.stopped.set()
+
+
+if __name__ == "__main__":
+    AdaptiveScheduler().run_forever()
@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import multiprocessing
+import os
+import queue
+import time
+from bisect import bisect_right
+
+from app.db.session import engine as db_engine
+from app.services import http_client
+from app.services.matching import league_region
+from app.services.notifier import dispatcher
+from app.services.odds_api import LEAGUE_KEYS
+from app.services.pinnacle import TARGET_LEAGUES
+from app.tasks.monitor import PROVIDERS, run_monitoring
+from app.utils import metrics
+
+# Worker processes a sharded monitor runs, one per core by default
+MONITOR_SHARDS = int(os.getenv("MONITOR_SHARDS", os.cpu_count() or 1))
+# Points per shard on the hash ring, more spread the leagues more evenly
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", 64))
+# Seconds between the starts of two sharded cycles
+SHARD_INTERVAL = float(os.getenv("MONITOR_SHARD_INTERVAL", 300))
+# Shard i serves its own Prometheus metrics on this port + i (0 turns them off)
+SHARD_METRICS_PORT = int(os.getenv("SHARD_METRICS_PORT", 9200))
+
+
+def _point(key):
+    # hash() is salted per process, shards must agree on where a key lands
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring: each node takes `vnodes` points on the ring and a key
+    belongs to the node of the first point at or after its hash. Adding or
+    removing a node only moves the keys of the arcs next to its points.
+    """
+
+    def __init__(self, nodes, vnodes=SHARD_VNODES):
+        ring = sorted((_point(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self.points = [point for point, _ in ring]
+        self.nodes = [node for _, node in ring]
+
+    def node_for(self, key):
+        return self.nodes[bisect_right(self.points, _point(key)) % len(self.points)]
+
+
+class Shard:
+    """
+    One of `count` monitor shards. Leagues are placed by region (league_region),
+    the one key OddsAPI, Betfair and Pinnacle agree on, so every provider's
+    events of a fixture land on the same shard and can still be merged there.
+    """
+
+    def __init__(self, index, count, vnodes=SHARD_VNODES):
+        self.index = index
+        self.count = count
+        self.name = f"shard-{index}"
+        self.ring = HashRing([f"shard-{i}" for i in range(count)], vnodes)
+
+    def owns(self, league):
+        return self.ring.node_for(league_region(league)) == self.name
+
+    def leagues(self):
+        """
+        The OddsAPI sport keys and Pinnacle league names this shard polls.
+        """
+        return [key for key in LEAGUE_KEYS if self.owns(key)], sorted(n for n in TARGET_LEAGUES if self.owns(n))
+
+
+def _shard_worker(index, count, commands, results):
+    """
+    Body of a shard process: run a monitoring cycle for each command until a
+    None arrives. The resolver, registry, detector, hot store and delta state
+    live here across cycles, as they do in a single monitor process, and so
+    do its metrics, served on a port of its own.
+    """
+    shard = Shard(index, count)
+    # Provider rate limits are per account, each shard gets its share
+    http_client.share_limits(count)
+    league_keys, pinnacle_leagues = shard.leagues()
+    print(f"[+] {shard.name} (pid {os.getpid()}) owns {len(league_keys)} OddsAPI leagues "
+          f"({', '.join(league_keys) or '-'}) and {len(pinnacle_leagues)} Pinnacle leagues")
+    if SHARD_METRICS_PORT:
+        try:
+            metrics.serve(SHARD_METRICS_PORT + index)
+            print(f"[+] {shard.name} metrics on port {SHARD_METRICS_PORT + index}")
+        except OSError as e:
+            print(f"[!] {shard.name} cannot serve metrics on port {SHARD_METRICS_PORT + index}: {e}")
+    try:
+        while (options := commands.get()) is not None:
+            try:
+                results.put((index, run_monitoring(owns=shard.owns, **options), None))
+            except Exception as e:
+                print(f"[!] {shard.name} cycle failed: {e}")
+                results.put((index, None, f"{type(e).__name__}: {e}"))
+    finally:
+        # Process workers skip atexit, deliver what is queued before leaving
+        dispatcher.stop(60)
+
+
+class ShardedMonitor:
+    """
+    Monitoring across `shards` worker processes, each owning the leagues the
+    hash ring gives it: their fetching, parsing, persisting and analysis run
+    on a core of its own. Alerts are de-duplicated across shards by the
+    unique match_id of suspicion_alerts. Several shards need a server
+    database: SQLite takes one writer at a time and fails the others with
+    "database is locked".
+    """
+
+    def __init__(self, shards=MONITOR_SHARDS):
+        if shards > 1 and db_engine.dialect.name == "sqlite":
+            raise RuntimeError(f"{shards} shards need a server database such as PostgreSQL "
+                               "(DATABASE_URL), SQLite allows a single writer")
+        self.shards = shards
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.commands = []
+        self.workers = []
+
+    def start(self):
+        for index in range(self.shards):
+            commands = self.context.Queue()
+            worker = self.context.Process(
+                target=_shard_worker, args=(index, self.shards, commands, self.results),
+                name=f"monitor-shard-{index}", daemon=True,
+            )
+            worker.start()
+            self.commands.append(commands)
+            self.workers.append(worker)
+        return self
+
+    def run_cycle(self, **options):
+        """
+        One run_monitoring cycle on every shard at once (`options` are passed
+        on, e.g. providers=("oddsapi",)). Returns the summed counts and each
+        shard's own result, or its error.
+        """
+        started = time.perf_counter()
+        for commands in self.commands:
+            commands.put(options)
+
+        shards = {}
+        while len(shards) < self.shards:
+            try:
+                index, result, error = self.results.get(timeout=1)
+            except queue.Empty:
+                dead = [w.name for i, w in enumerate(self.workers) if i not in shards and not w.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Shard processes exited mid-cycle: {', '.join(dead)}")
+                continue
+            shards[index] = {"error": error} if error else result
+
+        done = [result for result in shards.values() if "error" not in result]
+        summary = {
+            "matches": sum(result["matches"] for result in done),
+            "alerts": sum(result["alerts"] for result in done),
+            "new_alerts": sum(result["new_alerts"] for result in done),
+            "failed": len(shards) - len(done),
+            "seconds": time.perf_counter() - started,
+            "shards": [shards[index] for index in range(self.shards)],
+        }
+        print(f"[✔] Sharded cycle on {self.shards} shards in {summary['seconds']:.2f}s: {summary['matches']} matches, "
+              f"{summary['alerts']} alerts ({summary['new_alerts']} new), {summary['failed']} shards failed")
+        return summary
+
+    def run_forever(self, interval=SHARD_INTERVAL, cycles=None, **options):
+        ran = 0
+        while cycles is None or ran < cycles:
+            started = time.monotonic()
+            self.run_cycle(**options)
+            ran += 1
+            if cycles is None or ran < cycles:
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def stop(self, timeout=90):
+        for commands in self.commands:
+            commands.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                print(f"[!] {worker.name} did not stop, terminating it")
+                worker.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run monitoring cycles across processes sharded by league")
+    parser.add_argument("--shards", type=int, default=MONITOR_SHARDS)
+    parser.add_argument("--interval", type=float, default=SHARD_INTERVAL, help="seconds between cycle starts")
+    parser.add_argument("--cycles", type=int, help="stop after this many cycles (default: run forever)")
+    parser.add_argument("--providers", default=",".join(PROVIDERS), help=f"comma-separated, from {', '.join(PROVIDERS)}")
+    args = parser.parse_args()
+
+    monitor = ShardedMonitor(args.shards).start()
+    try:
+        monitor.run_forever(args.interval, args.cycles, providers=tuple(args.providers.split(",")))
+    except KeyboardInterrupt:
+        print("[~] Stopping shards")
+    finally:
+        monitor.stop()
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", 15))
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", 1024))
+
+CacheEntry = namedtuple("CacheEntry", ["body", "mimetype", "etag", "last_modified", "expires"])
+
+
+class ResponseCache:
+    """
+    In-process TTL cache of rendered response bodies keyed by request path.
+
+    ETags are content hashes, so an entry recomputed after expiry or
+    invalidation keeps its ETag and Last-Modified when nothing changed.
+    """
+
+    def __init__(self, ttl=API_CACHE_TTL, max_entries=API_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry.expires <= time.monotonic():
+            return None
+        return entry
+
+    def put(self, key, body: bytes, mimetype="application/json"):
+        etag = hashlib.sha1(body).hexdigest()
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None and previous.etag == etag:
+                last_modified = previous.last_modified
+            else:
+                last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+            if previous is None and len(self.entries) >= self.max_entries:
+                self._evict()
+            entry = CacheEntry(body, mimetype, etag, last_modified, time.monotonic() + self.ttl)
+            self.entries[key] = entry
+        return entry
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self.entries.items() if entry.expires <= now]:
+            del self.entries[key]
+        while len(self.entries) >= self.max_entries:
+            del self.entries[next(iter(self.entries))]
+
+    def invalidate(self):
+        """
+        Expire every entry. Bodies, ETags and Last-Modified are kept so that an
+        unchanged recomputation still answers 304.
+        """
+        with self.lock:
+            self.entries = {key: entry._replace(expires=0) for key, entry in self.entries.items()}
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_responses():
+    response_cache.invalidate()
@@ -0,0 +1,12 @@
+from datetime import datetime, timezone
+
+
+def parse_iso_utc(value: str) -> datetime:
+    """
+    Parse a provider ISO-8601 timestamp ("...Z" or with offset) into a naive UTC
+    datetime, matching the datetime.utcnow() values stored alongside it.
+    """
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
@@ -0,0 +1,118 @@
+import itertools
+import json
+import os
+import zlib
+
+try:
+    import ijson
+except ImportError:  # without ijson, bodies are decoded whole with the json module
+    ijson = None
+
+# Parse provider payloads incrementally when ijson is installed (0 decodes them whole)
+STREAM_JSON = os.getenv("STREAM_JSON", "1") != "0"
+READ_CHUNK = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+DECODE_ERRORS = (ValueError, zlib.error) + ((ijson.JSONError,) if ijson is not None else ())
+
+
+class PayloadError(ValueError):
+    """
+    A response body that is not valid (gzipped) JSON.
+    """
+
+
+def body_chunks(response, chunk_size=READ_CHUNK):
+    """
+    Decoded body of a streamed response, chunk by chunk. requests undoes the
+    Content-Encoding; a gzip body served without that header is inflated here.
+    """
+    chunks = (chunk for chunk in response.iter_content(chunk_size) if chunk)
+    first = next(chunks, b"")
+    if first[:2] != GZIP_MAGIC:
+        if first:
+            yield first
+            yield from chunks
+        return
+
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in itertools.chain([first], chunks):
+        data = inflater.decompress(chunk)
+        if data:
+            yield data
+    data = inflater.flush()
+    if data:
+        yield data
+
+
+class _ChunkReader:
+    """
+    The read() ijson needs, over an iterator of non-empty byte chunks.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def read(self, size=-1):
+        if size == 0:  # ijson probes the type of the source with read(0)
+            return b""
+        return next(self.chunks, b"")
+
+
+def _walk(node, prefix, paths):
+    if prefix in paths:
+        yield prefix, node
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            yield from _walk(value, f"{prefix}.{key}" if prefix else key, paths)
+    elif isinstance(node, list):
+        item = f"{prefix}.item" if prefix else "item"
+        for value in node:
+            yield from _walk(value, item, paths)
+
+
+def iter_paths(response, paths):
+    """
+    Yield (path, value) for each value of a streamed JSON response found at one
+    of `paths`, in document order. Paths are ijson prefixes: "item" for the
+    elements of a top-level array, "leagues.item" for those of a "leagues"
+    array, "last" for a top-level key. Only the values yielded are built in
+    memory; without ijson (or with STREAM_JSON=0) the body is decoded whole.
+    """
+    paths = set(paths)
+    try:
+        chunks = body_chunks(response)
+        first = next(chunks, None)
+        if first is None:
+            return  # empty body, e.g. nothing changed since the last poll
+        chunks = itertools.chain([first], chunks)
+
+        if ijson is None or not STREAM_JSON:
+            yield from _walk(json.loads(b"".join(chunks)), "", paths)
+            return
+
+        building = builder = None
+        for prefix, event, value in ijson.parse(_ChunkReader(chunks), use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == building and event in ("end_map", "end_array"):
+                    yield building, builder.value
+                    builder = None
+            elif prefix in paths:
+                if event in ("start_map", "start_array"):
+                    building, builder = prefix, ijson.ObjectBuilder()
+                    builder.event(event, value)
+                else:
+                    yield prefix, value
+    except DECODE_ERRORS as e:
+        raise PayloadError(f"Invalid JSON payload from {response.url}: {e}") from e
+    finally:
+        response.close()
+
+
+def iter_items(response, prefix="item"):
+    """
+    Elements of the array at `prefix` of a streamed JSON response, one at a time.
+    """
+    for _, value in iter_paths(response, (prefix,)):
+        yield value
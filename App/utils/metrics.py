@@ -0,0 +1,254 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Seconds between stack samples of a profiled cycle
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+# Collapsed stacks of profiled cycles are written here
+PROFILE_DIR = os.getenv("MONITOR_PROFILE_DIR", tempfile.gettempdir())
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = {key: self._copy(value) for key, value in self.values.items()}
+        for key, value in sorted(values.items()):
+            lines += self._samples(key, value)
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    """
+    Cumulative-bucket histogram in the Prometheus sense: per label set, a count
+    per bucket upper bound plus the total count and sum of observations.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _copy(value):
+        return list(value[0]), value[1]
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labels, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def counter(name, help, labels=()):
+    metric = Counter(name, help, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def render() -> str:
+    """
+    Every metric in the Prometheus text exposition format.
+    """
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Expose this process's metrics over HTTP on `port` from a daemon thread,
+    for processes without the Flask app's /metrics route (monitor shards).
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+    return server
+
+
+CYCLE_SECONDS = histogram("odds_monitor_cycle_seconds", "Duration of whole monitoring cycles")
+STAGE_SECONDS = histogram("odds_monitor_stage_seconds", "Duration of monitoring cycle stages", ["stage"])
+PROVIDER_REQUESTS = counter("odds_provider_requests_total", "Provider HTTP requests by response status", ["provider", "status"])
+PROVIDER_REQUEST_SECONDS = histogram("odds_provider_request_seconds", "Provider HTTP request latency", ["provider"])
+PROVIDER_BYTES = counter("odds_provider_response_bytes_total", "Bytes downloaded from providers", ["provider"])
+PROVIDER_RETRIES = counter("odds_provider_retries_total", "Provider requests retried after 429/5xx or a connection error", ["provider"])
+DB_WRITE_SECONDS = histogram("odds_db_write_seconds", "Duration of bulk write transactions")
+MATCHES_WRITTEN = counter("odds_matches_written_total", "Match rows written", ["kind"])
+SNAPSHOTS_WRITTEN = counter("odds_snapshots_written_total", "Snapshots inserted, or heartbeated when unchanged", ["kind"])
+ALERTS_RAISED = counter("odds_alerts_raised_total", "Suspicious matches found by analysis")
+ALERTS_STORED = counter("odds_alerts_stored_total", "New alerts stored")
+FIRST_ALERT_SECONDS = histogram("odds_monitor_first_alert_seconds", "Time from cycle start to its first new alert")
+NOTIFY_SECONDS = histogram("odds_notify_seconds", "Time to deliver one batch of notifications", ["channel"])
+NOTIFICATIONS = counter("odds_notifications_total", "Notification deliveries (a message, or an SMTP batch) by outcome", ["channel", "outcome"])
+
+
+@contextmanager
+def span(stage, timings=None):
+    """
+    Time a block of a monitoring cycle into STAGE_SECONDS, and into
+    timings[stage] when a dict is given.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread each `interval` seconds through
+    sys._current_frames() and counts them as collapsed stacks
+    ("thread;outer;...;inner"), the input of flamegraph.pl and speedscope.
+    Cheap enough to leave on for a single cycle.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = StackCounter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, n=10):
+        """
+        The `n` functions most often on top of a sampled stack, with their share of samples.
+        """
+        leaves = StackCounter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(name, count / total) for name, count in leaves.most_common(n)]
+
+    def write(self, path=None):
+        path = path or os.path.join(PROFILE_DIR, f"monitor-{datetime.utcnow():%Y%m%dT%H%M%S}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
@@ -0,0 +1,52 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity` banked.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens if available. Returns 0 on success, otherwise the seconds to
+        wait before they will be.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        while (wait := self.try_acquire(tokens)) > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Drain the bucket so no tokens are available for `seconds` (e.g. Retry-After).
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with full jitter for retry number `attempt` (0-based).
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,201 @@
+import random
+from datetime import datetime, timedelta
+
+from app.services.odds_api import LEAGUE_KEYS
+
+# (OddsAPI sport key, Betfair country code, Pinnacle league name) of the target leagues
+LEAGUES = [
+    ("soccer_brazil_serieb", "BR", "Brazil - Serie B"),
+    ("soccer_brazil_seriec", "BR", "Brazil - Serie C"),
+    ("soccer_argentina_primera_b_nacional", "AR", "Argentina - Primera B Nacional"),
+    ("soccer_iran_persian_gulf_pro_league", "IR", "Iran - Persian Gulf Pro League"),
+    ("soccer_nigeria_pfl", "NG", "Nigeria - PFL"),
+    ("soccer_south_africa_psl", "ZA", "South Africa - PSL"),
+    ("soccer_kenya_premier_league", "KE", "Kenya - Premier League"),
+    ("soccer_ghana_premier_league", "GH", "Ghana - Premier League"),
+    ("soccer_zimbabwe_premier_league", "ZW", "Zimbabwe - Premier League"),
+]
+assert [key for key, _, _ in LEAGUES] == LEAGUE_KEYS
+
+TOWNS = [
+    "Novorizontino", "Ferroviária", "Botafogo", "Guarani", "Ituano", "Londrina", "Vila Nova", "Mirassol",
+    "Sampaio Corrêa", "Operário", "Chapecoense", "Avaí", "Ponte Preta", "Tombense", "Criciúma", "Juventude",
+    "Esteghlal", "Persepolis", "Sepahan", "Tractor", "Enyimba", "Rivers United", "Kano Pillars", "Plateau",
+    "Orlando", "Kaizer", "Sundowns", "Stellenbosch", "Gor Mahia", "Tusker", "Hearts", "Kotoko", "Dynamos",
+]
+DRAW_DROP = 0.25  # share of the draw price removed when a match is made to alert
+
+
+class SyntheticFeed:
+    """
+    N leagues x M matches x K bookmakers of made-up fixtures, served in the
+    shape of OddsAPI, Betfair and Pinnacle responses. The same fixtures appear
+    under every provider (team names spelled slightly differently), so a full
+    cycle also exercises match resolution. advance() moves prices like a poll
+    interval would, dropping the draw on a share of the matches.
+    """
+
+    def __init__(self, leagues=3, matches=20, bookmakers=5, seed=0, start=None):
+        self.rng = random.Random(seed)
+        self.bookmakers = [f"Bookmaker {k + 1}" for k in range(bookmakers)]
+        self.start = start or datetime.utcnow().replace(microsecond=0) + timedelta(hours=6)
+        self.leagues = []
+        self.fixtures = []
+
+        for n in range(leagues):
+            key, country, name = LEAGUES[n % len(LEAGUES)]
+            if n >= len(LEAGUES):
+                key = f"{key}_{n // len(LEAGUES) + 1}"
+            league = {"key": key, "country": country, "name": name, "pinnacle_id": 1000 + n}
+            self.leagues.append(league)
+            for m in range(matches):
+                home = f"{self.rng.choice(TOWNS)} {n}-{2 * m}"
+                away = f"{self.rng.choice(TOWNS)} {n}-{2 * m + 1}"
+                draw = round(self.rng.uniform(2.9, 3.6), 2)
+                self.fixtures.append({
+                    "league": league,
+                    "id": f"ev{n:03d}{m:04d}",
+                    "number": n * 10000 + m,
+                    "home": home,
+                    "away": away,
+                    # Spread kickoffs so unrelated fixtures never share a resolution window
+                    "kickoff": self.start + timedelta(hours=3 * m, minutes=n),
+                    "prices": {bk: [round(self.rng.uniform(1.6, 4.0), 2), draw, round(self.rng.uniform(1.6, 4.0), 2)]
+                               for bk in self.bookmakers + ["Betfair", "Pinnacle"]},
+                    "line": 2.5,
+                })
+        self.polled_at = datetime.utcnow()
+
+    def advance(self, drop_share=0.1, line_share=0.05):
+        """
+        One poll interval later: every price wanders a little, `drop_share` of
+        the matches see their draw cut by DRAW_DROP and `line_share` move their
+        goal line by a full goal.
+        """
+        for fixture in self.fixtures:
+            for prices in fixture["prices"].values():
+                for i in range(3):
+                    prices[i] = round(max(1.01, prices[i] * self.rng.uniform(0.99, 1.01)), 2)
+            if self.rng.random() < drop_share:
+                for prices in fixture["prices"].values():
+                    prices[1] = round(prices[1] * (1 - DRAW_DROP), 2)
+            if self.rng.random() < line_share:
+                fixture["line"] += 1.0
+        self.polled_at = datetime.utcnow()
+
+    def snapshot_count(self):
+        """
+        Snapshots one full cycle produces: 1X2 + totals per OddsAPI bookmaker,
+        one Betfair 1X2, and Pinnacle 1X2 + one totals line.
+        """
+        return len(self.fixtures) * (2 * len(self.bookmakers) + 1 + 2)
+
+    # OddsAPI
+
+    def oddsapi_league(self, key):
+        events = []
+        for fixture in self.fixtures:
+            if fixture["league"]["key"] != key:
+                continue
+            events.append({
+                "id": fixture["id"],
+                "sport_key": key,
+                "commence_time": fixture["kickoff"].isoformat() + "Z",
+                "home_team": fixture["home"],
+                "away_team": fixture["away"],
+                "teams": [fixture["home"], fixture["away"]],
+                "bookmakers": [{
+                    "key": bk.lower().replace(" ", "_"),
+                    "title": bk,
+                    "last_update": self.polled_at.isoformat() + "Z",
+                    "markets": [
+                        {"key": "h2h", "outcomes": [
+                            {"name": fixture["home"], "price": fixture["prices"][bk][0]},
+                            {"name": fixture["away"], "price": fixture["prices"][bk][2]},
+                            {"name": "Draw", "price": fixture["prices"][bk][1]},
+                        ]},
+                        {"key": "totals", "outcomes": [
+                            {"name": "Over", "price": 1.9, "point": fixture["line"]},
+                            {"name": "Under", "price": 1.9, "point": fixture["line"]},
+                        ]},
+                    ],
+                } for bk in self.bookmakers],
+            })
+        return events
+
+    # Betfair
+
+    def betfair_catalogue(self):
+        catalogue = []
+        for fixture in self.fixtures:
+            home, away = f"{fixture['home']} FC", fixture["away"]
+            catalogue.append({
+                "marketId": f"1.{fixture['number']}",
+                "marketStartTime": fixture["kickoff"].isoformat() + "Z",
+                "event": {
+                    "id": str(fixture["number"]),
+                    "name": f"{home} v {away}",
+                    "countryCode": fixture["league"]["country"],
+                    "openDate": fixture["kickoff"].isoformat() + "Z",
+                },
+                "runners": [
+                    {"selectionId": 3 * fixture["number"] + i, "runnerName": name, "sortPriority": i + 1}
+                    for i, name in enumerate([home, away, "The Draw"])
+                ],
+            })
+        return catalogue
+
+    def betfair_books(self, market_ids):
+        by_market = {f"1.{fixture['number']}": fixture for fixture in self.fixtures}
+        books = []
+        for market_id in market_ids:
+            fixture = by_market.get(market_id)
+            if fixture is None:
+                continue
+            home, draw, away = fixture["prices"]["Betfair"]
+            books.append({
+                "marketId": market_id,
+                "status": "OPEN",
+                "runners": [
+                    {"selectionId": 3 * fixture["number"] + i, "ex": {"availableToBack": [{"price": price, "size": 100.0}]}}
+                    for i, price in enumerate([home, away, draw])
+                ],
+            })
+        return books
+
+    # Pinnacle
+
+    def _pinnacle_fixtures(self, league_ids):
+        return [f for f in self.fixtures if league_ids is None or f["league"]["pinnacle_id"] in league_ids]
+
+    def pinnacle_leagues(self):
+        return [{"id": league["pinnacle_id"], "name": league["name"]} for league in self.leagues]
+
+    def pinnacle_fixtures(self, league_ids=None):
+        leagues = {}
+        for fixture in self._pinnacle_fixtures(league_ids):
+            league = fixture["league"]
+            leagues.setdefault(league["pinnacle_id"], {"id": league["pinnacle_id"], "name": league["name"], "events": []})
+            leagues[league["pinnacle_id"]]["events"].append({
+                "id": fixture["number"],
+                "starts": fixture["kickoff"].isoformat() + "Z",
+                "home": fixture["home"].upper(),
+                "away": fixture["away"].upper(),
+                "status": "O",
+            })
+        return {"sportId": 29, "last": int(self.polled_at.timestamp() * 1000), "league": list(leagues.values())}
+
+    def pinnacle_odds(self, league_ids=None):
+        leagues = {}
+        for fixture in self._pinnacle_fixtures(league_ids):
+            home, draw, away = fixture["prices"]["Pinnacle"]
+            leagues.setdefault(fixture["league"]["pinnacle_id"], {"id": fixture["league"]["pinnacle_id"], "events": []})
+            leagues[fixture["league"]["pinnacle_id"]]["events"].append({
+                "id": fixture["number"],
+                "periods": [{
+                    "number": 0,
+                    "moneyline": {"home": home, "draw": draw, "away": away},
+                    "totals": [{"points": fixture["line"], "over": 1.9, "under": 1.9}],
+                }],
+            })
+        return {"sportId": 29, "last": int(self.polled_at.timestamp() * 1000), "leagues": list(leagues.values())}
@@ -0,0 +1,280 @@
+"""
+Benchmarks for the ingest, analysis and API hot paths on synthetic data.
+
+    python -m bench.run --sizes small,medium --out bench.json
+    python -m bench.run --compare bench.json --tolerance 0.25
+
+Every size runs against a fresh SQLite database with the providers served by
+bench.transport, so the numbers cover our code, not the network. Results are
+JSON; --compare exits non-zero when a stage got slower (or the process
+bigger) than the baseline by more than the tolerance.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Point the app at a scratch database before anything opens the real one
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='odds-bench-')}/bench.db")
+
+from app import create_app
+from app.analyzer.analysis import analyze_matches, engine
+from app.db.session import Base, SessionLocal, engine as db_engine
+from app.db.timeseries import hot_store
+from app.models.alerts import SuspicionAlert
+from app.models.match import Match, registry
+from app.services import betfair_api, odds_api, pinnacle
+from app.services.matching import resolver
+from app.tasks import monitor
+from app.utils.cache import invalidate_responses
+
+from bench.generators import SyntheticFeed
+from bench.transport import stubbed
+
+# name: (leagues, matches per league, bookmakers)
+SIZES = {
+    "small": (2, 10, 5),
+    "medium": (5, 40, 10),
+    "large": (9, 100, 20),
+}
+ROUTE_REQUESTS = 20
+# Stages faster than this are all noise, --compare ignores them
+NOISE_FLOOR = 0.005
+
+
+def max_rss_kib():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def reset_state():
+    """
+    Empty the database and every process-wide cache the monitor keeps between cycles.
+    """
+    Base.metadata.drop_all(db_engine)
+    Base.metadata.create_all(db_engine)
+    registry.clear()
+    with hot_store.lock:
+        hot_store.matches.clear()
+    with engine.lock:
+        engine.states.clear()
+    resolver.reset()
+    monitor.delta_tracker.reset()
+    pinnacle.feed.reset()
+    pinnacle.invalidate_leagues()
+    betfair_api.invalidate_catalogue()
+    invalidate_responses()
+
+
+class Recorder:
+    def __init__(self, size):
+        self.size = size
+        self.results = []
+
+    def add(self, stage, seconds, units=None, unit="rows", **extra):
+        result = {"size": self.size, "stage": stage, "seconds": round(seconds, 6)}
+        if units is not None:
+            result.update(units=units, unit=unit, per_sec=round(units / seconds, 1) if seconds > 0 else None)
+        result.update(extra)
+        self.results.append(result)
+        rate = f", {result['per_sec']:.0f} {unit}/s" if units is not None and result["per_sec"] else ""
+        print(f"[+] {self.size:>6} {stage:<24} {seconds * 1000:9.1f} ms{rate}", file=sys.stderr)
+
+
+def bench_parsing(rec: Recorder, feed: SyntheticFeed):
+    payloads = {league["key"]: feed.oddsapi_league(league["key"]) for league in feed.leagues}
+
+    rows, seconds = timed(lambda: [row for payload in payloads.values() for row in odds_api.build_rows(payload)])
+    rec.add("parse_oddsapi", seconds, sum(len(snapshots) for _, snapshots in rows))
+
+    # fetch_odds_for_league's own path: parse and add through the ORM, one match at a time
+    db = SessionLocal()
+    try:
+        def orm_parse():
+            matches = [m for payload in payloads.values() for m in odds_api.parse_league_payload(payload, db)]
+            db.commit()
+            return matches
+        matches, seconds = timed(orm_parse)
+        rec.add("parse_oddsapi_orm", seconds, len(matches), unit="matches")
+    finally:
+        db.close()
+    reset_state()
+
+    catalogue = feed.betfair_catalogue()
+    books = feed.betfair_books([market["marketId"] for market in catalogue])
+    rows, seconds = timed(lambda: list(betfair_api.build_rows(catalogue, books)))
+    rec.add("parse_betfair", seconds, sum(len(snapshots) for _, snapshots in rows))
+
+    fixtures, odds = feed.pinnacle_fixtures(), feed.pinnacle_odds()
+    rows, seconds = timed(lambda: list(pinnacle.build_rows(fixtures, odds)))
+    rec.add("parse_pinnacle", seconds, sum(len(snapshots) for _, snapshots in rows))
+
+
+def bench_cycle(rec: Recorder, feed: SyntheticFeed, name, league_keys, latency=0.0, pipelined=True, compress=False):
+    """
+    One run_monitoring cycle, timed as a whole and per stage. Pipelined stages
+    overlap, so their times add up to more than the cycle.
+    """
+    with stubbed(feed, latency, compress) as transport:
+        result, seconds = timed(monitor.run_monitoring, league_keys=league_keys, pipelined=pipelined)
+    rec.add(name, seconds, feed.snapshot_count(), matches=result["matches"], alerts=result["alerts"],
+            first_alert_seconds=result["first_alert_seconds"], requests=transport.requests,
+            payload_bytes=transport.bytes)
+    for stage, stage_seconds in result["stages"].items():
+        rec.add(f"{name}.{stage}", stage_seconds)
+
+
+def bench_analysis(rec: Recorder):
+    db = SessionLocal()
+    try:
+        matches = db.query(Match).all()
+        # Cold: detector state and the hot store are rebuilt from the database
+        with hot_store.lock:
+            hot_store.matches.clear()
+        with engine.lock:
+            engine.states.clear()
+        _, seconds = timed(analyze_matches, matches)
+        rec.add("analyze_cold", seconds, len(matches), unit="matches")
+        # Warm: nothing new since the last pass
+        _, seconds = timed(analyze_matches, matches)
+        rec.add("analyze_warm", seconds, len(matches), unit="matches")
+    finally:
+        db.close()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+    }
+
+
+def bench_routes(rec: Recorder):
+    client = create_app().test_client()
+    db = SessionLocal()
+    try:
+        match_ids = [match_id for match_id, in db.query(Match.match_id).limit(ROUTE_REQUESTS)]
+        alerts = db.query(SuspicionAlert).count()
+    finally:
+        db.close()
+
+    routes = {
+        "api_suspicious": ["/api/suspicious?limit=50"] * ROUTE_REQUESTS,
+        "api_match": [f"/api/match/{match_id}" for match_id in match_ids],
+    }
+    for name, paths in routes.items():
+        if not paths:
+            continue
+        for cached in (False, True):
+            if cached:
+                for path in paths:
+                    client.get(path)
+            samples = []
+            for path in paths:
+                if not cached:
+                    invalidate_responses()
+                started = time.perf_counter()
+                response = client.get(path)
+                samples.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} returned {response.status_code}")
+            stage = f"{name}_cached" if cached else name
+            rec.add(stage, statistics.median(samples), **percentiles(samples), requests=len(samples), alerts=alerts)
+
+
+def run_size(size, latency=0.0, compress=False):
+    leagues, matches, bookmakers = SIZES[size]
+    rec = Recorder(size)
+    feed = SyntheticFeed(leagues=leagues, matches=matches, bookmakers=bookmakers, seed=leagues * matches)
+    league_keys = [league["key"] for league in feed.leagues]
+
+    reset_state()
+    bench_parsing(rec, feed)
+    bench_cycle(rec, feed, "cycle_cold", league_keys, latency, compress=compress)
+    feed.advance()
+    bench_cycle(rec, feed, "cycle_warm", league_keys, latency, compress=compress)
+    feed.advance()
+    bench_cycle(rec, feed, "cycle_warm_sequential", league_keys, latency, pipelined=False, compress=compress)
+    bench_analysis(rec)
+    bench_routes(rec)
+
+    memory = hot_store.memory_report()
+    rec.add("memory", 0.0, max_rss_kib=max_rss_kib(), hot_store_kib=round(sum(m["bytes"] for m in memory.values()) / 1024, 1),
+            hot_store_points=sum(m["points"] for m in memory.values()))
+    return rec.results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Stages of `results` that regressed against `baseline`, as printable lines.
+    """
+    previous = {(r["size"], r["stage"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["size"], result["stage"]))
+        if before is None:
+            continue
+        name = f"{result['size']}/{result['stage']}"
+        if result["seconds"] > max(before["seconds"] * (1 + tolerance), before["seconds"] + NOISE_FLOOR):
+            regressions.append(f"{name}: {before['seconds'] * 1000:.1f} ms -> {result['seconds'] * 1000:.1f} ms")
+        if "max_rss_kib" in result and result["max_rss_kib"] > before["max_rss_kib"] * (1 + tolerance):
+            regressions.append(f"{name}: rss {before['max_rss_kib']} KiB -> {result['max_rss_kib']} KiB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest, analysis and API hot paths")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the stub transport waits per request")
+    parser.add_argument("--gzip", action="store_true", help="serve gzip-encoded payloads")
+    parser.add_argument("--out", help="write results here instead of stdout")
+    parser.add_argument("--compare", help="baseline results to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown as a fraction")
+    args = parser.parse_args()
+
+    results = []
+    # The monitor logs to stdout, keep it free for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        for size in args.sizes.split(","):
+            results += run_size(size, args.latency, args.gzip)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": {size: SIZES[size] for size in args.sizes.split(",")},
+            "latency": args.latency,
+            "gzip": args.gzip,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[✔] Results written to {args.out}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[!] Regression {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("[✔] No regressions against the baseline", file=sys.stderr)
@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+# Point the app at a scratch database before anything opens the real one
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='odds-test-')}/test.db")
+
+import pytest
+
+from app.analyzer.analysis import engine
+from app.db.session import Base, SessionLocal, engine as db_engine
+from app.db.timeseries import hot_store
+from app.models import alerts, odds  # noqa: F401 (registers the tables)
+from app.models.match import registry
+from app.services.matching import resolver
+from app.utils.cache import invalidate_responses
+
+
+@pytest.fixture
+def db():
+    """
+    A session on an empty database, with every process-wide cache emptied.
+    """
+    Base.metadata.drop_all(db_engine)
+    Base.metadata.create_all(db_engine)
+    registry.clear()
+    with hot_store.lock:
+        hot_store.matches.clear()
+    with engine.lock:
+        engine.states.clear()
+    resolver.reset()
+    invalidate_responses()
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
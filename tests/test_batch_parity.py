@@ -0,0 +1,70 @@
+import random
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.analyzer.analysis import analyze_matches
+from app.analyzer.batch import analyze_matches_batch, arrays_from_matches
+from app.models.match import Match
+from app.models.odds import OddsSnapshot
+
+BOOKMAKERS = ["Pinnacle", "Betfair", "bet365", "Unibet"]
+# Coarse grids so repeated prices, unchanged lines and drops of exactly 20%
+# (3.125 -> 2.5) come up often
+DRAW_PRICES = [2.5, 3.0, 3.1, 3.125, 3.125, 3.2, float("nan")]
+TOTAL_LINES = [2.0, 2.5, 2.5, 2.5, 3.0, 3.5, float("nan")]
+# Over/under prices, so the lines of one poll tie on balance too
+SIDE_PRICES = [1.8, 1.9, 1.9, 2.0, float("nan")]
+
+
+def random_history(rng, match_id, start):
+    """
+    Snapshots for every (bookmaker, market) of one match. Timestamps come from
+    a shared 5-minute grid, so series tie with each other, and a poll may
+    carry several rows of one series, like Pinnacle's alternative totals.
+    Some prices are missing (NaN, stored as NULL).
+    """
+    snapshots = []
+    for bookmaker in rng.sample(BOOKMAKERS, rng.randint(1, len(BOOKMAKERS))):
+        for market in ("1X2", "Over/Under"):
+            steps = sorted(rng.sample(range(36), rng.randint(0, 6)))
+            for step in steps:
+                timestamp = start + timedelta(minutes=5 * step)
+                for _ in range(rng.choice([1, 1, 2, 3])):
+                    snapshot = OddsSnapshot(id=str(uuid4()), match_id=match_id, timestamp=timestamp,
+                                            last_seen=timestamp, bookmaker=bookmaker, market=market)
+                    if market == "1X2":
+                        snapshot.home, snapshot.draw, snapshot.away = 2.1, rng.choice(DRAW_PRICES), 3.6
+                    else:
+                        snapshot.total_line = rng.choice(TOTAL_LINES)
+                        snapshot.over, snapshot.under = rng.choice(SIDE_PRICES), rng.choice(SIDE_PRICES)
+                    snapshots.append(snapshot)
+    rng.shuffle(snapshots)
+    return snapshots
+
+
+def summary(alerts):
+    return sorted(
+        (alert.match_id, alert.suspicious_draw, alert.goal_line_shift, tuple(alert.alert_sources))
+        for alert in alerts
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_matches_scalar_analyzer(db, seed):
+    rng = random.Random(seed)
+    start = datetime(2026, 3, 1, 12, 0)
+    matches = []
+    for i in range(40):
+        match = Match(match_id=f"m{seed}-{i}", home_team=f"Home {i}", away_team=f"Away {i}",
+                      league="soccer_epl", commence_time=start + timedelta(hours=4), source="odds_api")
+        db.add(match)
+        db.add_all(random_history(rng, match.match_id, start))
+        matches.append(match)
+    db.commit()
+
+    scalar = summary(analyze_matches(matches))
+    assert scalar, "the random histories should flag some matches"
+    assert summary(analyze_matches_batch(matches)) == scalar
+    assert summary(analyze_matches_batch(matches, arrays_from_matches(matches))) == scalar
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from app import create_app
+from app.routes import alerts as alerts_routes
+from app.db.session import SessionLocal
+from app.db.timeseries import hot_store
+from app.models.match import Match
+from app.models.odds import OddsSnapshot
+from app.utils.cache import invalidate_responses
+
+
+def snapshot(match_id, timestamp, draw, bookmaker="Pinnacle"):
+    return OddsSnapshot(id=str(uuid4()), match_id=match_id, timestamp=timestamp, last_seen=timestamp,
+                        bookmaker=bookmaker, market="1X2", home=2.5, draw=draw, away=3.0)
+
+
+def test_match_detail_shows_rows_written_by_another_process(db):
+    now = datetime.utcnow()
+    db.add(Match(match_id="m1", home_team="Home", away_team="Away", league="soccer_brazil_serieb",
+                 commence_time=now + timedelta(hours=2), source="pinnacle"))
+    db.add(snapshot("m1", now - timedelta(minutes=20), 3.4))
+    db.commit()
+
+    client = create_app().test_client()
+    body = client.get("/api/match/m1").get_json()
+    assert body["timeline_source"] == "memory"
+    assert [s["draw"] for s in body["snapshots"]] == [3.4]
+    assert body["analysis"] is None
+    assert "m1" in hot_store
+
+    # The monitor runs elsewhere: its rows reach the DB, never this process's hot store
+    writer = SessionLocal()
+    try:
+        writer.add(snapshot("m1", now - timedelta(minutes=5), 2.5))
+        first = writer.query(OddsSnapshot).filter_by(draw=3.4).one()
+        first.last_seen = now - timedelta(minutes=10)
+        writer.commit()
+    finally:
+        writer.close()
+    invalidate_responses()
+
+    body = client.get("/api/match/m1").get_json()
+    assert body["timeline_source"] == "memory"
+    assert [s["draw"] for s in body["snapshots"]] == [3.4, 2.5]
+    assert body["snapshots"][0]["last_seen"] == (now - timedelta(minutes=10)).isoformat()
+    # The 26% draw drop is analysed too, not only shown
+    assert body["analysis"]["suspicious_draw"] is True
+
+
+def test_match_detail_etag_survives_recompute(db, monkeypatch):
+    now = datetime.utcnow().replace(second=10)
+    db.add(Match(match_id="m1", home_team="Home", away_team="Away", league="soccer_brazil_serieb",
+                 commence_time=now + timedelta(hours=2), source="pinnacle"))
+    db.add(snapshot("m1", now - timedelta(minutes=20), 3.4))
+    db.commit()
+
+    class Clock(datetime):
+        ticks = iter([now, now + timedelta(seconds=20, microseconds=1234)])
+
+        @classmethod
+        def utcnow(cls):
+            return next(cls.ticks)
+
+    monkeypatch.setattr(alerts_routes, "datetime", Clock)
+    client = create_app().test_client()
+    first = client.get("/api/match/m1")
+    # Nothing changed, so the recomputed body keeps the ETag and the client gets a 304
+    invalidate_responses()
+    second = client.get("/api/match/m1", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+
+
+def totals(match_id, timestamp, line, over, under):
+    return OddsSnapshot(id=str(uuid4()), match_id=match_id, timestamp=timestamp, last_seen=timestamp,
+                        bookmaker="Pinnacle", market="Over/Under", total_line=line, over=over, under=under)
+
+
+def test_refresh_pulls_every_line_of_a_poll_written_elsewhere(db):
+    now = datetime.utcnow()
+    db.add(Match(match_id="m1", home_team="Home", away_team="Away", league="soccer_brazil_serieb",
+                 commence_time=now + timedelta(hours=2), source="pinnacle"))
+    db.add(totals("m1", now - timedelta(minutes=20), 2.5, 1.9, 1.9))
+    db.commit()
+    hot_store.load(db, "m1")
+
+    # Another process stores one Pinnacle poll with three totals lines
+    polled = now - timedelta(minutes=5)
+    writer = SessionLocal()
+    try:
+        writer.add_all([totals("m1", polled, 2.5, 1.95, 1.85), totals("m1", polled, 3.5, 2.7, 1.45),
+                        totals("m1", polled, 1.5, 1.3, 3.3)])
+        writer.commit()
+    finally:
+        writer.close()
+
+    for _ in range(2):  # a second refresh must not add them again
+        lines = sorted(point.total_line for point in hot_store.snapshots("m1", db=db) if point.timestamp == polled)
+        assert lines == [1.5, 2.5, 3.5]
+        assert hot_store.memory("m1")["points"] == 4
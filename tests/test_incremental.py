@@ -0,0 +1,97 @@
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.analyzer.analysis import analyze_matches
+from app.analyzer.backtest import BacktestParams, History, replay
+from app.analyzer.incremental import DetectorEngine
+from app.db.bulk import MatchRow, SnapshotBatch, SnapshotRow, write_batch
+from app.models.match import Match
+from app.models.odds import OddsSnapshot
+
+Snap = namedtuple("Snap", ["timestamp", "bookmaker", "market", "draw", "total_line"])
+
+
+def snapshot(match_id, timestamp, bookmaker, draw):
+    return SnapshotRow(id=str(uuid4()), match_id=match_id, timestamp=timestamp, bookmaker=bookmaker, market="1X2",
+                       home=2.5, draw=draw, away=3.0, total_line=None, over=None, under=None, last_seen=None)
+
+
+def test_streamed_prices_do_not_hide_polled_snapshots():
+    engine = DetectorEngine(draw_threshold=0.2, window=timedelta(minutes=30))
+    start = datetime(2026, 1, 1, 12, 0)
+    engine.ingest("m1", [Snap(start, "Pinnacle", "1X2", 3.4, None)])
+
+    # The exchange stream runs ahead of the pollers
+    engine.update("m1", "Betfair", "1X2", start + timedelta(minutes=10), draw=3.3)
+
+    polled = [
+        Snap(start + timedelta(minutes=5), "Pinnacle", "1X2", 2.5, None),
+        Snap(start + timedelta(minutes=5), "Pinnacle", "Over/Under", None, 2.5),
+        Snap(start + timedelta(minutes=8), "Pinnacle", "Over/Under", None, 3.5),
+    ]
+    assert engine.ingest("m1", polled) == 3
+    assert engine.evaluate("m1") == (True, True, ["pinnacle"])
+
+    # The streamed price, once stored and read back, is not folded in twice
+    assert engine.ingest("m1", [Snap(start + timedelta(minutes=10), "Betfair", "1X2", 3.3, None)]) == 0
+
+
+Row = namedtuple("Row", ["timestamp", "bookmaker", "market", "draw", "total_line", "over", "under"])
+
+
+def totals_polls(start, second_main):
+    """
+    Two Pinnacle polls carrying alternative lines; the second poll's most
+    balanced line is `second_main`.
+    """
+    later = start + timedelta(minutes=10)
+    prices = {2.5: (2.2, 1.7), 3.5: (2.9, 1.4)}
+    prices[second_main] = (1.9, 1.9)
+    return [
+        Row(start, "Pinnacle", "Over/Under", None, 2.5, 1.95, 1.9),
+        Row(start, "Pinnacle", "Over/Under", None, 3.5, 2.8, 1.45),
+        Row(start, "Pinnacle", "Over/Under", None, 1.5, 1.3, 3.4),
+        *(Row(later, "Pinnacle", "Over/Under", None, line, *prices[line]) for line in (2.5, 3.5)),
+    ]
+
+
+@pytest.mark.parametrize("second_main, shifted", [(2.5, False), (3.5, True)])
+def test_totals_follow_the_main_line_whatever_the_row_order(second_main, shifted):
+    rows = totals_polls(datetime(2026, 1, 1, 12, 0), second_main)
+    for seed in range(10):
+        random.Random(seed).shuffle(rows)
+        engine = DetectorEngine(line_threshold=1.0)
+        engine.ingest("m1", rows)
+        assert engine.evaluate("m1")[1] is shifted
+
+        # The backtest replays stored rows by the same rule
+        history = History.from_rows(
+            [("m1", row.bookmaker, row.market, row.timestamp, row.draw, row.total_line, row.over, row.under)
+             for row in rows],
+            {},
+        )
+        result = replay(history, BacktestParams(0.2, 1.0, timedelta(minutes=30)))
+        assert result["goal_line_alerts"] == int(shifted)
+
+
+def test_batches_written_out_of_timestamp_order_are_analysed(db):
+    now = datetime.utcnow()
+    match_row = MatchRow("m1", "Home", "Away", "soccer_brazil_serieb", now + timedelta(hours=2), "oddsapi")
+
+    def write(*rows):
+        batch = SnapshotBatch()
+        batch.add(match_row, list(rows))
+        write_batch(db, batch)
+        return analyze_matches(db.query(Match).all())
+
+    assert write(snapshot("m1", now - timedelta(minutes=5), "bet365", 3.2)) == []
+    # Pinnacle's polls were parsed earlier but reach storage in a later batch, with their own timestamps
+    alerts = write(snapshot("m1", now - timedelta(minutes=15), "Pinnacle", 3.4),
+                   snapshot("m1", now - timedelta(minutes=10), "Pinnacle", 2.6))
+    assert [alert.alert_sources for alert in alerts] == [["pinnacle"]]
+    stored = db.query(OddsSnapshot).filter_by(bookmaker="Pinnacle").order_by(OddsSnapshot.timestamp).all()
+    assert [row.timestamp for row in stored] == [now - timedelta(minutes=15), now - timedelta(minutes=10)]
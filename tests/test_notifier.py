@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from app.services import notifier
+from app.services.notifier import AlertMessage, TelegramChannel, TELEGRAM_MAX_MESSAGE_LENGTH
+from app.utils.ratelimit import TokenBucket
+
+
+def alert(i):
+    return AlertMessage(match_id=f"m{i}", league="soccer_brazil_serieb", home_team=f"Home Team {i}",
+                        away_team=f"Away Team {i}", commence_time=datetime(2026, 3, 1, 18, 0),
+                        suspicious_draw=True, goal_line_shift=i % 2 == 0,
+                        alert_sources=["pinnacle", "betfair_ex_eu"])
+
+
+def test_large_burst_goes_out_as_several_telegram_messages(monkeypatch):
+    sent = []
+    monkeypatch.setattr(notifier, "_post_telegram", sent.append)
+    channel = TelegramChannel()
+    channel.bucket = TokenBucket(rate=1000, capacity=1000)
+
+    alerts = [alert(i) for i in range(300)]
+    channel.send_batch(alerts)
+
+    assert len(sent) > 1
+    assert all(len(text.encode("utf-16-le")) // 2 <= TELEGRAM_MAX_MESSAGE_LENGTH for text in sent)
+    # Split at line boundaries: every match is listed once, whole
+    lines = "\n".join(sent).split("\n")
+    assert lines[0] == "🚨 300 Suspicious Matches Detected"
+    assert [line.split(" vs ")[0] for line in lines[1:]] == [f"⚽ Home Team {i}" for i in range(300)]
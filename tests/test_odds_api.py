@@ -0,0 +1,22 @@
+from app.analyzer.incremental import source_for
+from app.services.odds_api import build_rows
+
+
+def bookmaker(title, draw):
+    return {"title": title, "markets": [{"key": "h2h", "outcomes": [
+        {"name": "Home", "price": 2.1}, {"name": "Draw", "price": draw}, {"name": "Away", "price": 3.5},
+    ]}]}
+
+
+def test_direct_feed_bookmakers_are_kept_apart():
+    payload = [{
+        "id": "e1", "sport_key": "soccer_brazil_serieb", "commence_time": "2026-03-01T18:00:00Z",
+        "home_team": "Home", "teams": ["Home", "Away"],
+        "bookmakers": [bookmaker("Pinnacle", 3.3), bookmaker("Betfair", 3.4), bookmaker("Unibet", 3.2)],
+    }]
+    [(match_row, snapshot_rows)] = build_rows(payload)
+
+    names = [row.bookmaker for row in snapshot_rows]
+    assert names == ["OddsAPI Pinnacle", "OddsAPI Betfair", "Unibet"]
+    # The Pinnacle and Betfair names stay with the direct feeds
+    assert {source_for(name) for name in names} == {"odds_api"}
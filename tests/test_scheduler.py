@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from app.models.match import Match, registry
+from app.tasks.scheduler import PollTarget, poll_interval
+
+
+def match(match_id, league, kickoff):
+    return Match(match_id=match_id, home_team=f"{match_id} Home", away_team=f"{match_id} Away",
+                 league=league, commence_time=kickoff, source="odds_api")
+
+
+def test_league_interval_follows_that_leagues_next_kickoff(db):
+    now = datetime(2026, 3, 1, 12, 0)
+    db.add_all([
+        match("epl", "soccer_epl", now + timedelta(minutes=20)),
+        match("serieb", "soccer_brazil_serieb", now + timedelta(hours=5)),
+        match("old", "soccer_brazil_serieb", now - timedelta(hours=3)),  # past the in-play window
+    ])
+    db.commit()
+    registry.warm(db, now=now)
+
+    assert poll_interval(db, PollTarget("oddsapi", "soccer_epl"), now) == timedelta(minutes=2)
+    assert poll_interval(db, PollTarget("oddsapi", "soccer_brazil_serieb"), now) == timedelta(minutes=15)
+    assert poll_interval(db, PollTarget("oddsapi", "soccer_spain_la_liga"), now) == timedelta(hours=3)
+
+
+def test_league_index_follows_moves_and_removals(db):
+    kickoff = datetime(2026, 3, 1, 18, 0)
+    registry.put(match("m1", "soccer_epl", kickoff))
+    registry.put(match("m2", "soccer_epl", kickoff))
+    registry.put(match("m1", "soccer_efl_champ", kickoff))
+    registry.remove("m2")
+
+    assert [m.match_id for m in registry.by_league("soccer_efl_champ")] == ["m1"]
+    assert registry.by_league("soccer_epl") == []
+    assert "soccer_epl" not in registry.leagues